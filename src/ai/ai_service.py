@@ -205,9 +205,18 @@ class ClaudeService(BaseAIService):
                 "anthropic-version": "2023-06-01"
             }
             
+            # 调用方给出静态前缀时拆成两个文本块，前缀标记 cache_control 以命中提示词缓存
+            content = prompt
+            cache_prefix = kwargs.get('cache_prefix')
+            if cache_prefix and prompt.startswith(cache_prefix) and len(prompt) > len(cache_prefix):
+                content = [
+                    {"type": "text", "text": cache_prefix, "cache_control": {"type": "ephemeral"}},
+                    {"type": "text", "text": prompt[len(cache_prefix):]}
+                ]
+
             data = {
                 "model": model,
-                "messages": [{"role": "user", "content": prompt}],
+                "messages": [{"role": "user", "content": content}],
                 "max_tokens": kwargs.get('max_tokens', 2000),
                 "temperature": kwargs.get('temperature', 0.7)
             }
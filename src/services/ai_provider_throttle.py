@@ -24,6 +24,8 @@ _suspended_until = {}
 
 MAX_CONSECUTIVE_FAILURES = 3
 SUSPEND_SECONDS = 10 * 60  # 10分钟
+# 手动恢复时发布服务商名称，暂停中的 Worker 订阅该频道即可立即恢复而无需轮询
+RESUME_CHANNEL = "ai:provider:resume"
 
 
 def _now() -> int:
@@ -56,6 +58,59 @@ def is_suspended(provider_name: str) -> bool:
     return False
 
 
+def suspended_remaining(provider_name: str) -> int:
+    """获取暂停剩余秒数（未暂停返回0）"""
+    if not provider_name:
+        return 0
+    try:
+        if get_redis_client:
+            rc = get_redis_client()
+            if rc and rc.is_connected():
+                ttl = rc.client.ttl(f"ai:provider:suspend:{provider_name}")
+                return max(int(ttl or 0), 0)
+    except Exception:
+        pass
+    return max((_suspended_until.get(provider_name) or 0) - _now(), 0)
+
+
+def wait_for_resume(provider_name: str, timeout: float) -> bool:
+    """阻塞等待服务商恢复，最多 timeout 秒
+
+    订阅 RESUME_CHANNEL，收到该服务商的恢复通知时立即返回；
+    Redis 不可用时退化为休眠。暂停键自然过期不会发布通知，调用方应把 timeout 设为不超过剩余暂停时间。
+
+    Returns:
+        是否收到恢复通知
+    """
+    if timeout <= 0:
+        return False
+    pubsub = None
+    try:
+        rc = get_redis_client() if get_redis_client else None
+        pubsub = rc.subscribe(RESUME_CHANNEL) if rc else None
+        if pubsub is None:
+            time.sleep(timeout)
+            return False
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message and message.get('data') == provider_name:
+                return True
+    except Exception as e:
+        logger.debug(f"等待服务商恢复通知失败 {provider_name}: {e}")
+        time.sleep(max(timeout, 0))
+        return False
+    finally:
+        if pubsub is not None:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+
 def get_failure_count(provider_name: str) -> int:
     """获取当前连续失败次数"""
     if not provider_name:
@@ -157,6 +212,8 @@ def clear_suspension(provider_name: str) -> None:
             if rc and rc.is_connected():
                 key = f"ai:provider:suspend:{provider_name}"
                 rc.delete(key)
+                # 通知暂停中的 Worker 立即恢复
+                rc.client.publish(RESUME_CHANNEL, provider_name)
     except Exception:
         pass
     _suspended_until.pop(provider_name, None)
@@ -745,6 +745,7 @@ class DatabaseService:
             session.add(provider)
             session.commit()
             session.refresh(provider)
+            self._notify_providers_changed()
             return provider
     
     def get_ai_provider_by_id(self, provider_id: int) -> Optional[AIProvider]:
@@ -782,6 +783,7 @@ class DatabaseService:
                 session.commit()
                 session.refresh(provider)
                 logger.info(f"服务商更新完成 - 新API密钥: {provider.api_key[:10] + '...' if provider.api_key else 'None'}")
+                self._notify_providers_changed()
                 return provider
             else:
                 logger.error(f"未找到ID为 {provider_id} 的AI服务商")
@@ -816,7 +818,17 @@ class DatabaseService:
             # 如果没有任何引用，才删除AI服务商
             session.delete(provider)
             session.commit()
+            self._notify_providers_changed()
             return True
+
+    @staticmethod
+    def _notify_providers_changed():
+        """通知知识图谱 Worker 守护线程服务商已变更（立即补齐/停止对应 Worker），失败不影响数据库操作"""
+        try:
+            from .kg_task_worker import notify_providers_changed
+            notify_providers_changed()
+        except Exception as e:
+            logger.warning(f"发送服务商变更通知失败: {e}")
     
     # Workflow operations
     def get_workflow_by_id(self, workflow_id: int) -> Optional[Workflow]:
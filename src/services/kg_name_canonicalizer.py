@@ -0,0 +1,160 @@
+"""
+知识图谱人物名称归一化
+
+同一人物在不同章节常以不同称呼出现（如“王小明”“小明”“王小明师兄”），
+原先只能依赖 Neo4j MERGE 按名称去重，导致同一人物生成多个节点。
+本模块在提取阶段按任务维护已知人物名称，将别称映射到规范名称：
+- 规范名称前后带常见称谓（师兄、大师、公子等）时去掉称谓后映射；
+- 两字名称与唯一一个已知三字名称的名字部分相同时映射（省略姓氏的称呼）。该规则误合并的风险较高
+  （合并后的 Neo4j 节点无法再拆分），需设置 KG_NAME_GIVEN_NAME_MATCH=true 才启用。
+安装 pyahocorasick 时用 Aho-Corasick 自动机一次扫描匹配名称中包含的所有规范名称；
+未安装时退化为按称谓前后缀剥离后查表，效果相同但不识别称谓夹在中间的写法。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import ahocorasick  # type: ignore
+except ImportError:
+    ahocorasick = None
+
+# 设置 KG_NAME_CANONICALIZE=false 关闭名称归一化
+CANONICALIZE_ENABLED = os.environ.get('KG_NAME_CANONICALIZE', 'true').strip().lower() not in ('0', 'false', 'no')
+# 设置 KG_NAME_GIVEN_NAME_MATCH=true 启用“两字名称映射到同名字的三字名称”规则（默认关闭）
+GIVEN_NAME_MATCH_ENABLED = os.environ.get('KG_NAME_GIVEN_NAME_MATCH', 'false').strip().lower() in ('1', 'true', 'yes')
+
+# 可出现在人名前后的称谓
+NAME_TITLES = (
+    '师父', '师傅', '师兄', '师姐', '师弟', '师妹', '师叔', '师伯', '师尊',
+    '大师', '先生', '小姐', '公子', '少爷', '姑娘', '前辈', '道友', '大哥', '大姐',
+)
+MIN_NAME_LENGTH = 2
+
+
+class NameCanonicalizer:
+    """单个任务内的人物名称归一化器（线程安全）"""
+
+    def __init__(self, known_names: Iterable[str] = ()):
+        self._lock = threading.Lock()
+        self._canonical: set = set()
+        self._aliases: Dict[str, str] = {}
+        # 名字部分（三字名称去掉姓氏） -> 规范名称；出现歧义时置为 None
+        self._given_names: Dict[str, Optional[str]] = {}
+        self._automaton = None
+        self._automaton_dirty = False
+        for name in known_names:
+            self._add_canonical(name)
+
+    def _add_canonical(self, name: str):
+        if not name or len(name) < MIN_NAME_LENGTH or name in self._canonical:
+            return
+        self._canonical.add(name)
+        self._automaton_dirty = True
+        if len(name) == 3:
+            given = name[1:]
+            self._given_names[given] = None if given in self._given_names else name
+
+    def _get_automaton(self):
+        """规范名称集合变化后重建自动机"""
+        if ahocorasick is None:
+            return None
+        if self._automaton is None or self._automaton_dirty:
+            automaton = ahocorasick.Automaton()
+            for name in self._canonical:
+                automaton.add_word(name, name)
+            if self._canonical:
+                automaton.make_automaton()
+            self._automaton = automaton
+            self._automaton_dirty = False
+        return self._automaton
+
+    @staticmethod
+    def _is_titles(text: str) -> bool:
+        """text 是否完全由称谓组成"""
+        while text:
+            for title in NAME_TITLES:
+                if text.startswith(title):
+                    text = text[len(title):]
+                    break
+            else:
+                return False
+        return True
+
+    def _match(self, name: str) -> Optional[str]:
+        """查找 name 对应的规范名称，无匹配返回 None"""
+        if name in self._canonical:
+            return name
+        alias = self._aliases.get(name)
+        if alias:
+            return alias
+
+        candidates = set()
+        automaton = self._get_automaton()
+        if automaton is not None and self._canonical:
+            for end, canonical in automaton.iter(name):
+                start = end - len(canonical) + 1
+                if self._is_titles(name[:start]) and self._is_titles(name[end + 1:]):
+                    candidates.add(canonical)
+        else:
+            for title in NAME_TITLES:
+                if name.startswith(title) and name[len(title):] in self._canonical:
+                    candidates.add(name[len(title):])
+                if name.endswith(title) and name[:-len(title)] in self._canonical:
+                    candidates.add(name[:-len(title)])
+        if len(candidates) == 1:
+            return candidates.pop()
+
+        if GIVEN_NAME_MATCH_ENABLED and len(name) == MIN_NAME_LENGTH:
+            return self._given_names.get(name)
+        return None
+
+    def canonicalize(self, name: str) -> str:
+        """返回规范名称；未知名称作为新的规范名称登记"""
+        if not name:
+            return name
+        with self._lock:
+            canonical = self._match(name)
+            if canonical is None:
+                self._add_canonical(name)
+                return name
+            if canonical != name:
+                self._aliases[name] = canonical
+            return canonical
+
+    def lookup(self, name: str) -> str:
+        """返回已登记的规范名称（不登记新名称）"""
+        if not name:
+            return name
+        with self._lock:
+            return self._match(name) or name
+
+    def apply(self, entities: List, relations: List) -> Tuple[List, List]:
+        """归一化一章的人物实体与关系端点名称，别称记录在 properties['aliases']"""
+        renamed: Dict[str, str] = {}
+        # 先登记较长的名称，使同章节内“王小明”先于“小明”成为规范名称
+        characters = sorted((e for e in entities if e.entity_type == 'character'),
+                            key=lambda e: len(e.name or ''), reverse=True)
+        for entity in characters:
+            canonical = self.canonicalize(entity.name)
+            if canonical != entity.name:
+                renamed[entity.name] = canonical
+                aliases = entity.properties.setdefault('aliases', [])
+                if entity.name not in aliases:
+                    aliases.append(entity.name)
+                entity.name = canonical
+        if renamed:
+            logger.debug(f"人物名称归一化: {renamed}")
+
+        for relation in relations:
+            # 人物关系两端以及参与事件的人物均按名称匹配 Character 节点
+            if relation.relation_type != 'OCCURS_IN':
+                relation.from_entity = self.lookup(relation.from_entity)
+            if relation.relation_type not in ('PARTICIPATES_IN', 'OCCURS_IN'):
+                relation.to_entity = self.lookup(relation.to_entity)
+        return entities, relations
@@ -0,0 +1,71 @@
+"""
+知识图谱提取 AI 响应缓存
+
+按 (模型, 提示词类型, 完整提示词) 的内容哈希缓存解析后的 AI 响应：
+- 重跑任务或不同任务处理同一章节时直接复用，不再重复调用 LLM。
+- 提示词包含模板与章节内容，模板或章节变化后哈希自然不同，无需手动失效。
+- 只缓存转换出至少一个实体或关系的响应，空结果仍按失败处理、重跑时重新调用。
+- 存储在 Redis；Redis 不可用时不缓存，不影响提取流程。
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from src.utils.redis_client import get_redis_client  # type: ignore
+except Exception:
+    get_redis_client = None
+
+# v2：只缓存转换出有效实体/关系的响应；旧前缀下可能存有空结果，换前缀使其失效
+CACHE_KEY_PREFIX = "kg:ai_response:v2:"
+# 默认缓存 30 天；设置 KG_RESPONSE_CACHE=false 关闭
+CACHE_TTL_SECONDS = int(os.environ.get('KG_RESPONSE_CACHE_TTL', str(30 * 24 * 60 * 60)))
+CACHE_ENABLED = os.environ.get('KG_RESPONSE_CACHE', 'true').strip().lower() not in ('0', 'false', 'no')
+
+
+class KGResponseCache:
+    """AI 提取响应缓存（按提示词类型分区）"""
+
+    def __init__(self, ttl: int = CACHE_TTL_SECONDS, enabled: bool = CACHE_ENABLED):
+        self.ttl = ttl
+        self.enabled = enabled
+
+    @staticmethod
+    def make_key(kind: str, model_name: Optional[str], prompt: str) -> str:
+        """生成缓存键：kg:ai_response:v2:{kind}:{sha256}"""
+        digest = hashlib.sha256(f"{model_name or ''}|{prompt}".encode('utf-8')).hexdigest()
+        return f"{CACHE_KEY_PREFIX}{kind}:{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的解析结果，未命中或 Redis 不可用时返回 None"""
+        if not self.enabled or not get_redis_client:
+            return None
+        try:
+            rc = get_redis_client()
+            if rc:
+                value = rc.get(key)
+                return value if isinstance(value, dict) else None
+        except Exception as e:
+            logger.debug(f"读取AI响应缓存失败 {key}: {e}")
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> bool:
+        """写入解析后的响应"""
+        if not self.enabled or not get_redis_client or not isinstance(value, dict):
+            return False
+        try:
+            rc = get_redis_client()
+            if rc:
+                return rc.set(key, value, expire=self.ttl)
+        except Exception as e:
+            logger.debug(f"写入AI响应缓存失败 {key}: {e}")
+        return False
+
+
+# 模块级单例
+kg_response_cache = KGResponseCache()
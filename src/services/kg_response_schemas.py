@@ -0,0 +1,102 @@
+"""
+知识图谱提取 AI 响应的 JSON Schema 校验
+
+AI 返回的 JSON 字段缺失或类型错误时（如实体缺少 name），转换阶段会整体失败或产生空实体。
+安装 fastjsonschema 时将各提示词输出的 Schema 编译为 Python 函数，在本地以极低开销校验，
+不合格的响应由调用方要求 AI 修正一次；未安装时不做校验，行为与之前一致。
+Schema 只约束转换阶段依赖的字段，其余字段保持宽松。
+"""
+from __future__ import annotations
+
+import logging
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fastjsonschema  # type: ignore
+except ImportError:
+    fastjsonschema = None
+
+
+def _named_items(*required: str) -> Dict[str, Any]:
+    """对象数组：每项必须包含给定的非空字符串字段"""
+    return {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'required': list(required),
+            'properties': {key: {'type': 'string', 'minLength': 1} for key in required},
+        },
+    }
+
+
+ENTITIES_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'characters': _named_items('name'),
+        'locations': _named_items('name'),
+        'organizations': _named_items('name'),
+        'events': _named_items('name'),
+    },
+}
+
+RELATIONSHIPS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'character_relationships': _named_items('from', 'to', 'relation'),
+        'event_relationships': _named_items('character', 'event'),
+        'location_relationships': _named_items('event', 'location'),
+    },
+}
+
+PROTAGONIST_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'protagonist_candidates': _named_items('name'),
+    },
+}
+
+COMBINED_SCHEMA = {
+    'type': 'object',
+    'required': ['entities', 'relationships'],
+    'properties': {
+        'entities': ENTITIES_SCHEMA,
+        'relationships': RELATIONSHIPS_SCHEMA,
+        'protagonist': PROTAGONIST_SCHEMA,
+    },
+}
+
+# 提示词类型 -> 输出 Schema
+RESPONSE_SCHEMAS = {
+    'entities': ENTITIES_SCHEMA,
+    'relationships': RELATIONSHIPS_SCHEMA,
+    'protagonist_analysis': PROTAGONIST_SCHEMA,
+    'combined': COMBINED_SCHEMA,
+}
+
+
+@lru_cache(maxsize=None)
+def _get_validator(kind: str) -> Optional[Callable]:
+    """按提示词类型编译校验函数（每个进程只编译一次）"""
+    schema = RESPONSE_SCHEMAS.get(kind)
+    if fastjsonschema is None or schema is None:
+        return None
+    try:
+        return fastjsonschema.compile(schema)
+    except Exception as e:
+        logger.warning(f"编译响应Schema失败，跳过校验: kind={kind}, 错误: {e}")
+        return None
+
+
+def validation_error(kind: str, data: Any) -> Optional[str]:
+    """校验解析后的响应，合格（或无法校验）返回 None，否则返回错误说明"""
+    validator = _get_validator(kind)
+    if validator is None:
+        return None
+    try:
+        validator(data)
+        return None
+    except fastjsonschema.JsonSchemaException as e:
+        return e.message
@@ -1,23 +1,65 @@
 """
 知识图谱任务队列服务（按AI服务商划分队列）
 """
-from typing import Optional, Dict, Any, List
-import json
+from collections import defaultdict
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple, Callable
 import logging
+import time
 
-from src.utils.redis_client import get_redis_client
+from src.utils.redis_client import get_redis_client, get_async_redis_client, json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
 
 QUEUE_PREFIX = "kg:ai_queue:"
+# 队列迁移时每次 pipeline 往返移动的任务数
+REBALANCE_CHUNK_SIZE = 500
+# 'shortest' 策略每迁移多少批才从 Redis 重新同步一次目标队列长度（期间本地累加）
+REBALANCE_RESYNC_CHUNKS = 10
+# 队列长度微缓存 TTL（秒）：健康检查/统计高频轮询时，同一窗口内只访问一次 Redis
+QUEUE_LENGTH_CACHE_TTL = 0.2
 
+# 延迟重试：执行异常的任务按到期时间写入 ZSET，到期后原子移回主队列；超过次数进入死信列表
+RETRY_PREFIX = "kg:ai_retry:"
+DEAD_LETTER_KEY = "kg:ai_dead_letter"
+# 死信列表只保留最近的条目，避免长期运行无限增长
+DEAD_LETTER_MAX_LEN = 1000
+MAX_TASK_RETRIES = 3
+# 原子地把到期的重试任务从 ZSET 移回主队列（多个 Worker 并发清扫也不会重复入队）
+# KEYS[1]=重试ZSET, KEYS[2]=主队列; ARGV[1]=当前时间, ARGV[2]=单次最多移动数
+_REQUEUE_DUE_LUA = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, item in ipairs(items) do
+    redis.call('ZREM', KEYS[1], item)
+    redis.call('RPUSH', KEYS[2], item)
+end
+return #items
+"""
+_requeue_due_script = None
+
+# {queue_key: (expire_at, length)}
+_queue_length_cache: Dict[str, Tuple[float, int]] = {}
 
+
+@lru_cache(maxsize=256)
 def _queue_key(provider: str) -> str:
+    # provider 是很小的有限集合，缓存后生产/消费热路径不再重复做 strip/lower/拼接
     provider = (provider or "rules").strip().lower()
     return f"{QUEUE_PREFIX}{provider}"
 
 
+@lru_cache(maxsize=256)
+def _retry_key(provider: str) -> str:
+    provider = (provider or "rules").strip().lower()
+    return f"{RETRY_PREFIX}{provider}"
+
+
+def get_queue_key(provider: str) -> str:
+    """获取provider对应的队列键名（供其他模块使用，避免重复硬编码队列前缀）"""
+    return _queue_key(provider)
+
+
 def enqueue_task(task_id: int, provider: str) -> bool:
     """将任务入队到指定provider队列
 
@@ -25,19 +67,39 @@ def enqueue_task(task_id: int, provider: str) -> bool:
         task_id: 知识图谱任务ID
         provider: AI服务商名称（或 'rules'）
     """
+    return enqueue_tasks([(task_id, provider)]) == 1
+
+
+def enqueue_tasks(tasks: List[Tuple[int, str]]) -> int:
+    """批量入队：按provider分组，每个队列一次 RPUSH（多值），整体一次 pipeline 往返
+
+    Args:
+        tasks: [(task_id, provider), ...]
+
+    Returns:
+        成功入队的任务数
+    """
+    if not tasks:
+        return 0
     client = get_redis_client()
     if not client:
         logger.error("Redis未连接，无法入队")
-        return False
+        return 0
     try:
-        item = {"task_id": int(task_id), "provider": provider}
-        key = _queue_key(provider)
-        client.rpush(key, item)
-        logger.debug(f"已入队任务: task={task_id}, provider={provider}, key={key}")
-        return True
+        groups = defaultdict(list)
+        for task_id, provider in tasks:
+            item = {"task_id": int(task_id), "provider": provider}
+            groups[_queue_key(provider)].append(json_dumps(item))
+
+        pipe = client.client.pipeline(transaction=False)
+        for key, values in groups.items():
+            pipe.rpush(key, *values)
+        pipe.execute()
+        logger.debug(f"已批量入队任务: count={len(tasks)}, queues={list(groups.keys())}")
+        return len(tasks)
     except Exception as e:
-        logger.error(f"任务入队失败 task={task_id}, provider={provider}: {e}")
-        return False
+        logger.error(f"批量入队失败 count={len(tasks)}: {e}")
+        return 0
 
 
 def brpop_task(provider: str, timeout: int = 5) -> Optional[Dict[str, Any]]:
@@ -61,31 +123,236 @@ def brpop_task(provider: str, timeout: int = 5) -> Optional[Dict[str, Any]]:
         return None
 
 
+def schedule_retry(item: Dict[str, Any], provider: str, delay: float) -> bool:
+    """任务执行异常时安排延迟重试
+
+    重试次数记录在载荷的 retries 字段中，超过 MAX_TASK_RETRIES 次后写入死信列表。
+
+    Args:
+        item: 从队列弹出的任务载荷 {task_id, provider[, retries]}
+        provider: 当前provider
+        delay: 延迟秒数
+
+    Returns:
+        是否已安排重试（进入死信或失败返回 False）
+    """
+    client = get_redis_client()
+    if not client:
+        return False
+    try:
+        retries = int(item.get('retries', 0)) + 1
+        payload = {"task_id": int(item['task_id']), "provider": provider, "retries": retries}
+        if retries > MAX_TASK_RETRIES:
+            pipe = client.client.pipeline(transaction=False)
+            pipe.rpush(DEAD_LETTER_KEY, json_dumps(payload))
+            pipe.ltrim(DEAD_LETTER_KEY, -DEAD_LETTER_MAX_LEN, -1)
+            length, _ = pipe.execute()
+            logger.error(f"任务重试次数超过上限，已移入死信列表: task_id={payload['task_id']}, provider={provider}, "
+                         f"死信数={min(int(length), DEAD_LETTER_MAX_LEN)}")
+            return False
+        client.client.zadd(_retry_key(provider), {json_dumps(payload): time.time() + delay})
+        logger.warning(f"任务将在 {delay:.1f}s 后重试: task_id={payload['task_id']}, provider={provider}, 第 {retries} 次")
+        return True
+    except Exception as e:
+        logger.error(f"安排任务重试失败 provider={provider}: {e}")
+        return False
+
+
+def requeue_due_retries(provider: str, limit: int = 100) -> int:
+    """把已到期的重试任务移回provider主队列，返回移动的任务数"""
+    global _requeue_due_script
+    client = get_redis_client()
+    if not client:
+        return 0
+    try:
+        if _requeue_due_script is None:
+            _requeue_due_script = client.client.register_script(_REQUEUE_DUE_LUA)
+        moved = _requeue_due_script(
+            keys=[_retry_key(provider), _queue_key(provider)],
+            args=[time.time(), limit],
+            client=client.client
+        )
+        if moved:
+            logger.info(f"已将 {moved} 个到期重试任务移回队列: provider={provider}")
+        return int(moved or 0)
+    except Exception as e:
+        logger.error(f"移回到期重试任务失败 provider={provider}: {e}")
+        return 0
+
+
+def dead_letter_length() -> int:
+    """获取死信列表长度"""
+    client = get_redis_client()
+    if not client:
+        return 0
+    try:
+        return int(client.llen(DEAD_LETTER_KEY))
+    except Exception as e:
+        logger.error(f"获取死信列表长度失败: {e}")
+        return 0
+
+
+def migrate_retries(source_provider: str, choose_target: Callable[[], str]) -> Dict[str, int]:
+    """把 source_provider 重试 ZSET 中的全部任务迁移到其他provider的重试 ZSET
+
+    重试任务只由同一provider的 Worker 清扫，队列被清空或迁移时需一并迁移，否则任务会丢失。
+    迁移保留原到期时间与重试次数。
+
+    Args:
+        source_provider: 源provider
+        choose_target: 为每个任务选择目标provider的函数
+
+    Returns:
+        {target_provider: count}
+    """
+    client = get_redis_client()
+    if not client:
+        return {}
+    src_key = _retry_key(source_provider)
+    per_target: Dict[str, int] = defaultdict(int)
+    try:
+        # WATCH 源 ZSET：读取后若被到期清扫并发修改则整批放弃，下次再迁移，避免重复入队或丢失
+        with client.client.pipeline() as pipe:
+            pipe.watch(src_key)
+            items = pipe.zrange(src_key, 0, -1, withscores=True)
+            if not items:
+                return {}
+            moves = []
+            for raw_item, due_at in items:
+                item = json_loads(raw_item)
+                target = choose_target()
+                item['provider'] = target
+                moves.append((raw_item, target, json_dumps(item), due_at))
+            pipe.multi()
+            for raw_item, target, payload, due_at in moves:
+                pipe.zrem(src_key, raw_item)
+                pipe.zadd(_retry_key(target), {payload: due_at})
+                per_target[target] += 1
+            pipe.execute()
+        logger.info(f"已迁移重试任务: {src_key} -> {dict(per_target)}")
+        return dict(per_target)
+    except Exception as e:
+        logger.error(f"迁移重试任务失败 {src_key}: {e}")
+        return {}
+
+
 def queue_length(provider: str) -> int:
-    """获取指定provider队列长度"""
+    """获取指定provider队列长度（带 QUEUE_LENGTH_CACHE_TTL 微缓存）"""
+    key = _queue_key(provider)
+    cached = _queue_length_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return queue_length_nocache(provider)
+
+
+def queue_length_nocache(provider: str) -> int:
+    """获取指定provider队列长度（直接访问 Redis，并刷新微缓存）"""
     client = get_redis_client()
     if not client:
         return 0
     try:
         key = _queue_key(provider)
-        return client.llen(key)
+        length = client.llen(key)
+        _queue_length_cache[key] = (time.monotonic() + QUEUE_LENGTH_CACHE_TTL, length)
+        return length
     except Exception as e:
         logger.error(f"获取队列长度失败 provider={provider}: {e}")
         return 0
 
 
+def queue_lengths(providers: List[str], use_cache: bool = True) -> Dict[str, int]:
+    """批量获取多个provider队列长度（未命中微缓存的部分一次 pipeline 往返）
+
+    Args:
+        providers: provider 列表
+        use_cache: 是否使用微缓存；迁移等需要实时长度的场景传 False
+
+    Returns:
+        {provider: length}
+    """
+    providers = list(providers or [])
+    if not providers:
+        return {}
+
+    result: Dict[str, int] = {}
+    missing = []
+    now = time.monotonic()
+    for provider in providers:
+        cached = _queue_length_cache.get(_queue_key(provider)) if use_cache else None
+        if cached and cached[0] > now:
+            result[provider] = cached[1]
+        else:
+            missing.append(provider)
+    if not missing:
+        return result
+
+    client = get_redis_client()
+    if not client:
+        result.update({p: 0 for p in missing})
+        return result
+    try:
+        pipe = client.client.pipeline(transaction=False)
+        for provider in missing:
+            pipe.llen(_queue_key(provider))
+        lengths = pipe.execute()
+        expire_at = time.monotonic() + QUEUE_LENGTH_CACHE_TTL
+        for provider, n in zip(missing, lengths):
+            result[provider] = int(n or 0)
+            _queue_length_cache[_queue_key(provider)] = (expire_at, result[provider])
+    except Exception as e:
+        logger.error(f"批量获取队列长度失败 providers={missing}: {e}")
+        result.update({p: 0 for p in missing if p not in result})
+    return result
+
+
+async def aqueue_length(provider: str) -> int:
+    """异步获取指定provider队列长度（redis.asyncio）"""
+    lengths = await aqueue_lengths([provider])
+    return lengths.get(provider, 0)
+
+
+async def aqueue_lengths(providers: List[str]) -> Dict[str, int]:
+    """异步批量获取多个provider队列长度（一次 pipeline 往返）
+
+    供异步端点聚合多个provider统计时使用，可与其他协程 asyncio.gather 并发。
+
+    Returns:
+        {provider: length}
+    """
+    providers = list(providers or [])
+    if not providers:
+        return {}
+    client = get_async_redis_client()
+    if client is None:
+        return {p: 0 for p in providers}
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for provider in providers:
+                pipe.llen(_queue_key(provider))
+            lengths = await pipe.execute()
+        return {p: int(n or 0) for p, n in zip(providers, lengths)}
+    except Exception as e:
+        logger.error(f"异步批量获取队列长度失败 providers={providers}: {e}")
+        return {p: 0 for p in providers}
+
+
 def purge_queue(provider: str) -> int:
-    """清空指定provider队列，返回清理的任务数"""
+    """清空指定provider队列（含待重试任务），返回清理的任务数"""
     client = get_redis_client()
     if not client:
         return 0
     try:
         key = _queue_key(provider)
-        # 统计长度后删除键
-        length = client.llen(key)
-        client.delete(key)
-        logger.info(f"已清空队列: {key}, 清理 {length} 条")
-        return int(length)
+        retry_key = _retry_key(provider)
+        # 统计长度与删除在同一次往返完成；UNLINK 由服务端异步释放内存，大队列不会阻塞 Redis
+        pipe = client.client.pipeline(transaction=False)
+        pipe.llen(key)
+        pipe.zcard(retry_key)
+        pipe.unlink(key, retry_key)
+        length, retry_length, _ = pipe.execute()
+        _queue_length_cache.pop(key, None)
+        logger.info(f"已清空队列: {key}, 清理 {length} 条，待重试 {retry_length} 条")
+        return int(length) + int(retry_length)
     except Exception as e:
         logger.error(f"清空队列失败 provider={provider}: {e}")
         return 0
@@ -95,6 +362,8 @@ def rebalance_provider_queue(source_provider: str, target_providers: Optional[Li
                              max_items: Optional[int] = None, strategy: str = 'shortest') -> Dict[str, Any]:
     """将 source_provider 队列中的任务重新分配到 target_providers。
 
+    源provider的待重试任务一并迁移到目标provider的重试 ZSET（按轮询分配，不计入 moved）。
+
     Args:
         source_provider: 源队列 provider 名称
         target_providers: 目标 provider 列表；为空则不执行
@@ -120,53 +389,74 @@ def rebalance_provider_queue(source_provider: str, target_providers: Optional[Li
     moved = 0
     per_target = {p: 0 for p in target_providers}
 
-    # 预取初始队列长度
-    try:
-        remaining = client.llen(src_key)
-    except Exception:
-        remaining = 0
+    if max_items is None:
+        # 全量迁移时源provider不再消费，其待重试任务也需迁走
+        retry_idx = 0
+        def _next_retry_target() -> str:
+            nonlocal retry_idx
+            target = target_providers[retry_idx % len(target_providers)]
+            retry_idx += 1
+            return target
+        migrate_retries(source_provider, _next_retry_target)
+
+    # 预取初始队列长度（RedisClient.llen 内部已处理异常，失败返回0）
+    remaining = client.llen(src_key)
 
     if remaining == 0:
         return {'moved': 0, 'source_left': 0, 'targets': per_target}
 
     # 准备分配器
     rr_idx = 0
+    # 'shortest' 策略：开始时一次往返获取所有目标队列长度，之后本地累加
+    lens: Dict[str, int] = queue_lengths(target_providers, use_cache=False) if strategy == 'shortest' else {}
     def _choose_target() -> str:
         nonlocal rr_idx
         if strategy == 'shortest':
-            # 动态查询当前长度，选择最短队列
-            lens = {p: queue_length(p) for p in target_providers}
-            return min(lens.items(), key=lambda kv: kv[1])[0]
+            # 基于长度快照 + 本地累加选择最短队列，O(T) 且不产生网络往返
+            target = min(lens, key=lens.get)
+            lens[target] += 1
+            return target
         # 默认轮询
         target = target_providers[rr_idx % len(target_providers)]
         rr_idx += 1
         return target
 
-    # 迁移循环
-    while remaining > 0 and (max_items is None or moved < max_items):
-        try:
-            item = client.lpop(src_key)
-        except Exception:
-            item = None
-        if not item:
-            break
-
-        # 确保是 dict
-        if isinstance(item, dict):
-            task = item
-        else:
-            try:
-                task = json.loads(item)
-            except Exception:
-                # 非法数据，丢弃
-                continue
-
-        # 选择目标队列
-        target = _choose_target()
-        task['provider'] = target
-        enqueue_task(task.get('task_id'), target)
-        per_target[target] = per_target.get(target, 0) + 1
-        moved += 1
-        remaining -= 1
+    # 迁移循环：按批次把 LMOVE 放进 pipeline，一次往返移动 REBALANCE_CHUNK_SIZE 个任务。
+    # LMOVE 原子地把源队列头部元素移到目标队列尾部，进程中途崩溃也不会丢任务。
+    # 注：载荷中的 provider 字段保持入队时的值，消费端只使用 task_id。
+    # 循环体本身不做异常处理，任何 Redis 异常由外层统一捕获并返回已迁移的部分结果
+    chunk_idx = 0
+    try:
+        while remaining > 0 and (max_items is None or moved < max_items):
+            batch = min(REBALANCE_CHUNK_SIZE, remaining)
+            if max_items is not None:
+                batch = min(batch, max_items - moved)
+
+            if strategy == 'shortest' and chunk_idx and chunk_idx % REBALANCE_RESYNC_CHUNKS == 0:
+                # 定期重新同步，修正消费者并发弹出造成的本地计数漂移
+                lens = queue_lengths(target_providers, use_cache=False)
+            chunk_idx += 1
+
+            chosen = [_choose_target() for _ in range(batch)]
+            pipe = client.client.pipeline(transaction=False)
+            for target in chosen:
+                pipe.lmove(src_key, _queue_key(target), 'LEFT', 'RIGHT')
+            results = pipe.execute()
+
+            batch_moved = 0
+            for target, item in zip(chosen, results):
+                if item is None:
+                    # 源队列已被取空（可能被消费者并发弹出），后续 LMOVE 结果同样为空
+                    break
+                per_target[target] += 1
+                batch_moved += 1
+            moved += batch_moved
+            remaining -= batch_moved
+
+            if batch_moved < batch:
+                remaining = 0
+                break
+    except Exception as e:
+        logger.error(f"批量迁移任务失败 {src_key}: {e}")
 
     return {'moved': moved, 'source_left': remaining, 'targets': per_target}
@@ -1,39 +1,166 @@
 """
 知识图谱任务 Provider Worker（多进程）
 按 AI 服务商划分队列与进程，消费任务并执行现有的构建逻辑。
+
+热路径约定：
+- Worker 热路径是 I/O 密集的（BRPOP 等待 + LLM 调用 + MySQL/Neo4j 写入），'rules' 规则提取偏 CPU 密集。
+- 两类都使用“每个槽位一个进程”：provider 通过进程级环境变量 KG_ACTIVE_PROVIDER 选择，
+  提取器是进程内单例，同一进程内不能并发服务多个 provider/任务。
+- 因此优化集中在减少每个进程的开销（forkserver 预加载、小连接池）与每轮循环的 Redis 往返，
+  而不是在进程内加线程。
 """
+import json
 import logging
 import multiprocessing
 import threading
 import os
+import random
 import time
-from typing import List, Optional
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
 
-from .kg_task_queue_service import brpop_task
+from .kg_task_queue_service import brpop_task, schedule_retry, requeue_due_retries, migrate_retries, RETRY_PREFIX
 
 logger = logging.getLogger(__name__)
 
 
 _workers_started = False
-_worker_processes: List[multiprocessing.Process] = []
+# 本地 Worker 进程按 provider 分组：计数/清理/统计按 provider 直接取，无需再从进程对象推断归属
+_worker_processes_by_provider: Dict[str, List[multiprocessing.Process]] = {}
 _guard_thread: Optional[threading.Thread] = None
+# 守护线程的事件监听线程：跨重启复用，避免守护线程重启后同时存在多个监听线程
+_event_thread: Optional[threading.Thread] = None
 _guard_running: bool = False
-# 暂停日志节流状态：provider -> { 'suspended': bool|None, 'next_log': epoch_seconds }
-_suspend_log_state = {}
+# 守护循环唤醒事件：收到 Worker 过期/服务商变更事件或停止时立即唤醒，而不是等满一个周期
+_guard_wakeup = threading.Event()
+# 服务商变更标志：poke_guard() 设置，守护循环消费后立即对账并检查已删除的服务商
+_guard_providers_changed = threading.Event()
+# start_kg_task_workers 上次以 info 输出的状态 (providers, per, 进程数)
+_last_logged_state = None
 # 进程管理锁，防止并发创建进程
 _worker_lock = threading.Lock()
 # 最大进程数限制（保护机制）
 MAX_TOTAL_PROCESSES = int(os.environ.get('KG_MAX_TOTAL_PROCESSES', '50'))
 MAX_PROCESSES_PER_PROVIDER = int(os.environ.get('KG_MAX_PROCESSES_PER_PROVIDER', '10'))
+# Worker 注册信息：每个进程一个 Hash（kg:worker:{pid}），并维护 pid 索引集合，
+# 统计/巡检时读取小集合，避免 KEYS 扫描整个键空间阻塞 Redis
+WORKER_KEY_PREFIX = 'kg:worker:'
+WORKER_INDEX_KEY = 'kg:workers:index'
+WORKER_KEY_TTL = 7200  # 2小时过期（支持长时间任务 + 足够的心跳缓冲）
+# Worker 心跳 Lua 脚本：一次 EVALSHA 完成 重写 Hash + 刷新过期 + 更新索引集合（原子，读方不会看到半写状态）
+# 先 DEL 再 HSET：任务结束后的空闲心跳会清除上一个任务残留的 task_id/start_time 字段
+# KEYS[1]=worker_key, KEYS[2]=索引集合; ARGV[1]=ttl毫秒, ARGV[2]=pid, ARGV[3..]=field, value, ...
+_HEARTBEAT_LUA = """
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+redis.call('PEXPIRE', KEYS[2], ARGV[1])
+return 1
+"""
+_heartbeat_script = None
+# 服务商变更通知频道：新增/删除/启停 AI 服务商后向该频道 PUBLISH（见 notify_providers_changed），守护线程立即对账
+PROVIDERS_CHANGED_CHANNEL = 'kg:providers:changed'
+# created 任务自动入队的认领键：SET NX EX 保证多个守护线程/节点不会重复入队同一任务，
+# 过期时间覆盖任务在队列中等待被 Worker 取走的时间，过期后若仍为 created 会被重新认领
+TASK_CLAIM_KEY_PREFIX = 'kg:task:claim:'
+TASK_CLAIM_TTL = 600
+# 空闲时 BRPOP 阻塞等待秒数（纯阻塞，任务到达立即唤醒；越长空闲唤醒越少）
+BRPOP_BLOCK_SECONDS = int(os.environ.get('KG_BRPOP_BLOCK', '15'))
+# 持续空闲超过 BRPOP_IDLE_AFTER 秒后，阻塞时长逐步加倍到该上限，进一步减少空闲唤醒
+BRPOP_MAX_BLOCK_SECONDS = int(os.environ.get('KG_BRPOP_MAX_BLOCK', '30'))
+BRPOP_IDLE_AFTER = 30
+# 空闲/暂停状态下心跳更新间隔（秒）
+HEARTBEAT_INTERVAL = 30
+# 清扫本provider到期重试任务的间隔（秒）
+RETRY_SWEEP_INTERVAL = 10
+# 任务执行失败后首次重试的延迟（秒），之后每次加倍
+TASK_RETRY_BASE_DELAY = 30
+# 执行失败后可以重试的任务状态：failed 为执行中途失败（如 Neo4j 不可用），
+# created 为启动时数据库异常未能改变状态；已完成/已取消/不存在的任务重试没有意义
+RETRYABLE_TASK_STATUSES = ('failed', 'created')
+# 激活服务商列表缓存时长（秒）：服务商很少变更，变更时由 PROVIDERS_CHANGED_CHANNEL 通知失效
+PROVIDER_LIST_CACHE_TTL = 60
+_provider_list_cache = {'value': None, 'expires': 0.0}
+# 未暂停状态的缓存时长（秒）：暂停是人工/分钟级事件，连续短任务之间无需每次都查询 Redis
+SUSPEND_CHECK_INTERVAL = 3
+# Worker 启动时初始化知识图谱提取器的最大尝试次数
+EXTRACTOR_INIT_ATTEMPTS = 5
+# forkserver 服务进程预加载的模块（仅对 forkserver 启动方式生效，服务进程启动后再设置无效）
+FORKSERVER_PRELOAD_MODULES = [
+    'src.models.database',
+    'src.services.knowledge_graph_extractor',
+]
+
+
+def _worker_mp_context():
+    """获取创建 Worker 进程使用的 multiprocessing 上下文
+
+    优先级：KG_WORKER_START_METHOD > MULTIPROCESSING_START_METHOD > forkserver。
+    forkserver 从一个不持有 DB/Redis/Neo4j 连接的精简服务进程 fork，
+    避免复制整个父进程内存，也不会继承父进程的连接句柄；平台不支持时使用系统默认方式。
+    """
+    method = (os.environ.get('KG_WORKER_START_METHOD')
+              or os.environ.get('MULTIPROCESSING_START_METHOD')
+              or 'forkserver').strip().lower()
+    if method not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    ctx = multiprocessing.get_context(method)
+    if method == 'forkserver':
+        # 在 forkserver 服务进程中预先导入重量级模块，之后每个 Worker 直接继承，
+        # 无需各自重新导入；这些模块导入时只创建引擎/连接池对象，不建立实际连接
+        ctx.set_forkserver_preload(FORKSERVER_PRELOAD_MODULES)
+    return ctx
+
+
+def _start_worker_process(provider: str, name: str) -> multiprocessing.Process:
+    """按配置的启动方式创建并启动一个 Worker 进程"""
+    ctx = _worker_mp_context()
+    proc = ctx.Process(
+        target=kg_task_worker_process,
+        args=(provider,),
+        # 仅 fork 方式会继承父进程的连接池，需要在子进程中重置
+        kwargs={'reset_connections': ctx.get_start_method() == 'fork'},
+        name=name,
+        daemon=True
+    )
+    proc.start()
+    _worker_processes_by_provider.setdefault(provider, []).append(proc)
+    return proc
+
+
+def _all_worker_processes():
+    """遍历所有本地 Worker 进程"""
+    return chain.from_iterable(_worker_processes_by_provider.values())
+
+
+def kg_task_worker_process(provider: str, reset_connections: bool = True):
+    """Worker 进程函数：消费 provider 队列并执行任务
 
-
-def kg_task_worker_process(provider: str):
-    """Worker 进程函数：消费 provider 队列并执行任务"""
+    Args:
+        provider: 服务的 provider 名称
+        reset_connections: 是否重置从父进程继承的 DB/Redis 连接（仅 fork 方式需要）
+    """
     # 延迟导入，避免主进程初始化时的循环依赖
     from src.services.knowledge_graph_extractor import get_kg_extractor
+    from src.services.ai_provider_throttle import (
+        is_suspended as _is_suspended,
+        suspended_remaining as _suspended_remaining,
+        wait_for_resume as _wait_for_resume,
+    )
     from src.models.database import db_manager
 
-    logger.info(f"[KG-Worker] 进程启动: provider={provider}, pid={os.getpid()}")
+    # 进程内固定不变：缓存 pid 与注册键，心跳时不再重复 getpid/拼接
+    pid = os.getpid()
+    worker_key = f"{WORKER_KEY_PREFIX}{pid}"
+
+    logger.info(f"[KG-Worker] 进程启动: provider={provider}, pid={pid}")
+    # Worker 进程一次只做一个阻塞弹出 + 少量写操作：阻塞命令走独立连接池（不阻塞心跳写入），
+    # 各连接池上限调小，避免 进程数 × 默认上限 的连接数（显式配置的环境变量优先）
+    os.environ.setdefault('REDIS_POOL_MAX_CONNECTIONS', '4')
+    os.environ.setdefault('REDIS_PUBSUB_POOL_MAX_CONNECTIONS', '2')
+    os.environ.setdefault('REDIS_BLOCKING_POOL_MAX_CONNECTIONS', '2')
     # 将当前provider注入到环境变量，供提取阶段覆盖AI选择
     try:
         if provider:
@@ -41,24 +168,24 @@ def kg_task_worker_process(provider: str):
             logger.info(f"[KG-Worker] 设置运行时Provider: {provider}")
     except Exception as e:
         logger.warning(f"[KG-Worker] 设置Provider覆盖失败: {e}")
-    extractor = None
     backoff = 1
     max_backoff = 8
 
-    # 重要：在子进程中重置数据库连接池，避免 fork 后连接复用导致 MySQL Packet sequence 错误
-    try:
-        db_manager.close_all_connections()
-        logger.debug("[KG-Worker] 已重置数据库连接池（子进程）")
-    except Exception as e:
-        logger.warning(f"[KG-Worker] 重置数据库连接池失败: {e}")
+    if reset_connections:
+        # 重要：fork 方式下在子进程中重置数据库连接池，避免连接复用导致 MySQL Packet sequence 错误
+        try:
+            db_manager.close_all_connections()
+            logger.debug("[KG-Worker] 已重置数据库连接池（子进程）")
+        except Exception as e:
+            logger.warning(f"[KG-Worker] 重置数据库连接池失败: {e}")
 
-    # 重置 Redis 客户端（避免 fork 后连接复用）
-    try:
-        from src.utils.redis_client import close_redis_client
-        close_redis_client()
-        logger.debug("[KG-Worker] 已重置Redis客户端（子进程）")
-    except Exception as e:
-        logger.warning(f"[KG-Worker] 重置Redis客户端失败: {e}")
+        # 重置 Redis 客户端（避免 fork 后连接复用）
+        try:
+            from src.utils.redis_client import close_redis_client
+            close_redis_client()
+            logger.debug("[KG-Worker] 已重置Redis客户端（子进程）")
+        except Exception as e:
+            logger.warning(f"[KG-Worker] 重置Redis客户端失败: {e}")
 
     # 重置 Neo4j 连接（如果使用了连接池）
     try:
@@ -87,146 +214,245 @@ def kg_task_worker_process(provider: str):
         node_name = f"主节点-{hostname}"
         logger.debug(f"[KG-Worker] 主节点 Worker: node_name={node_name}")
 
+    # 注册参数中不随心跳变化的部分只序列化一次
+    static_args = [WORKER_KEY_TTL * 1000, pid]
+    for field, value in (('provider', provider), ('pid', pid), ('node_name', node_name)):
+        static_args.extend((field, json.dumps(value, ensure_ascii=False)))
+
     def register_worker_to_redis(task_id=None, start_time=None):
         """注册或更新 Worker 状态到 Redis"""
+        global _heartbeat_script
         try:
             redis_client = get_redis_client()
             if not redis_client:
-                logger.error(f"[KG-Worker] 无法获取Redis客户端，注册失败: pid={os.getpid()}")
+                logger.error(f"[KG-Worker] 无法获取Redis客户端，注册失败: pid={pid}")
                 return False
 
-            worker_key = f"kg:worker:{os.getpid()}"
-            worker_data = {
-                'provider': provider,
-                'pid': os.getpid(),
-                'node_name': node_name,
-                'last_heartbeat': time.time()
-            }
+            now = time.time()
+            args = static_args + ['last_heartbeat', json.dumps(now)]
             if task_id is not None:
-                worker_data['task_id'] = task_id
-                worker_data['start_time'] = start_time or time.time()
-
-            success = redis_client.hmset(worker_key, worker_data)
+                args.extend(('task_id', json.dumps(task_id), 'start_time', json.dumps(start_time or now)))
+
+            # 通过 Lua 脚本一次往返完成注册/心跳（脚本按 SHA 缓存，之后走 EVALSHA）
+            if _heartbeat_script is None:
+                _heartbeat_script = redis_client.client.register_script(_HEARTBEAT_LUA)
+            success = bool(_heartbeat_script(
+                keys=[worker_key, WORKER_INDEX_KEY], args=args, client=redis_client.client
+            ))
             if success:
-                redis_client.expire(worker_key, 7200)  # 2小时过期（支持长时间任务 + 足够的心跳缓冲）
-                logger.info(f"[KG-Worker] 注册成功: pid={os.getpid()}, task_id={task_id or '空闲'}, node={node_name}")
+                logger.info(f"[KG-Worker] 注册成功: pid={pid}, task_id={task_id or '空闲'}, node={node_name}")
                 return True
             else:
-                logger.error(f"[KG-Worker] hmset失败: pid={os.getpid()}, provider={provider}")
+                logger.error(f"[KG-Worker] hmset失败: pid={pid}, provider={provider}")
                 return False
         except Exception as e:
             logger.error(f"[KG-Worker] 注册Worker状态到Redis失败: {e}", exc_info=True)
             return False
 
+    # 取任务前先初始化提取器（指数退避重试）；最终失败则退出进程，由守护线程重新拉起，
+    # 避免注册了一个永远无法消费队列的 Worker
+    extractor = None
+    for attempt in range(EXTRACTOR_INIT_ATTEMPTS):
+        extractor = get_kg_extractor()
+        if extractor:
+            break
+        delay = min(2 ** attempt, 30)
+        logger.warning(f"[KG-Worker] 知识图谱提取器初始化失败，{delay}秒后重试: provider={provider}, pid={pid}")
+        time.sleep(delay)
+    if not extractor:
+        logger.error(f"[KG-Worker] 知识图谱提取器初始化失败，Worker 退出: provider={provider}, pid={pid}")
+        return
+
     # 进程启动时立即注册
     register_success = register_worker_to_redis()
     if register_success:
-        logger.info(f"[KG-Worker] Worker 启动成功: pid={os.getpid()}, node={node_name}, provider={provider}")
+        logger.info(f"[KG-Worker] Worker 启动成功: pid={pid}, node={node_name}, provider={provider}")
     else:
-        logger.error(f"[KG-Worker] Worker 启动失败（Redis注册失败）: pid={os.getpid()}, provider={provider}")
+        logger.error(f"[KG-Worker] Worker 启动失败（Redis注册失败）: pid={pid}, provider={provider}")
+
+    # 暂停状态与日志节流（每个进程只服务一个provider，用局部变量即可）
+    check_suspend = bool(provider) and provider != 'rules'
+    was_suspended = None
+    next_suspend_log = 0.0
+    next_suspend_check = 0.0
 
-    # 心跳计数器
-    heartbeat_counter = 0
+    # 上次心跳时间（按时间而非循环次数判断，BRPOP 阻塞时长变化不影响心跳频率）
+    last_heartbeat = time.time()
+    last_retry_sweep = 0.0
+    # 空闲退避：最近一次取到任务的时间与当前 BRPOP 阻塞时长
+    last_task_time = time.time()
+    block_seconds = BRPOP_BLOCK_SECONDS
 
     while True:
         try:
             # 若当前Provider被暂停，短暂休眠并跳过取任务，避免将任务取出后再失败
             try:
-                from src.services.ai_provider_throttle import is_suspended as _is_suspended
-                suspended = bool(provider and provider != 'rules' and _is_suspended(provider))
-                st = _suspend_log_state.get(provider or 'unknown', {'suspended': None, 'next_log': 0})
                 now = time.time()
+                suspended = False
+                if check_suspend and now >= next_suspend_check:
+                    suspended = _is_suspended(provider)
+                    # 仅缓存“未暂停”结果；暂停中每轮都重新检查，恢复后立即生效
+                    next_suspend_check = 0.0 if suspended else now + SUSPEND_CHECK_INTERVAL
                 if suspended:
                     # 仅在状态变化或超过节流间隔时输出一条日志（默认120秒）
-                    if st.get('suspended') is not True or now >= st.get('next_log', 0):
+                    if was_suspended is not True or now >= next_suspend_log:
                         logger.warning(f"[KG-Worker] Provider已暂停，等待恢复: {provider}")
-                        st['next_log'] = now + 120
-                    st['suspended'] = True
-                    _suspend_log_state[provider or 'unknown'] = st
+                        next_suspend_log = now + 120
+                    was_suspended = True
 
                     # 修复：即使暂停状态下也要定期更新心跳，避免 Redis key 过期
-                    heartbeat_counter += 1
-                    if heartbeat_counter % 10 == 0:  # 每 50 秒左右更新一次心跳（10次 * 5秒）
+                    if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                        last_heartbeat = now
                         success = register_worker_to_redis()
                         if success:
-                            logger.debug(f"[KG-Worker] 暂停状态心跳更新成功: provider={provider}, pid={os.getpid()}")
+                            logger.debug(f"[KG-Worker] 暂停状态心跳更新成功: provider={provider}, pid={pid}")
                         else:
-                            logger.error(f"[KG-Worker] 暂停状态心跳更新失败: provider={provider}, pid={os.getpid()}")
+                            logger.error(f"[KG-Worker] 暂停状态心跳更新失败: provider={provider}, pid={pid}")
 
-                    time.sleep(5)
+                    # 不再每5秒轮询：等待恢复通知，最多等到暂停到期或下一次心跳
+                    wait_seconds = min(max(_suspended_remaining(provider), 1), HEARTBEAT_INTERVAL)
+                    _wait_for_resume(provider, wait_seconds)
                     continue
-                else:
+                elif was_suspended:
                     # 从暂停恢复时输出一次提示
-                    if st.get('suspended') is True:
-                        logger.info(f"[KG-Worker] Provider已恢复: {provider}")
-                    st['suspended'] = False
-                    st['next_log'] = 0
-                    _suspend_log_state[provider or 'unknown'] = st
+                    logger.info(f"[KG-Worker] Provider已恢复: {provider}")
+                    was_suspended = False
+                    next_suspend_log = 0.0
             except Exception:
                 pass
 
-            item = brpop_task(provider, timeout=3)
+            # 定期把到期的重试任务移回队列
+            if time.time() - last_retry_sweep >= RETRY_SWEEP_INTERVAL:
+                last_retry_sweep = time.time()
+                requeue_due_retries(provider)
+
+            item = brpop_task(provider, timeout=block_seconds)
             if not item:
-                # 无任务，定期更新心跳（增加频率确保 Redis key 不过期）
-                heartbeat_counter += 1
-                if heartbeat_counter % 10 == 0:  # 每30秒左右更新一次心跳 (10次 * 3秒)
+                # 无任务（BRPOP 超时），按时间间隔更新心跳；不再额外 sleep，直接回到阻塞等待
+                now = time.time()
+                if now - last_task_time >= BRPOP_IDLE_AFTER:
+                    # 不超过心跳间隔，保证空闲时心跳仍按时刷新
+                    block_seconds = min(block_seconds * 2, BRPOP_MAX_BLOCK_SECONDS, HEARTBEAT_INTERVAL)
+                if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    last_heartbeat = now
                     success = register_worker_to_redis()
                     if success:
-                        logger.debug(f"[KG-Worker] 心跳更新成功: provider={provider}, pid={os.getpid()}, counter={heartbeat_counter}")
+                        logger.debug(f"[KG-Worker] 心跳更新成功: provider={provider}, pid={pid}")
                     else:
-                        logger.error(f"[KG-Worker] 心跳更新失败: provider={provider}, pid={os.getpid()}")
-                time.sleep(0.2)
+                        logger.error(f"[KG-Worker] 心跳更新失败: provider={provider}, pid={pid}")
                 continue
 
+            last_task_time = time.time()
+            block_seconds = BRPOP_BLOCK_SECONDS
+
             task_id = int(item.get('task_id'))
             logger.info(f"[KG-Worker] 取到任务: provider={provider}, task_id={task_id}")
 
             # 更新 Worker 状态：记录当前正在处理的任务
             register_worker_to_redis(task_id=task_id, start_time=time.time())
 
-            # 获取提取器实例
-            if extractor is None:
-                extractor = get_kg_extractor()
-                if not extractor:
-                    logger.error("知识图谱提取器初始化失败，任务跳过")
-                    # 清除 Worker 状态
-                    try:
-                        from src.utils.redis_client import get_redis_client
-                        redis_client = get_redis_client()
-                        if redis_client:
-                            redis_client.delete(f"kg:worker:{os.getpid()}")
-                    except Exception:
-                        pass
-                    continue
-
             try:
-                # 执行任务（内部含原子 start + 章节事务 + 进度推送）
-                extractor.build_knowledge_graph_with_task(task_id)
+                # 执行任务（内部含原子 start + 章节事务 + 进度推送）；内部捕获异常并以 False 表示失败
+                if not extractor.build_knowledge_graph_with_task(task_id) and _is_task_retryable(task_id):
+                    schedule_retry(item, provider, delay=TASK_RETRY_BASE_DELAY * 2 ** int(item.get('retries', 0)))
+            except Exception:
+                # 任务已从队列弹出，异常时放回延迟重试集合，避免任务丢失
+                schedule_retry(item, provider, delay=backoff + random.uniform(0, backoff))
+                raise
             finally:
                 # 任务完成后，更新 Worker 状态为空闲（不删除记录）
                 register_worker_to_redis()  # 不传task_id，表示空闲状态
-                heartbeat_counter = 0  # 重置心跳计数器
+                last_heartbeat = time.time()
 
             backoff = 1
         except Exception as e:
             logger.error(f"[KG-Worker] 执行任务异常 provider={provider}: {e}")
-            time.sleep(backoff)
+            # 抖动退避：避免多个副本在同一时刻集中重试
+            time.sleep(backoff + random.uniform(0, backoff / 2))
             backoff = min(max_backoff, backoff * 2)
 
 
+def _is_task_retryable(task_id: int) -> bool:
+    """任务执行返回失败后，按当前状态判断是否值得放入延迟重试集合"""
+    try:
+        from .knowledge_graph_task_service import kg_task_service
+        progress = kg_task_service.get_task_progress(task_id)
+        return bool(progress) and progress['status'] in RETRYABLE_TASK_STATUSES
+    except Exception as e:
+        logger.warning(f"[KG-Worker] 查询任务状态失败，不安排重试: task_id={task_id}, 错误: {e}")
+        return False
+
+
+def _list_workers(redis_client) -> List[Tuple[int, str]]:
+    """列出所有 Worker 的 (pid, 注册键)
+
+    优先读取 pid 索引集合（直接得到 pid，无需从键名解析）；索引不存在时
+    （如仅有旧版本 Worker）回退到 SCAN，两者都不会像 KEYS 那样一次性阻塞 Redis。
+    """
+    pids = redis_client.smembers(WORKER_INDEX_KEY)
+    if pids:
+        return [(int(pid), f"{WORKER_KEY_PREFIX}{pid}") for pid in pids]
+    try:
+        keys = redis_client.client.scan_iter(match=f"{WORKER_KEY_PREFIX}*", count=500)
+        return [(int(key[len(WORKER_KEY_PREFIX):]), key) for key in keys]
+    except Exception as e:
+        logger.warning(f"[KG-Worker] SCAN Worker 注册键失败: {e}")
+        return []
+
+
+def _unregister_workers(redis_client, pids: List[int]):
+    """删除 Worker 注册 Hash 并从索引集合移除（一次 pipeline 往返）"""
+    if not pids:
+        return
+    pipe = redis_client.client.pipeline(transaction=False)
+    pipe.delete(*[f"{WORKER_KEY_PREFIX}{pid}" for pid in pids])
+    pipe.srem(WORKER_INDEX_KEY, *pids)
+    pipe.execute()
+
+
+def _is_python_process(pid: int) -> bool:
+    """检查进程名称中是否包含 python（Worker 进程是 Python 进程）"""
+    try:
+        import psutil
+        # PID 会被系统复用，缓存键带上进程创建时间，复用后的新进程不会命中旧结果
+        return _is_python_process_cached(pid, psutil.Process(pid).create_time())
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=1024)
+def _is_python_process_cached(pid: int, create_time: float) -> bool:
+    """按 (pid, 创建时间) 缓存进程名称检查结果，避免重复系统调用"""
+    import psutil
+    return 'python' in psutil.Process(pid).name().lower()
+
+
 def _list_active_providers() -> List[str]:
-    """查询激活的 AIProvider 名称列表（小写）"""
+    """查询激活的 AIProvider 名称列表（带 PROVIDER_LIST_CACHE_TTL 缓存）"""
+    now = time.time()
+    cached = _provider_list_cache['value']
+    if cached is not None and now < _provider_list_cache['expires']:
+        return list(cached)
     try:
         from src.models.database import db_manager, AIProvider
         with db_manager.get_session() as session:
             rows = session.query(AIProvider.name).filter_by(is_active=True).all()
             providers = [name for (name,) in rows]
-            return providers
+        # 仅缓存成功的查询结果，查询失败时下次继续查库
+        _provider_list_cache['value'] = providers
+        _provider_list_cache['expires'] = now + PROVIDER_LIST_CACHE_TTL
+        return list(providers)
     except Exception as e:
         logger.error(f"加载 AIProvider 列表失败: {e}")
         return []
 
 
+def invalidate_provider_cache():
+    """清除激活服务商列表缓存（新增/删除/启停服务商后调用，下次对账立即重新查库）"""
+    _provider_list_cache['value'] = None
+    _provider_list_cache['expires'] = 0.0
+
+
 def start_kg_task_workers(providers: Optional[List[str]] = None, include_rules: bool = True, per_provider_processes: int = 1):
     """启动 Provider Worker 进程（带严格保护机制）
 
@@ -235,7 +461,7 @@ def start_kg_task_workers(providers: Optional[List[str]] = None, include_rules:
         include_rules: 是否包含 'rules' 规则提取进程
         per_provider_processes: 每个provider启动的进程数（默认1）
     """
-    global _workers_started, _worker_processes
+    global _workers_started
 
     # 使用锁防止并发创建进程
     with _worker_lock:
@@ -252,58 +478,39 @@ def start_kg_task_workers(providers: Optional[List[str]] = None, include_rules:
             logger.warning("[KG-Worker] 没有可用provider，跳过启动")
             return
 
-        logger.info(f"[KG-Worker] 启动provider进程: {providers}, per={per_provider_processes}")
-
-        # 过滤掉已存在且存活的 provider（按当前进程名判断）
-        existing = {}  # provider -> count
-        # 同时清理已死亡的进程和不在数据库中的进程
-        alive_processes = []
-        terminated_processes = []
-        for p in _worker_processes:
-            if p.is_alive():
-                # 进程名格式: KGTaskWorker-{provider}-{i}
-                # provider名称可能包含连字符，所以要从开头去掉"KGTaskWorker-"，从结尾去掉"-{i}"
-                name = p.name or ''
-                provider_name = None
-                if name.startswith('KGTaskWorker-'):
-                    # 去掉前缀
-                    provider_part = name[len('KGTaskWorker-'):]
-                    # 去掉最后的序号部分 "-1", "-2" 等
-                    if '-' in provider_part:
-                        provider_name = '-'.join(provider_part.split('-')[:-1])
-                    else:
-                        provider_name = provider_part
-
-                # 检查该 provider 是否在激活列表中
-                if provider_name and provider_name not in providers:
+        # 按 provider 清理已死亡的进程，并终止不在数据库中的服务商的进程
+        for provider_name, procs in list(_worker_processes_by_provider.items()):
+            procs[:] = [p for p in procs if p.is_alive()]
+            if provider_name not in providers:
+                for p in procs:
                     # 终止不在数据库中的 Worker 进程
                     logger.warning(f"[KG-Worker] 终止已删除服务商的 Worker: provider={provider_name}, pid={p.pid}")
                     try:
                         p.terminate()
-                        terminated_processes.append(p)
                     except Exception as e:
                         logger.error(f"[KG-Worker] 终止进程失败 (pid={p.pid}): {e}")
-                else:
-                    alive_processes.append(p)
-                    if provider_name:
-                        existing[provider_name] = existing.get(provider_name, 0) + 1
-
-        # 更新进程列表，只保留存活的进程
-        _worker_processes.clear()
-        _worker_processes.extend(alive_processes)
+                procs.clear()
+            if not procs:
+                del _worker_processes_by_provider[provider_name]
 
         # 检查总进程数限制
-        current_total = len(alive_processes)
+        current_total = sum(len(procs) for procs in _worker_processes_by_provider.values())
         if current_total >= MAX_TOTAL_PROCESSES:
             logger.error(f"[KG-Worker] 已达到最大进程数限制 {MAX_TOTAL_PROCESSES}，拒绝创建新进程")
             return
 
-        logger.info(f"[KG-Worker] 当前活跃进程: {current_total}/{MAX_TOTAL_PROCESSES}")
+        # 守护线程周期调用时状态多半不变：仅在 provider 列表或进程数变化时输出 info，其余降为 debug
+        global _last_logged_state
+        state = (tuple(sorted(providers)), per_provider_processes, current_total)
+        log = logger.info if state != _last_logged_state else logger.debug
+        _last_logged_state = state
+        log(f"[KG-Worker] 启动provider进程: {providers}, per={per_provider_processes}")
+        log(f"[KG-Worker] 当前活跃进程: {current_total}/{MAX_TOTAL_PROCESSES}")
 
         # 计算每个 provider 需要启动的进程数
         created_count = 0
         for provider in providers:
-            existing_count = existing.get(provider, 0)
+            existing_count = len(_worker_processes_by_provider.get(provider, ()))
             needed_count = per_provider_processes - existing_count
 
             if needed_count <= 0:
@@ -327,14 +534,7 @@ def start_kg_task_workers(providers: Optional[List[str]] = None, include_rules:
             logger.info(f"[KG-Worker] 为 provider={provider} 启动 {actual_count} 个进程（已有 {existing_count}）")
 
             for i in range(actual_count):
-                proc = multiprocessing.Process(
-                    target=kg_task_worker_process,
-                    args=(provider,),
-                    name=f"KGTaskWorker-{provider}-{existing_count + i + 1}",
-                    daemon=True
-                )
-                proc.start()
-                _worker_processes.append(proc)
+                proc = _start_worker_process(provider, f"KGTaskWorker-{provider}-{existing_count + i + 1}")
                 created_count += 1
                 logger.info(f"  - 启动 Worker: provider={provider}, pid={proc.pid}")
 
@@ -363,7 +563,7 @@ def get_worker_stats() -> dict:
           }
         }
     """
-    from .kg_task_queue_service import queue_length
+    from .kg_task_queue_service import queue_lengths
     from src.utils.redis_client import get_redis_client
     import psutil
 
@@ -375,69 +575,64 @@ def get_worker_stats() -> dict:
     prov_map = {}
 
     # 方案1：统计本地启动的进程（向后兼容）
-    for p in _worker_processes:
-        name = p.name or ''
-        # 名称格式: KGTaskWorker-{provider}-{i}
-        provider = 'unknown'
-        try:
-            if name.startswith('KGTaskWorker-'):
-                # 去掉前缀
-                provider_part = name[len('KGTaskWorker-'):]
-                # 去掉最后的序号部分 "-1", "-2" 等
-                if '-' in provider_part:
-                    provider = '-'.join(provider_part.split('-')[:-1])
-                else:
-                    provider = provider_part
-        except Exception:
-            provider = 'unknown'
+    for provider, procs in _worker_processes_by_provider.items():
         prov = prov_map.setdefault(provider, {'processes': 0, 'alive': 0, 'pids': [], 'active_tasks': []})
-        prov['processes'] += 1
-        prov['alive'] += 1 if p.is_alive() else 0
-        prov['pids'].append(p.pid)
+        prov['processes'] += len(procs)
+        prov['alive'] += sum(1 for p in procs if p.is_alive())
+        prov['pids'].extend(p.pid for p in procs)
 
     # 方案2：从 Redis 读取所有节点的 Worker（支持分布式）
     redis_client = None
-    stale_worker_keys = []  # 记录需要清理的过期 worker keys
+    stale_pids = []  # 记录需要清理的过期 worker pid
+    worker_infos = {}  # pid -> worker hash，供后面组装 active_tasks 复用，不再二次读取
 
     try:
         redis_client = get_redis_client()
         if redis_client:
-            worker_keys = redis_client.keys('kg:worker:*')
-            for key in worker_keys:
-                try:
-                    key_str = key.decode() if isinstance(key, bytes) else key
-                    pid = int(key_str.replace('kg:worker:', ''))
+            workers = _list_workers(redis_client)
+            # 所有 Worker Hash 一次 pipeline 读取
+            worker_hashes = redis_client.hgetall_many([key for _, key in workers])
+
+            # 远程节点心跳同样一次 pipeline 读取（每个节点只读一次）
+            remote_nodes = set()
+            for worker_info in worker_hashes:
+                node_name = worker_info.get('node_name')
+                if node_name and not str(node_name).startswith('主节点-'):
+                    remote_nodes.add(node_name)
+            remote_nodes = list(remote_nodes)
+            node_hashes = redis_client.hgetall_many([f"kg:nodes:{n}" for n in remote_nodes])
+            node_alive = {n: bool(info) for n, info in zip(remote_nodes, node_hashes)}
+
+            # 本机进程存活判断：本地子进程直接信任，其余 pid 一次性取系统进程列表比对
+            local_children = {p.pid for p in _all_worker_processes() if p.is_alive()}
+            try:
+                live_pids = set(psutil.pids())
+            except Exception:
+                live_pids = set()
 
-                    # 读取 Worker 信息（Hash 类型）
-                    worker_info = redis_client.hgetall(key)
+            def _is_local_worker_alive(pid: int) -> bool:
+                return pid in local_children or (pid in live_pids and _is_python_process(pid))
+
+            for (pid, key), worker_info in zip(workers, worker_hashes):
+                try:
                     if not worker_info:
+                        # Hash 已过期但索引中仍有记录，一并清理
+                        stale_pids.append(pid)
                         continue
 
-                    # 解析 provider 和 node_name
-                    provider_raw = worker_info.get(b'provider') if isinstance(list(worker_info.keys())[0], bytes) else worker_info.get('provider')
-                    provider = (provider_raw.decode() if isinstance(provider_raw, bytes) else provider_raw) if provider_raw else 'unknown'
-
-                    node_name_raw = worker_info.get(b'node_name') if isinstance(list(worker_info.keys())[0], bytes) else worker_info.get('node_name')
-                    node_name = (node_name_raw.decode() if isinstance(node_name_raw, bytes) else node_name_raw) if node_name_raw else None
+                    # 客户端 decode_responses=True，字段与值已是 str
+                    provider = worker_info.get('provider') or 'unknown'
+                    node_name = worker_info.get('node_name') or None
 
                     # 健康检查：验证进程是否真实存在
                     is_alive = False
 
                     # 主节点 Worker：node_name 以"主节点-"开头，使用本地进程检查
                     if node_name and node_name.startswith('主节点-'):
-                        try:
-                            if psutil.pid_exists(pid):
-                                process = psutil.Process(pid)
-                                # 检查进程名称中是否包含 python（Worker 进程是 Python 进程）
-                                if 'python' in process.name().lower():
-                                    is_alive = True
-                        except (psutil.NoSuchProcess, psutil.AccessDenied):
-                            pass
+                        is_alive = _is_local_worker_alive(pid)
                     elif node_name:
                         # 远程节点：检查节点心跳是否存在（依赖 Redis TTL 自动清理过期节点）
-                        node_key = f"kg:nodes:{node_name}"
-                        node_info = redis_client.hgetall(node_key)
-                        if node_info:
+                        if node_alive.get(node_name):
                             # 节点心跳存在且未过期，信任该节点的所有 Worker 进程
                             is_alive = True
                         else:
@@ -445,21 +640,16 @@ def get_worker_stats() -> dict:
                             logger.debug(f"节点心跳不存在，标记 Worker 为过期: node={node_name}, pid={pid}")
                     else:
                         # 兼容旧版本：没有 node_name 的本地 Worker，直接检查进程
-                        try:
-                            if psutil.pid_exists(pid):
-                                process = psutil.Process(pid)
-                                # 检查进程名称中是否包含 python（Worker 进程是 Python 进程）
-                                if 'python' in process.name().lower():
-                                    is_alive = True
-                        except (psutil.NoSuchProcess, psutil.AccessDenied):
-                            pass
+                        is_alive = _is_local_worker_alive(pid)
 
                     # 如果进程不存在，标记为过期，稍后清理
                     if not is_alive:
-                        stale_worker_keys.append(key_str)
+                        stale_pids.append(pid)
                         logger.debug(f"检测到过期的 Worker 进程: pid={pid}, provider={provider}, node={node_name or '本地'}")
                         continue
 
+                    worker_infos[pid] = worker_info
+
                     # 如果这个 PID 不在本地列表中，添加到统计
                     prov = prov_map.setdefault(provider, {'processes': 0, 'alive': 0, 'pids': [], 'active_tasks': []})
                     if pid not in prov['pids']:
@@ -470,11 +660,11 @@ def get_worker_stats() -> dict:
                     logger.debug(f"解析 Worker Key 失败: {key}, {e}")
                     continue
 
-            # 清理过期的 Worker keys
-            if stale_worker_keys:
+            # 清理过期的 Worker keys（同时从索引集合移除）
+            if stale_pids:
                 try:
-                    redis_client.delete(*stale_worker_keys)
-                    logger.info(f"清理了 {len(stale_worker_keys)} 个过期的 Worker 进程记录")
+                    _unregister_workers(redis_client, stale_pids)
+                    logger.info(f"清理了 {len(stale_pids)} 个过期的 Worker 进程记录")
                 except Exception as e:
                     logger.warning(f"清理过期 Worker keys 失败: {e}")
 
@@ -484,73 +674,66 @@ def get_worker_stats() -> dict:
     except Exception as e:
         logger.warning(f"从 Redis 读取全局 Worker 失败: {e}")
 
-    # 从 Redis 读取每个进程正在处理的任务和节点信息
-    try:
-        redis_client = get_redis_client()
-        if redis_client:
-            for provider, prov_data in prov_map.items():
-                for pid in prov_data['pids']:
-                    worker_key = f"kg:worker:{pid}"
-                    worker_info = redis_client.hgetall(worker_key)
-                    if worker_info:
-                        task_id = worker_info.get('task_id')
-                        start_time = worker_info.get('start_time')
-                        node_name = worker_info.get('node_name')  # 读取节点名称
-
-                        # 解码 node_name（如果是 bytes）
-                        if isinstance(node_name, bytes):
-                            node_name = node_name.decode()
-
-                        if task_id:
-                            try:
-                                task_id = int(task_id)
-                                start_time_float = float(start_time) if start_time else None
-                                duration = int(time.time() - start_time_float) if start_time_float else 0
+    # 组装每个进程正在处理的任务和节点信息（复用上面已读取的 Worker Hash）
+    for provider, prov_data in prov_map.items():
+        for pid in prov_data['pids']:
+            worker_info = worker_infos.get(pid)
+            if not worker_info:
+                continue
+            task_id = worker_info.get('task_id')
+            start_time = worker_info.get('start_time')
+            node_name = worker_info.get('node_name')  # 读取节点名称
 
-                                # 从数据库获取任务名称
-                                task_name = None
-                                try:
-                                    from src.models.database import db_manager, KnowledgeGraphTask
-                                    with db_manager.get_session() as session:
-                                        task = session.query(KnowledgeGraphTask.task_name).filter_by(id=task_id).first()
-                                        if task:
-                                            task_name = task.task_name
-                                except Exception:
-                                    pass
-
-                                # 处理 node_name 显示
-                                # - None 或空字符串：兼容旧版本，显示"主节点"
-                                # - 以"主节点-"开头：直接显示
-                                # - 其他：正常显示
-                                # - 缺少 node_name 字段：真正的旧版本，需要重启
-                                if node_name is None or node_name == 'None' or node_name == '':
-                                    # 兼容旧版本的主节点 Worker
-                                    node_name = '主节点'
-                                elif 'node_name' not in worker_info:
-                                    # 真正缺少 node_name 字段（旧版本代码）
-                                    node_name = '旧版本(需重启)'
-                                # 否则直接使用 node_name（包括"主节点-xxx"和远程节点名）
-
-                                prov_data['active_tasks'].append({
-                                    'task_id': task_id,
-                                    'task_name': task_name,
-                                    'pid': pid,
-                                    'start_time': start_time_float,
-                                    'duration': duration,
-                                    'node_name': node_name
-                                })
-                            except Exception as e:
-                                logger.warning(f"解析Worker任务信息失败: {e}")
-    except Exception as e:
-        logger.warning(f"从Redis读取Worker状态失败: {e}")
+            if task_id:
+                try:
+                    task_id = int(task_id)
+                    start_time_float = float(start_time) if start_time else None
+                    duration = int(time.time() - start_time_float) if start_time_float else 0
+
+                    # 处理 node_name 显示
+                    # - None 或空字符串：兼容旧版本，显示"主节点"
+                    # - 以"主节点-"开头：直接显示
+                    # - 其他：正常显示
+                    # - 缺少 node_name 字段：真正的旧版本，需要重启
+                    if node_name is None or node_name == 'None' or node_name == '':
+                        # 兼容旧版本的主节点 Worker
+                        node_name = '主节点'
+                    elif 'node_name' not in worker_info:
+                        # 真正缺少 node_name 字段（旧版本代码）
+                        node_name = '旧版本(需重启)'
+                    # 否则直接使用 node_name（包括"主节点-xxx"和远程节点名）
+
+                    prov_data['active_tasks'].append({
+                        'task_id': task_id,
+                        'task_name': None,  # 下面统一批量查询填充
+                        'pid': pid,
+                        'start_time': start_time_float,
+                        'duration': duration,
+                        'node_name': node_name
+                    })
+                except Exception as e:
+                    logger.warning(f"解析Worker任务信息失败: {e}")
 
-    # 融合队列长度
-    for provider in list(prov_map.keys()):
+    # 从数据库批量获取任务名称（一个会话 + 一次 IN 查询）
+    active_tasks = [t for prov_data in prov_map.values() for t in prov_data['active_tasks']]
+    if active_tasks:
         try:
-            qlen = queue_length(provider)
-        except Exception:
-            qlen = 0
-        prov_map[provider]['queue_length'] = qlen
+            from src.models.database import db_manager, KnowledgeGraphTask
+            task_ids = list({t['task_id'] for t in active_tasks})
+            with db_manager.get_session() as session:
+                rows = session.query(KnowledgeGraphTask.id, KnowledgeGraphTask.task_name).filter(
+                    KnowledgeGraphTask.id.in_(task_ids)
+                ).all()
+            task_names = {task_id: task_name for task_id, task_name in rows}
+            for t in active_tasks:
+                t['task_name'] = task_names.get(t['task_id'])
+        except Exception as e:
+            logger.debug(f"批量查询任务名称失败: {e}")
+
+    # 融合队列长度（所有provider一次往返）
+    qlens = queue_lengths(list(prov_map.keys()))
+    for provider in prov_map:
+        prov_map[provider]['queue_length'] = qlens.get(provider, 0)
 
     stats['providers'] = prov_map
     return stats
@@ -568,12 +751,7 @@ def start_workers_for_providers(providers: List[str], per_provider_processes: in
     providers = [p.strip() for p in providers if p]
 
     # 当前已有的 provider
-    existing = set()
-    for p in _worker_processes:
-        name = p.name or ''
-        parts = name.split('-')
-        if len(parts) >= 2:
-            existing.add(parts[1])
+    existing = {prov for prov, procs in _worker_processes_by_provider.items() if procs}
 
     to_start = [p for p in providers if p not in existing]
     skipped = [p for p in providers if p in existing]
@@ -581,14 +759,7 @@ def start_workers_for_providers(providers: List[str], per_provider_processes: in
     started_count = 0
     for provider in to_start:
         for i in range(per_provider_processes):
-            proc = multiprocessing.Process(
-                target=kg_task_worker_process,
-                args=(provider,),
-                name=f"KGTaskWorker-{provider}-{i+1}",
-                daemon=True
-            )
-            proc.start()
-            _worker_processes.append(proc)
+            proc = _start_worker_process(provider, f"KGTaskWorker-{provider}-{i+1}")
             started_count += 1
             logger.info(f"  - 启动 Worker: provider={provider}, pid={proc.pid}")
 
@@ -618,8 +789,10 @@ def start_auto_worker_guard(interval_seconds: int = 30):
     - 始终包含 'rules' Provider（除非明确不需要，可自行在代码处关掉 include_rules）
     - 防止重复启动守护线程
     - 定期检查并清理僵尸任务（状态为 running 但实际未在执行的任务）
+    - 监听 Worker 注册键过期与 PROVIDERS_CHANGED_CHANNEL，有事件时立即对账；
+      无事件时仍按周期对账（补齐进程每个周期一次，已删除服务商检查每2个周期一次）
     """
-    global _guard_thread, _guard_running
+    global _guard_thread, _event_thread, _guard_running
 
     # 使用锁保护守护线程的启动
     with _worker_lock:
@@ -634,13 +807,70 @@ def start_auto_worker_guard(interval_seconds: int = 30):
             _guard_thread = None
 
         _guard_running = True
+        _guard_wakeup.clear()
+
+        # 守护线程专用的线程本地会话：各检查复用同一个 Session，每轮结束 remove() 归还连接
+        from sqlalchemy.orm import scoped_session
+        from src.models.database import db_manager, AIProvider, KnowledgeGraphTask
+        from src.utils.redis_client import get_redis_client
+        from .kg_task_queue_service import enqueue_task, enqueue_tasks, get_queue_key
+        GuardSession = scoped_session(db_manager.SessionLocal)
+
+        def _event_listener():
+            """监听 Worker 注册键过期（keyevent）与服务商变更频道，触发守护循环立即对账"""
+            while _guard_running:
+                pubsub = None
+                try:
+                    redis_client = get_redis_client()
+                    if not redis_client:
+                        time.sleep(interval_seconds)
+                        continue
+
+                    # 开启键过期事件通知（合并已有配置）；托管 Redis 可能禁用 CONFIG，失败时只监听服务商频道
+                    # 注意 notify-keyspace-events 是服务端全局配置，只在缺少过期事件时追加，并记录修改
+                    keyevents_enabled = False
+                    try:
+                        flags = redis_client.client.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+                        if 'E' not in flags or ('x' not in flags and 'A' not in flags):
+                            new_flags = ''.join(sorted(set(flags + 'Ex')))
+                            redis_client.client.config_set('notify-keyspace-events', new_flags)
+                            logger.warning(f"[KG-WorkerGuard] 已修改 Redis notify-keyspace-events: '{flags}' -> '{new_flags}'")
+                        keyevents_enabled = True
+                    except Exception as e:
+                        logger.warning(f"[KG-WorkerGuard] 无法开启键过期事件通知，Worker 过期改由周期对账发现: {e}")
+
+                    pubsub = redis_client.subscribe(PROVIDERS_CHANGED_CHANNEL)
+                    if pubsub is None:
+                        time.sleep(interval_seconds)
+                        continue
+                    if keyevents_enabled:
+                        # 只订阅本服务所用 db 的过期事件
+                        db = redis_client.client.connection_pool.connection_kwargs.get('db', 0)
+                        pubsub.subscribe(f'__keyevent@{db}__:expired')
+                    logger.info(f"[KG-WorkerGuard] 事件监听已启动（键过期事件: {'开启' if keyevents_enabled else '关闭'}）")
+
+                    while _guard_running:
+                        message = pubsub.get_message(ignore_subscribe_messages=True, timeout=30)
+                        if not message:
+                            continue
+                        if message.get('channel') == PROVIDERS_CHANGED_CHANNEL:
+                            poke_guard()
+                        elif str(message.get('data', '')).startswith(WORKER_KEY_PREFIX):
+                            # Worker 注册键过期：提前唤醒守护循环补齐进程
+                            _guard_wakeup.set()
+                except Exception as e:
+                    logger.warning(f"[KG-WorkerGuard] 事件监听异常，{interval_seconds}s 后重连: {e}")
+                    time.sleep(interval_seconds)
+                finally:
+                    if pubsub is not None:
+                        try:
+                            pubsub.close()
+                        except Exception:
+                            pass
 
         def _check_zombie_tasks():
             """检查并清理僵尸任务（状态为 running 但没有 Worker 在处理）"""
             try:
-                from src.models.database import db_manager, KnowledgeGraphTask
-                from src.utils.redis_client import get_redis_client
-
                 # 1. 获取所有活跃任务的 task_id
                 stats = get_worker_stats()
                 active_task_ids = set()
@@ -649,7 +879,7 @@ def start_auto_worker_guard(interval_seconds: int = 30):
                         active_task_ids.add(task.get('task_id'))
 
                 # 2. 查询数据库中状态为 running 的任务
-                with db_manager.get_session() as session:
+                with GuardSession() as session:
                     try:
                         running_tasks = session.query(KnowledgeGraphTask.id).filter_by(status='running').all()
                         running_task_ids = {t.id for t in running_tasks}
@@ -660,39 +890,60 @@ def start_auto_worker_guard(interval_seconds: int = 30):
                         if zombie_task_ids:
                             logger.warning(f"[KG-WorkerGuard] 发现 {len(zombie_task_ids)} 个僵尸任务")
 
-                            # 4. 逐个检查僵尸任务并修复状态（限制每次最多100个，避免数据库压力）
-                            fixed_count = 0
+                            # 4. 批量检查僵尸任务并修复状态（限制每次最多100个，避免数据库压力）
                             max_fix_per_check = 100
                             sample_zombie_ids = list(zombie_task_ids)[:max_fix_per_check]
 
-                            for task_id in sample_zombie_ids:
-                                task = session.query(KnowledgeGraphTask).filter_by(id=task_id).first()
-                                if not task:
-                                    continue
-
+                            # 一次查询取回所需列，按目标状态分桶
+                            rows = session.query(
+                                KnowledgeGraphTask.id,
+                                KnowledgeGraphTask.task_name,
+                                KnowledgeGraphTask.total_chapters,
+                                KnowledgeGraphTask.completed_chapters,
+                                KnowledgeGraphTask.failed_chapters,
+                                KnowledgeGraphTask.error_message
+                            ).filter(KnowledgeGraphTask.id.in_(sample_zombie_ids)).all()
+
+                            completed_ids, failed_ids, reset_ids = [], [], []
+                            for task_id, task_name, total_chapters, completed, failed, error_message in rows:
                                 # 检查任务的完成情况
-                                total_chapters = task.total_chapters or 0
-                                completed = task.completed_chapters or 0
-                                failed = task.failed_chapters or 0
+                                total_chapters = total_chapters or 0
+                                completed = completed or 0
+                                failed = failed or 0
 
                                 # 判断任务应该设置为什么状态
                                 if completed >= total_chapters and total_chapters > 0:
                                     # 所有章节已处理完成
-                                    task.status = 'completed'
-                                    if not task.completed_at:
-                                        from datetime import datetime
-                                        task.completed_at = datetime.now()
-                                    logger.info(f"[KG-WorkerGuard] 僵尸任务 {task_id} ({task.task_name}) 已完成 {completed}/{total_chapters} 章节，修正状态为 completed")
-                                elif task.error_message or failed > 0:
+                                    completed_ids.append(task_id)
+                                    logger.info(f"[KG-WorkerGuard] 僵尸任务 {task_id} ({task_name}) 已完成 {completed}/{total_chapters} 章节，修正状态为 completed")
+                                elif error_message or failed > 0:
                                     # 有错误记录
-                                    task.status = 'failed'
-                                    logger.info(f"[KG-WorkerGuard] 僵尸任务 {task_id} ({task.task_name}) 有错误（失败章节: {failed}），修正状态为 failed")
+                                    failed_ids.append(task_id)
+                                    logger.info(f"[KG-WorkerGuard] 僵尸任务 {task_id} ({task_name}) 有错误（失败章节: {failed}），修正状态为 failed")
                                 else:
                                     # 重置为 created，允许重新执行
-                                    task.status = 'created'
-                                    logger.info(f"[KG-WorkerGuard] 僵尸任务 {task_id} ({task.task_name}) 进度 {completed}/{total_chapters}，重置状态为 created")
-
-                                fixed_count += 1
+                                    reset_ids.append(task_id)
+                                    logger.info(f"[KG-WorkerGuard] 僵尸任务 {task_id} ({task_name}) 进度 {completed}/{total_chapters}，重置状态为 created")
+
+                            # 每个桶一条 UPDATE ... WHERE id IN (...)
+                            if completed_ids:
+                                from datetime import datetime
+                                from sqlalchemy import func
+                                session.query(KnowledgeGraphTask).filter(
+                                    KnowledgeGraphTask.id.in_(completed_ids)
+                                ).update({
+                                    'status': 'completed',
+                                    'completed_at': func.coalesce(KnowledgeGraphTask.completed_at, datetime.now())
+                                }, synchronize_session=False)
+                            if failed_ids:
+                                session.query(KnowledgeGraphTask).filter(
+                                    KnowledgeGraphTask.id.in_(failed_ids)
+                                ).update({'status': 'failed'}, synchronize_session=False)
+                            if reset_ids:
+                                session.query(KnowledgeGraphTask).filter(
+                                    KnowledgeGraphTask.id.in_(reset_ids)
+                                ).update({'status': 'created'}, synchronize_session=False)
+                            fixed_count = len(completed_ids) + len(failed_ids) + len(reset_ids)
 
                             session.commit()
                             remaining = len(zombie_task_ids) - fixed_count
@@ -712,11 +963,9 @@ def start_auto_worker_guard(interval_seconds: int = 30):
         def _auto_start_created_tasks():
             """自动启动 created 状态的任务（限流）"""
             try:
-                from src.models.database import db_manager, KnowledgeGraphTask
-                from src.services.kg_task_queue_service import enqueue_task
                 from src.api.kg_task_routes import _choose_provider_for_ai_task
 
-                with db_manager.get_session() as session:
+                with GuardSession() as session:
                     try:
                         # 查询 created 状态的任务（限制每次最多启动 20 个）
                         created_tasks = session.query(KnowledgeGraphTask).filter_by(
@@ -727,9 +976,26 @@ def start_auto_worker_guard(interval_seconds: int = 30):
                             logger.debug("[KG-WorkerGuard] 没有待启动的 created 任务")
                             return
 
-                        logger.info(f"[KG-WorkerGuard] 发现 {len(created_tasks)} 个待启动任务，开始自动入队...")
+                        # 在 Redis 中认领任务（一次 pipeline 往返），跳过已被其他守护线程认领/已入队的任务
+                        redis_client = get_redis_client()
+                        if not redis_client:
+                            logger.warning("[KG-WorkerGuard] Redis 未连接，跳过自动入队")
+                            return
+                        claim_value = f"{os.environ.get('KG_WORKER_NODE_NAME', '')}:{os.getpid()}"
+                        pipe = redis_client.client.pipeline(transaction=False)
+                        for task in created_tasks:
+                            pipe.set(f"{TASK_CLAIM_KEY_PREFIX}{task.id}", claim_value, nx=True, ex=TASK_CLAIM_TTL)
+                        claimed = pipe.execute()
+                        created_tasks = [task for task, ok in zip(created_tasks, claimed) if ok]
+                        if not created_tasks:
+                            logger.debug("[KG-WorkerGuard] created 任务均已被认领，跳过")
+                            return
+
+                        logger.info(f"[KG-WorkerGuard] 认领 {len(created_tasks)} 个待启动任务，开始自动入队...")
 
-                        enqueued_count = 0
+                        to_enqueue = []
+                        task_names = {}
+                        unclaim_ids = []
                         for task in created_tasks:
                             try:
                                 # 选择最优 Provider
@@ -737,16 +1003,23 @@ def start_auto_worker_guard(interval_seconds: int = 30):
                                     provider = _choose_provider_for_ai_task()
                                 else:
                                     provider = 'rules'
-
-                                # 将任务入队
-                                if enqueue_task(task.id, provider):
-                                    enqueued_count += 1
-                                    logger.info(f"[KG-WorkerGuard] 任务 {task.id} ({task.task_name}) 已入队到 {provider}")
-                                else:
-                                    logger.warning(f"[KG-WorkerGuard] 任务 {task.id} 入队失败")
-
+                                to_enqueue.append((task.id, provider))
+                                task_names[task.id] = task.task_name
                             except Exception as e:
                                 logger.error(f"[KG-WorkerGuard] 启动任务 {task.id} 失败: {e}")
+                                unclaim_ids.append(task.id)
+
+                        # 批量入队（按 provider 分组，一次往返）
+                        enqueued_count = enqueue_tasks(to_enqueue)
+                        if enqueued_count:
+                            for task_id, provider in to_enqueue:
+                                logger.info(f"[KG-WorkerGuard] 任务 {task_id} ({task_names.get(task_id)}) 已入队到 {provider}")
+                        elif to_enqueue:
+                            logger.warning(f"[KG-WorkerGuard] {len(to_enqueue)} 个任务入队失败")
+                            unclaim_ids.extend(task_id for task_id, _ in to_enqueue)
+                        if unclaim_ids:
+                            # 释放未入队任务的认领，下次检查时重试
+                            redis_client.client.delete(*[f"{TASK_CLAIM_KEY_PREFIX}{task_id}" for task_id in unclaim_ids])
 
                         if enqueued_count > 0:
                             logger.info(f"[KG-WorkerGuard] 成功入队 {enqueued_count} 个任务")
@@ -760,9 +1033,6 @@ def start_auto_worker_guard(interval_seconds: int = 30):
         def _check_deleted_providers():
             """检测已删除的 AI 服务商，停止相关 Worker 并重新入队任务"""
             try:
-                from src.models.database import db_manager, AIProvider
-                from src.utils.redis_client import get_redis_client
-                from src.services.kg_task_queue_service import enqueue_task
                 from src.api.kg_task_routes import _choose_provider_for_ai_task
 
                 redis_client = get_redis_client()
@@ -771,37 +1041,25 @@ def start_auto_worker_guard(interval_seconds: int = 30):
                     return
 
                 # 1. 获取数据库中所有激活的 AI 服务商
-                with db_manager.get_session() as session:
+                with GuardSession() as session:
                     active_providers = session.query(AIProvider.name).filter_by(is_active=True).all()
                     active_provider_names = {name for (name,) in active_providers}
                     # 添加 rules 到白名单
                     active_provider_names.add('rules')
 
                 # 2. 获取所有 Worker 注册信息
-                worker_keys = redis_client.keys('kg:worker:*')
+                workers = _list_workers(redis_client)
                 deleted_provider_workers = {}  # {provider: [(pid, task_id), ...]}
+                worker_hashes = redis_client.hgetall_many([key for _, key in workers])
 
-                for key in worker_keys:
+                for (pid, key), worker_info in zip(workers, worker_hashes):
                     try:
-                        key_str = key.decode() if isinstance(key, bytes) else key
-                        pid = int(key_str.replace('kg:worker:', ''))
-
-                        worker_info = redis_client.hgetall(key)
                         if not worker_info:
                             continue
 
-                        # 解析 provider 和 task_id
-                        provider = None
-                        task_id = None
-
-                        for k, v in worker_info.items():
-                            k_str = k.decode() if isinstance(k, bytes) else k
-                            v_str = v.decode() if isinstance(v, bytes) else v
-
-                            if k_str == 'provider':
-                                provider = v_str
-                            elif k_str == 'task_id':
-                                task_id = v_str
+                        # 解析 provider 和 task_id（decode_responses=True，无需手动解码）
+                        provider = worker_info.get('provider')
+                        task_id = worker_info.get('task_id')
 
                         # 3. 检查 provider 是否已被删除
                         if provider and provider not in active_provider_names:
@@ -810,7 +1068,7 @@ def start_auto_worker_guard(interval_seconds: int = 30):
                             deleted_provider_workers[provider].append({
                                 'pid': pid,
                                 'task_id': task_id,
-                                'redis_key': key_str
+                                'redis_key': key
                             })
 
                     except Exception as e:
@@ -855,27 +1113,30 @@ def start_auto_worker_guard(interval_seconds: int = 30):
 
                             # 6. 删除 Worker 的 Redis 注册
                             try:
-                                redis_client.client.delete(redis_key)
+                                _unregister_workers(redis_client, [pid])
                                 logger.debug(f"[KG-WorkerGuard] 已删除 Worker 注册: {redis_key} (PID: {pid})")
                             except Exception as e:
                                 logger.error(f"[KG-WorkerGuard] 删除 Worker 注册失败 {redis_key}: {e}")
 
                         # 7. 清理该 provider 的队列（如果有）
                         try:
-                            queue_key = f"kg:ai_queue:{provider.lower()}"
+                            queue_key = get_queue_key(provider)
                             queue_len = redis_client.llen(queue_key)
                             if queue_len > 0:
                                 logger.info(f"[KG-WorkerGuard] 服务商 '{provider}' 的队列中还有 {queue_len} 个任务，将重新分配")
 
                                 # 逐个取出并重新入队到活跃的 provider
+                                # 以 RPOP 返回空作为队列耗尽的判断，不再每轮额外 LLEN（减少一半 RTT，且无检查-弹出竞态）
                                 requeued_from_queue = 0
-                                while redis_client.llen(queue_key) > 0:
-                                    task_id_bytes = redis_client.client.rpop(queue_key)
-                                    if not task_id_bytes:
+                                while True:
+                                    raw_item = redis_client.client.rpop(queue_key)
+                                    if not raw_item:
                                         break
 
                                     try:
-                                        task_id_int = int(task_id_bytes.decode() if isinstance(task_id_bytes, bytes) else task_id_bytes)
+                                        # 队列元素为 {"task_id": .., "provider": ..} 的 JSON（兼容旧的纯数字格式）
+                                        item = json.loads(raw_item)
+                                        task_id_int = int(item['task_id'] if isinstance(item, dict) else item)
                                         new_provider = _choose_provider_for_ai_task()
 
                                         if enqueue_task(task_id_int, new_provider):
@@ -898,6 +1159,17 @@ def start_auto_worker_guard(interval_seconds: int = 30):
                 else:
                     logger.debug("[KG-WorkerGuard] 未发现已删除服务商的 Worker")
 
+                # 8. 迁移已删除服务商的待重试任务（只有同 provider 的 Worker 会清扫重试 ZSET，Worker 已退出时同样需要迁移）
+                # 重试键名中的 provider 已规范化为小写
+                active_lower = {name.strip().lower() for name in active_provider_names}
+                for retry_key in redis_client.client.scan_iter(match=f"{RETRY_PREFIX}*", count=100):
+                    provider = retry_key[len(RETRY_PREFIX):]
+                    if provider in active_lower:
+                        continue
+                    migrated = migrate_retries(provider, _choose_provider_for_ai_task)
+                    if migrated:
+                        logger.info(f"[KG-WorkerGuard] 从已删除服务商 '{provider}' 迁移了 {sum(migrated.values())} 个待重试任务: {migrated}")
+
             except Exception as e:
                 logger.error(f"[KG-WorkerGuard] 检查已删除服务商失败: {e}", exc_info=True)
 
@@ -916,51 +1188,101 @@ def start_auto_worker_guard(interval_seconds: int = 30):
             # 启动时自动入队 created 任务
             logger.info(f"[KG-WorkerGuard] 启动时检查待启动任务...")
             _auto_start_created_tasks()
-
-            loop_count = 0
+            GuardSession.remove()
+
+            # 各周期任务按时间独立调度：事件会提前唤醒循环，按循环次数取模会让这些任务被提前触发
+            deleted_check_interval = interval_seconds * 2
+            auto_start_interval = interval_seconds * 5
+            health_log_interval = interval_seconds * 10
+            zombie_check_interval = interval_seconds * 20
+            started_at = time.time()
+            next_deleted_check = started_at + deleted_check_interval
+            next_auto_start = started_at + auto_start_interval
+            next_health_log = started_at + health_log_interval
+            next_zombie_check = started_at + zombie_check_interval
             while _guard_running:
                 try:
-                    loop_count += 1
-                    # 该函数具备去重能力：仅为缺失的provider拉起进程
+                    now = time.time()
+                    providers_event = _guard_providers_changed.is_set()
+                    _guard_providers_changed.clear()
+
+                    # 每个周期（以及收到事件被提前唤醒时）对账：服务商列表有 PROVIDER_LIST_CACHE_TTL 缓存，
+                    # 其余只检查本地进程，开销很小。该函数具备去重能力：仅为缺失的provider拉起进程
                     start_kg_task_workers(per_provider_processes=per)
 
-                    # 每2次循环（约1分钟，假设interval=30s）检查已删除的服务商
-                    if loop_count % 2 == 0:
+                    # 检查已删除的服务商：收到变更事件时立即检查，否则每2个周期（约1分钟，假设interval=30s）执行
+                    if providers_event or now >= next_deleted_check:
+                        next_deleted_check = now + deleted_check_interval
                         _check_deleted_providers()
 
-                    # 每5次循环（约2.5分钟，假设interval=30s）自动启动 created 任务
-                    if loop_count % 5 == 0:
+                    # 每5个周期（约2.5分钟，假设interval=30s）自动启动 created 任务
+                    if now >= next_auto_start:
+                        next_auto_start = now + auto_start_interval
                         _auto_start_created_tasks()
 
-                    # 每10次循环输出一次健康检查日志
-                    if loop_count % 10 == 0:
-                        total_alive = len([p for p in _worker_processes if p.is_alive()])
+                    # 每10个周期输出一次健康检查日志
+                    if now >= next_health_log:
+                        next_health_log = now + health_log_interval
+                        total_alive = sum(1 for p in _all_worker_processes() if p.is_alive())
                         logger.debug(f"[KG-WorkerGuard] 健康检查: {total_alive} 个活跃Worker进程")
 
-                    # 每20次循环（约10分钟，假设interval=30s）检查一次僵尸任务
-                    if loop_count % 20 == 0:
+                    # 每20个周期（约10分钟，假设interval=30s）检查一次僵尸任务
+                    if now >= next_zombie_check:
+                        next_zombie_check = now + zombie_check_interval
                         logger.info(f"[KG-WorkerGuard] 定期检查僵尸任务...")
                         _check_zombie_tasks()
 
                 except Exception as e:
                     logger.error(f"[KG-WorkerGuard] 保活失败: {e}", exc_info=True)
-                # 休眠
-                time.sleep(interval_seconds)
+                finally:
+                    GuardSession.remove()
+                # 休眠，收到事件或停止信号时提前唤醒
+                _guard_wakeup.wait(interval_seconds)
+                _guard_wakeup.clear()
 
             logger.info("[KG-WorkerGuard] 守护线程退出")
 
+        # 上次启动的监听线程仍在运行（停止后监听线程最多 30s 才发现并退出）时直接复用
+        if _event_thread is None or not _event_thread.is_alive():
+            _event_thread = threading.Thread(target=_event_listener, name="KG-WorkerGuard-Events", daemon=True)
+            _event_thread.start()
         _guard_thread = threading.Thread(target=_loop, name="KG-WorkerGuard", daemon=True)
         _guard_thread.start()
         logger.info(f"[KG-WorkerGuard] 已启动，线程ID={_guard_thread.ident}")
 
 
+def poke_guard():
+    """通知守护线程服务商已变更，立即执行一轮对账（管理 API 新增/删除/启停服务商后调用）
+
+    只作用于本进程；跨进程/跨节点请调用 notify_providers_changed() 发布消息，监听线程收到后同样调用本函数。
+    """
+    invalidate_provider_cache()
+    _guard_providers_changed.set()
+    _guard_wakeup.set()
+
+
+def notify_providers_changed():
+    """服务商新增/修改/删除后调用：向 PROVIDERS_CHANGED_CHANNEL 发布通知，各节点守护线程立即对账
+
+    同时直接通知本进程的守护线程，Redis 不可用时本进程仍能立即生效，其他节点按周期对账发现变更。
+    """
+    poke_guard()
+    try:
+        from src.utils.redis_client import get_redis_client
+        redis_client = get_redis_client()
+        if redis_client:
+            redis_client.publish(PROVIDERS_CHANGED_CHANNEL, {'changed_at': time.time()})
+    except Exception as e:
+        logger.warning(f"[KG-WorkerGuard] 发布服务商变更通知失败: {e}")
+
+
 def stop_all_workers(timeout: int = 10):
     """停止所有 Worker 进程和守护线程
 
     Args:
         timeout: 等待进程退出的超时时间（秒）
     """
-    global _guard_running, _guard_thread, _worker_processes
+    global _guard_running, _guard_thread
 
     logger.info("[KG-Worker] 开始停止所有 Worker 进程和守护线程...")
 
@@ -968,6 +1290,7 @@ def stop_all_workers(timeout: int = 10):
     if _guard_thread and _guard_thread.is_alive():
         logger.info("[KG-Worker] 停止守护线程...")
         _guard_running = False
+        _guard_wakeup.set()
         _guard_thread.join(timeout=5)
         if _guard_thread.is_alive():
             logger.warning("[KG-Worker] 守护线程未在5秒内退出")
@@ -975,23 +1298,27 @@ def stop_all_workers(timeout: int = 10):
             logger.info("[KG-Worker] 守护线程已停止")
 
     # 终止所有 Worker 进程
-    if _worker_processes:
-        logger.info(f"[KG-Worker] 终止 {len(_worker_processes)} 个 Worker 进程...")
-        for proc in _worker_processes:
+    procs = list(_all_worker_processes())
+    if procs:
+        logger.info(f"[KG-Worker] 终止 {len(procs)} 个 Worker 进程...")
+        for proc in procs:
             if proc.is_alive():
                 proc.terminate()
 
-        # 等待进程退出
+        # 等待进程退出：所有进程共享同一个截止时间，总耗时不超过 timeout
         logger.info(f"[KG-Worker] 等待进程退出（最多{timeout}秒）...")
-        start_time = time.time()
-        for proc in _worker_processes:
-            remaining_time = max(0, timeout - (time.time() - start_time))
-            proc.join(timeout=remaining_time)
+        deadline = time.time() + timeout
+        while time.time() < deadline and any(proc.is_alive() for proc in procs):
+            time.sleep(0.1)
+
+        # 超时仍存活的进程统一强制 kill
+        for proc in procs:
             if proc.is_alive():
                 logger.warning(f"[KG-Worker] 进程 {proc.pid} 未在超时时间内退出，强制kill")
                 proc.kill()
+                proc.join(timeout=1)
 
-        _worker_processes.clear()
+        _worker_processes_by_provider.clear()
         logger.info("[KG-Worker] 所有 Worker 进程已停止")
 
     logger.info("[KG-Worker] 停止完成")
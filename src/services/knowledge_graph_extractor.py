@@ -3,20 +3,296 @@
 从小说文本中自动提取人物、事件、地点、组织等信息
 """
 import logging
+import os
 import re
 import json
 import hashlib
 import gc
+import copy
+import queue
+import string
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional, Set, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from functools import lru_cache
 from ..models.database import db_manager, Novel, Chapter, Analysis
 # 延迟导入，避免循环依赖问题
 from ..ai.ai_service import get_ai_manager
+from .ai_provider_throttle import increment_failure, is_suspended
+from .database_service import db_service
+from .kg_config_service import kg_config_service
+from .kg_name_canonicalizer import CANONICALIZE_ENABLED, NameCanonicalizer
+from .kg_response_cache import kg_response_cache
+from .kg_response_schemas import validation_error
+from .knowledge_graph_task_service import kg_task_service
+from ..utils.redis_client import json_loads
 
 logger = logging.getLogger(__name__)
 
+# 可选：google-re2 加速规则提取（未安装时使用标准库 re）
+try:
+    import re2 as _re2  # type: ignore
+except ImportError:
+    _re2 = None
+
+# 合并提取：一次 LLM 调用返回实体+关系+主角分析（原先每章节 3 次调用）；设置 KG_COMBINED_EXTRACTION=false 可关闭
+COMBINED_EXTRACTION_ENABLED = os.environ.get('KG_COMBINED_EXTRACTION', 'true').strip().lower() not in ('0', 'false', 'no')
+# 合并响应包含三部分内容，输出上限需高于单项提取的默认值（2000）
+COMBINED_MAX_TOKENS = int(os.environ.get('KG_COMBINED_MAX_TOKENS', '4000'))
+# 提示词模板中章节内容部分的起始标记（之前为静态前缀）
+CHAPTER_PROMPT_MARKER = '章节标题：{title}'
+# 任务内并发提取的章节数（默认1即顺序处理）。并发只用于 LLM 调用，写入仍按章节顺序串行。
+# 与 CHUNK_PARALLELISM 相同：多数服务商实现共用一个 HTTP 客户端，且每次调用结束会关闭它，并发调用会互相打断；
+# 仅在确认服务商支持并发（如 OpenAI 兼容服务）时调大，服务商限流时也请保持较小的值
+MAX_PARALLEL_CHAPTERS = max(1, int(os.environ.get('KG_MAX_PARALLEL_CHAPTERS', '1')))
+# 超长章节切分为带重叠的窗口分别提取（原先截断到 max_content_length，尾部内容丢失）
+CHUNK_OVERLAP = max(0, int(os.environ.get('KG_CHUNK_OVERLAP', '200')))
+# 同一章节各窗口并发调用 AI 的数量（默认1即顺序处理）。多数服务商实现共用一个 HTTP 客户端，
+# 且每次调用结束会关闭它，并发调用会互相打断；仅在确认服务商支持并发时调大
+CHUNK_PARALLELISM = max(1, int(os.environ.get('KG_CHUNK_PARALLELISM', '1')))
+# 响应不符合 JSON Schema 时附加到原提示词末尾要求 AI 修正一次（需安装 fastjsonschema）
+SCHEMA_RETRY_ENABLED = os.environ.get('KG_SCHEMA_RETRY', 'true').strip().lower() not in ('0', 'false', 'no')
+SCHEMA_FIX_NOTE = "\n\n注意：你上一次的输出不符合要求（{error}），请严格按照上述JSON格式重新输出完整结果，只输出JSON。"
+# 任务循环每批只回收年轻代；每 FULL_GC_EVERY_BATCHES 批或进程常驻内存超过阈值时才做完整回收
+FULL_GC_EVERY_BATCHES = 10
+GC_RSS_THRESHOLD_BYTES = int(os.environ.get('KG_GC_RSS_THRESHOLD_MB', '1024')) * 1024 * 1024
+# 人物之间的关系类型（写入 Character -> Character 关系）
+CHARACTER_RELATION_TYPES = frozenset(('FRIEND', 'ENEMY', 'LOVES', 'HATES', 'KNOWS', 'LEADS', 'FOLLOWS'))
+# 待推送进度的任务队列上限（队列满时丢弃，后台线程推送时总是读取最新进度）
+PROGRESS_QUEUE_SIZE = 1024
+# 小说主角列表的进程内缓存时间（秒）与最多缓存的小说数
+PROTAGONIST_CACHE_TTL = 30
+PROTAGONIST_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=64)
+def _compile_rule_patterns(patterns: Tuple[str, ...]) -> Tuple['re.Pattern', ...]:
+    """编译规则提取的正则（按模式元组缓存，同一配置只编译一次）
+
+    各模式分别扫描而不合并成一个交替表达式：不同模式的匹配可能相互重叠，合并后会漏掉一部分。
+    安装了 google-re2 时使用 RE2（线性时间，无回溯风险），RE2 不支持的模式回退到标准库 re。
+    """
+    compiled = []
+    for p in patterns:
+        regex = None
+        if _re2 is not None:
+            try:
+                regex = _re2.compile(p)
+            except Exception:
+                regex = None
+        compiled.append(regex or re.compile(p))
+    return tuple(compiled)
+
+
+@lru_cache(maxsize=64)
+def _frozen_words(words: Tuple[str, ...]) -> frozenset:
+    """过滤词集合（按词元组缓存）"""
+    return frozenset(words)
+
+
+@lru_cache(maxsize=4096)
+def _event_id(novel_id: int, chapter_id: int, name: str) -> str:
+    """事件节点ID：{novel_id}_{chapter_id}_{名称MD5前8位}
+
+    ID 已持久化在 Neo4j（Event.id 唯一约束），更换摘要算法会导致重跑时无法 MERGE 到已有事件，故保持 MD5。
+    同一事件在实体与 PARTICIPATES_IN / OCCURS_IN 关系中会多次用到，结果按参数缓存。
+    """
+    name_hash = hashlib.md5(name.encode('utf-8'), usedforsecurity=False).hexdigest()[:8]
+    return f"{novel_id}_{chapter_id}_{name_hash}"
+
+
+def _split_template(template: str) -> Tuple[List[str], List[str]]:
+    """将 str.format 模板预先拆分为字面量与占位符名称（字面量中的 {{ }} 已还原）
+
+    返回的 literals 比 slots 多一项，渲染时交错拼接即可，无需每次重新解析模板。
+    """
+    literals, slots = [], []
+    for literal, field_name, _, _ in string.Formatter().parse(template):
+        literals.append(literal)
+        if field_name is not None:
+            slots.append(field_name)
+    if len(literals) == len(slots):
+        literals.append('')
+    return literals, slots
+
+
+def _render_template(literals: List[str], slots: List[str], values: Dict[str, Any]) -> str:
+    """按 _split_template 的结果拼接出完整文本"""
+    parts = [''] * (len(literals) + len(slots))
+    parts[::2] = literals
+    parts[1::2] = [str(values[name]) for name in slots]
+    return ''.join(parts)
+
+
+def _rss_high() -> bool:
+    """当前进程常驻内存是否超过阈值（psutil 不可用时返回 False）"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss >= GC_RSS_THRESHOLD_BYTES
+    except Exception:
+        return False
+
+
+def _count_mentions(names, content: str) -> Dict[str, int]:
+    """统计各名称在内容中的出现次数
+
+    所有名称合并为一个交替正则（长名称优先）在 C 层一次扫描完成，
+    避免逐个名称 str.count 的多次全文扫描；重叠名称（如“王小明”中的“小明”）只计入较长者。
+    """
+    if not names or not content:
+        return {}
+    pattern = re.compile('|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True)))
+    return Counter(pattern.findall(content))
+
+
+def _as_score(value: Any) -> int:
+    """将 AI 返回的主角评分转换为整数（null、非数字字符串等视为 0）"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+def _split_content(content: str, window: int, overlap: int) -> List[str]:
+    """将超长内容切分为带重叠的窗口，尽量在换行处断开"""
+    if window <= 0 or len(content) <= window:
+        return [content]
+    overlap = min(overlap, window // 2)
+    spans = []
+    start, length = 0, len(content)
+    while start < length:
+        end = min(start + window, length)
+        if end < length:
+            cut = content.rfind('\n', start + window // 2, end)
+            if cut > start:
+                end = cut + 1
+        spans.append(content[start:end])
+        if end >= length:
+            break
+        start = end - overlap
+    return spans
+
+
+def _first_json_object(text: str) -> Optional[str]:
+    """返回文本中第一个括号配平的 JSON 对象子串（考虑字符串字面量与转义），未找到返回 None"""
+    start = text.find('{')
+    if start < 0:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+_progress_queue: Optional[queue.Queue] = None
+_progress_thread: Optional[threading.Thread] = None
+_progress_lock = threading.Lock()
+# novel_id -> (过期时间, 主角列表)
+_protagonist_cache: Dict[int, Tuple[float, List[Dict]]] = {}
+# 各任务最近一次发布的进度签名（只在推送线程内读写）；任务不再处于运行状态时移除
+_last_published: Dict[int, Tuple] = {}
+
+
+def _publish_progress(task_id: int):
+    """读取任务最新进度并发布到 Redis（通过主进程统一推送），避免直接依赖 Flask 上下文"""
+    # 获取最新的任务进度（只查任务表一行）
+    updated_task = kg_task_service.get_task_progress(task_id)
+    if not updated_task:
+        return
+
+    # 计算进度
+    progress = 0
+    if updated_task['total_chapters'] > 0:
+        progress = round((updated_task['completed_chapters'] / updated_task['total_chapters']) * 100, 1)
+
+    # 进度（0.1%）、状态与失败数都未变化时不重复发布
+    signature = (progress, updated_task['status'], updated_task['failed_chapters'])
+    if _last_published.get(task_id) == signature:
+        return
+    if updated_task['status'] == 'running':
+        if len(_last_published) >= PROGRESS_QUEUE_SIZE:
+            # 异常退出的任务不会移除记录，数量过多时整体清空
+            _last_published.clear()
+        _last_published[task_id] = signature
+    else:
+        _last_published.pop(task_id, None)
+
+    # 仅经由 Redis Pub/Sub 转发到主进程，再由主进程统一 emit 到 SocketIO
+    try:
+        from src.utils.redis_client import get_redis_client
+        from src.services.chapter_write_worker import PROGRESS_CHANNEL
+        redis_client = get_redis_client()
+    except Exception:
+        redis_client = None
+
+    if redis_client:
+        event_data = {
+            'type': 'kg_task_progress',
+            'task_id': task_id,
+            'status': updated_task['status'],
+            'progress': progress,
+            'completed_chapters': updated_task['completed_chapters'],
+            'failed_chapters': updated_task['failed_chapters'],
+            'total_chapters': updated_task['total_chapters'],
+            'updated_at': updated_task['updated_at']
+        }
+        redis_client.publish(PROGRESS_CHANNEL, event_data)
+        # 降低日志级别为调试，避免刷屏
+        logger.debug(f"已发布任务进度事件到Redis: 任务{task_id}, 进度{progress}%")
+
+
+def _progress_worker(progress_queue: queue.Queue):
+    """后台推送线程：取出积压的全部任务ID，同一任务只推送一次最新进度"""
+    while True:
+        pending = [progress_queue.get()]
+        try:
+            while True:
+                pending.append(progress_queue.get_nowait())
+        except queue.Empty:
+            pass
+        for task_id in dict.fromkeys(pending):
+            try:
+                _publish_progress(task_id)
+            except Exception as e:
+                # 保守处理：不因进度推送失败影响任务主流程
+                logger.debug(f"进度推送跳过/失败（不影响主流程）: {e}")
+
+
+def _get_progress_queue() -> queue.Queue:
+    """按需启动进度推送线程（fork 出的子进程中线程不存在，会重新创建）"""
+    global _progress_queue, _progress_thread
+    if _progress_thread is not None and _progress_thread.is_alive():
+        return _progress_queue
+    with _progress_lock:
+        if _progress_thread is None or not _progress_thread.is_alive():
+            _progress_queue = queue.Queue(maxsize=PROGRESS_QUEUE_SIZE)
+            _progress_thread = threading.Thread(target=_progress_worker, args=(_progress_queue,),
+                                                name="KG-ProgressPublisher", daemon=True)
+            _progress_thread.start()
+    return _progress_queue
+
 
-@dataclass
+@dataclass(slots=True)
 class ExtractedEntity:
     """提取的实体"""
     name: str
@@ -26,7 +302,7 @@ class ExtractedEntity:
     novel_id: int
 
 
-@dataclass
+@dataclass(slots=True)
 class ExtractedRelation:
     """提取的关系"""
     from_entity: str
@@ -37,6 +313,22 @@ class ExtractedRelation:
     novel_id: int
 
 
+# AI 响应各部分到实体类型的映射：(响应字段, 实体类型, ((属性名, 缺省值工厂), ...))
+AI_ENTITY_SPECS = (
+    ('characters', 'character', (('description', str), ('traits', list), ('title', str),
+                                 ('is_protagonist', bool), ('protagonist_score', int))),
+    ('locations', 'location', (('description', str), ('type', str))),
+    ('organizations', 'organization', (('description', str), ('type', str))),
+    ('events', 'event', (('description', str), ('importance', str), ('participants', list))),
+)
+# AI 响应各部分到关系的映射：(响应字段, 起点字段, 终点字段, 关系类型（None 表示取 relation 字段）, 属性)
+AI_RELATION_SPECS = (
+    ('character_relationships', 'from', 'to', None, (('description', str), ('strength', str))),
+    ('event_relationships', 'character', 'event', 'PARTICIPATES_IN', (('role', str), ('description', str))),
+    ('location_relationships', 'event', 'location', 'OCCURS_IN', (('description', str),)),
+)
+
+
 class KnowledgeGraphExtractor:
     """知识图谱提取器"""
 
@@ -44,12 +336,10 @@ class KnowledgeGraphExtractor:
         """初始化提取器"""
         self.ai_manager = get_ai_manager()
 
-        # 提取提示词模板
+        # 提取提示词模板：静态的说明与 JSON 结构在前，章节标题/内容放在末尾，
+        # 同一模板的所有章节请求共享完全相同的前缀，可命中服务商的提示词前缀缓存
         self.extraction_prompts = {
-            'entities': """请从以下小说章节中提取人物、地点、组织等实体信息。
-
-章节标题：{title}
-章节内容：{content}
+            'entities': """请从文末给出的小说章节中提取人物、地点、组织等实体信息。
 
 请按以下JSON格式输出：
 {{
@@ -91,12 +381,12 @@ class KnowledgeGraphExtractor:
 1. 对于人物，请根据其在章节中的重要性、出场频次、情节推动作用等因素，判断其可能是主角的概率
 2. protagonist_score为0-100的整数，表示该人物是主角的可能性（100表示很可能是主角，0表示不太可能）
 3. 只有protagonist_score >= 80的人物才标记is_protagonist为true
-4. 只提取在本章节中明确出现的实体，确保信息准确。""",
-
-            'protagonist_analysis': """请分析以下小说章节，重点识别可能的主角人物。
+4. 只提取在本章节中明确出现的实体，确保信息准确。
 
 章节标题：{title}
-章节内容：{content}
+章节内容：{content}""",
+
+            'protagonist_analysis': """请分析文末给出的小说章节，重点识别可能的主角人物。
 
 请按以下JSON格式输出主角分析结果：
 {{
@@ -122,12 +412,12 @@ class KnowledgeGraphExtractor:
 - 80-89分：很可能是主角（重要视角人物，情节围绕其展开）
 - 60-79分：可能是重要角色（有一定篇幅，但不确定是否为主角）
 - 40-59分：配角（有名字有对话，但作用有限）
-- 0-39分：龙套角色（仅仅提及或简单出场）""",
-
-            'relationships': """请从以下小说章节中提取人物关系和事件关系。
+- 0-39分：龙套角色（仅仅提及或简单出场）
 
 章节标题：{title}
-章节内容：{content}
+章节内容：{content}""",
+
+            'relationships': """请从文末给出的小说章节中提取人物关系和事件关系。
 
 请按以下JSON格式输出：
 {{
@@ -157,11 +447,183 @@ class KnowledgeGraphExtractor:
     ]
 }}
 
-只提取在本章节中明确体现的关系。"""
+只提取在本章节中明确体现的关系。
+
+章节标题：{title}
+章节内容：{content}""",
+
+            # 合并提示词：一次调用同时返回实体、关系与主角分析，失败时回退到上面的分步提示词
+            'combined': """请从文末给出的小说章节中一次性提取实体、关系，并分析可能的主角人物。
+
+请按以下JSON格式输出（三个部分缺一不可，没有内容的列表输出空数组）：
+{{
+    "entities": {{
+        "characters": [
+            {{
+                "name": "人物名称",
+                "description": "简短描述",
+                "traits": ["性格特点1", "性格特点2"],
+                "title": "称号或职位",
+                "is_protagonist": false,
+                "protagonist_score": 0
+            }}
+        ],
+        "locations": [
+            {{"name": "地点名称", "description": "地点描述", "type": "地点类型"}}
+        ],
+        "organizations": [
+            {{"name": "组织名称", "description": "组织描述", "type": "组织类型"}}
+        ],
+        "events": [
+            {{
+                "name": "事件名称",
+                "description": "事件描述",
+                "importance": "重要程度",
+                "participants": ["参与者1", "参与者2"]
+            }}
+        ]
+    }},
+    "relationships": {{
+        "character_relationships": [
+            {{
+                "from": "人物A",
+                "to": "人物B",
+                "relation": "FRIEND|ENEMY|LOVES|HATES|KNOWS|LEADS|FOLLOWS",
+                "description": "关系描述",
+                "strength": "强度(1-10)"
+            }}
+        ],
+        "event_relationships": [
+            {{"character": "人物名称", "event": "事件名称", "role": "参与角色", "description": "参与描述"}}
+        ],
+        "location_relationships": [
+            {{"event": "事件名称", "location": "地点名称", "description": "位置关系描述"}}
+        ]
+    }},
+    "protagonist": {{
+        "protagonist_candidates": [
+            {{
+                "name": "人物名称",
+                "score": 85,
+                "reasons": ["第一人称视角叙述", "情节围绕其展开"],
+                "evidence": ["具体的文本证据1"]
+            }}
+        ],
+        "narrative_perspective": "第一人称/第三人称有限/第三人称全知",
+        "chapter_focus": "本章主要关注的人物和事件"
+    }}
+}}
+
+注意：
+1. protagonist_score 与 score 为0-100的整数，表示该人物是主角的可能性；只有 >= 80 的人物才标记is_protagonist为true
+2. 评分参考：90-100几乎确定是主角，80-89很可能是主角，60-79重要角色，40-59配角，0-39龙套
+3. 只提取在本章节中明确出现的实体和明确体现的关系，确保信息准确；关系与事件中的人物名称需与entities中一致。
+
+章节标题：{title}
+章节内容：{content}"""
         }
 
-    def extract_from_chapter(self, chapter_id: int, use_ai: bool = True, config_id: int = None) -> Tuple[List[ExtractedEntity], List[ExtractedRelation]]:
-        """从章节提取知识图谱数据"""
+        # 预编译模板：静态前缀直接缓存为字符串，章节部分拆成字面量与占位符，生成提示词时只做拼接
+        self._compiled_prompts = {}
+        for kind, template in self.extraction_prompts.items():
+            split_at = template.index(CHAPTER_PROMPT_MARKER)
+            prefix_literals, _ = _split_template(template[:split_at])
+            self._compiled_prompts[kind] = (''.join(prefix_literals),) + _split_template(template[split_at:])
+
+    def _build_prompt(self, kind: str, chapter: Chapter, ai_config: Dict,
+                      content: Optional[str] = None) -> Tuple[str, str]:
+        """按模板生成章节提示词；content 为空时使用截断到 max_content_length 的章节内容
+
+        Returns:
+            (prompt, prefix)：prefix 为不含章节内容的静态前缀，随请求传给服务商用于前缀缓存
+        """
+        prefix, literals, slots = self._compiled_prompts[kind]
+        suffix = _render_template(literals, slots, {
+            'title': chapter.title,
+            'content': chapter.content[:ai_config['max_content_length']] if content is None else content,
+        })
+        return prefix + suffix, prefix
+
+    def _generate_parsed(self, kind: str, chapter: Chapter, ai_config: Dict,
+                         content: Optional[str] = None, **kwargs) -> Tuple[bool, Optional[Dict], Optional[str]]:
+        """按模板调用 AI 并解析 JSON，优先读取按提示词内容哈希缓存的结果
+
+        Returns:
+            (called_ok, data, cache_key)：called_ok 表示调用成功或命中缓存；data 为解析后的字典（解析失败或不符合 Schema 时为 None）；
+            cache_key 为本次新响应的缓存键（命中缓存时为 None）。是否写入缓存由调用方在转换出有效结果后决定，
+            避免空结果或无效响应被缓存后重跑任务时一直重放。
+        """
+        prompt, prefix = self._build_prompt(kind, chapter, ai_config, content)
+        cache_key = kg_response_cache.make_key(kind, ai_config.get('model_name'), prompt)
+        cached = kg_response_cache.get(cache_key)
+        if cached is not None:
+            logger.debug(f"命中AI响应缓存: kind={kind}, chapter_id={chapter.id}")
+            return True, cached, None
+
+        result = self.ai_manager.generate_response(
+            prompt=prompt,
+            provider_name=ai_config['provider_name'],
+            model_name=ai_config['model_name'],
+            cache_prefix=prefix,
+            **kwargs
+        )
+        if not result or not result.get('success'):
+            return False, None, None
+
+        data = self._parse_ai_response(result['response'])
+        error = validation_error(kind, data) if data is not None else None
+        if error:
+            data = self._retry_invalid_response(kind, chapter, ai_config, prompt, prefix, error, **kwargs)
+        return True, data, cache_key
+
+    @staticmethod
+    def _cache_response(cache_key: Optional[str], data: Optional[Dict], has_result: bool):
+        """仅缓存转换出有效实体/关系的新响应"""
+        if cache_key and has_result and isinstance(data, dict):
+            kg_response_cache.set(cache_key, data)
+
+    def _retry_invalid_response(self, kind: str, chapter: Chapter, ai_config: Dict, prompt: str, prefix: str,
+                                error: str, **kwargs) -> Optional[Dict]:
+        """响应不符合 Schema 时要求 AI 修正一次，仍不合格返回 None（丢弃，避免写入错误数据）"""
+        logger.warning(f"AI响应不符合格式要求: kind={kind}, chapter_id={chapter.id}, 错误: {error}")
+        if not SCHEMA_RETRY_ENABLED:
+            return None
+        result = self.ai_manager.generate_response(
+            prompt=prompt + SCHEMA_FIX_NOTE.format(error=error),
+            provider_name=ai_config['provider_name'],
+            model_name=ai_config['model_name'],
+            cache_prefix=prefix,
+            **kwargs
+        )
+        if not result or not result.get('success'):
+            return None
+        data = self._parse_ai_response(result['response'])
+        error = validation_error(kind, data) if data is not None else None
+        if error:
+            logger.warning(f"修正后的AI响应仍不符合格式要求，丢弃: kind={kind}, chapter_id={chapter.id}, 错误: {error}")
+            return None
+        return data
+
+    def _resolve_ai_config(self, config=None) -> Dict[str, Any]:
+        """解析AI配置；未配置模型时使用服务商的第一个模型"""
+        ai_config = kg_config_service.get_ai_config(config)
+        if not ai_config.get('model_name') and ai_config.get('provider_name'):
+            try:
+                provider = db_service.get_ai_provider_by_name(ai_config.get('provider_name'))
+                if provider and provider.models:
+                    # 动态为当前提取过程指定默认模型
+                    ai_config['model_name'] = provider.models[0]
+            except Exception:
+                pass
+        return ai_config
+
+    def extract_from_chapter(self, chapter_id: int, use_ai: bool = True, config_id: int = None,
+                             resolved_ai_config: Optional[Dict[str, Any]] = None) -> Tuple[List[ExtractedEntity], List[ExtractedRelation]]:
+        """从章节提取知识图谱数据（按ID查询章节）
+
+        Args:
+            resolved_ai_config: 调用方已解析好的AI配置（同一任务内各章节复用）；为空时在此解析
+        """
         try:
             # 获取章节数据
             with db_manager.get_session() as session:
@@ -170,69 +632,68 @@ class KnowledgeGraphExtractor:
                     if not chapter:
                         logger.error(f"章节不存在: {chapter_id}")
                         return [], []
+                    return self._extract_from_chapter_obj(chapter, use_ai, config_id, resolved_ai_config)
+                except Exception as e:
+                    session.rollback()
+                    raise
+
+        except Exception as e:
+            # 对 Provider 暂停的情况，向上抛出，交由上层处理（不要在这里吞掉）
+            if 'provider_suspended' in str(e):
+                raise
+            logger.error(f"章节知识图谱提取失败: {e}")
+            return [], []
 
-                    logger.info(f"开始提取章节知识图谱: {chapter.title}")
+    def _extract_from_chapter_obj(self, chapter: Chapter, use_ai: bool = True, config_id: int = None,
+                                  resolved_ai_config: Optional[Dict[str, Any]] = None) -> Tuple[List[ExtractedEntity], List[ExtractedRelation]]:
+        """从已加载的章节对象提取知识图谱数据（任务中章节已批量查询，不再按ID逐个查询）"""
+        try:
+            logger.info(f"开始提取章节知识图谱: {chapter.title}")
 
-                    # 检查章节内容是否为空或过短
-                    if not chapter.content or len(chapter.content.strip()) < 10:
-                        logger.warning(f"章节内容为空或过短，跳过提取: {chapter.title}")
-                        return [], []
+            # 检查章节内容是否为空或过短
+            if not chapter.content or len(chapter.content.strip()) < 10:
+                logger.warning(f"章节内容为空或过短，跳过提取: {chapter.title}")
+                return [], []
 
-                    # 获取配置
-                    from ..services.kg_config_service import kg_config_service
-                    config = None
-                    if config_id:
-                        config = kg_config_service.get_config_by_id(config_id)
-                    if not config:
-                        config = kg_config_service.get_default_config()
+            # 获取配置
+            config = None
+            if config_id:
+                config = kg_config_service.get_config_by_id(config_id)
+            if not config:
+                config = kg_config_service.get_default_config()
 
-                    entities = []
-                    relations = []
+            entities = []
+            relations = []
 
-                    if use_ai and self.ai_manager:
-                        # 若Provider暂停，立刻中断，交由上层处理（避免将章节误标为失败）
-                        try:
-                            from ..services.kg_config_service import kg_config_service
-                            ai_cfg_check = kg_config_service.get_ai_config(config)
-                            from ..services.ai_provider_throttle import is_suspended as _is_suspended
-                            if ai_cfg_check.get('provider_name') and _is_suspended(ai_cfg_check.get('provider_name')):
-                                logger.warning(f"Provider 暂停中，跳过章节提取: provider={ai_cfg_check.get('provider_name')}, chapter_id={chapter_id}")
-                                # 通过抛出特定异常通知上层逻辑暂停任务并回退章节状态
-                                raise RuntimeError('provider_suspended')
-                        except RuntimeError:
-                            raise
-                        except Exception:
-                            # 覆盖失败时不影响正常流程
-                            pass
-                        # 使用AI提取
-                        # 若模型未配置，尝试用provider的第一个模型作为默认模型
-                        try:
-                            from ..services.kg_config_service import kg_config_service
-                            ai_cfg = kg_config_service.get_ai_config(config)
-                            if not ai_cfg.get('model_name'):
-                                from src.services.database_service import db_service
-                                provider = db_service.get_ai_provider_by_name(ai_cfg.get('provider_name'))
-                                if provider and provider.models:
-                                    # 动态为当前提取过程指定默认模型
-                                    config.ai_model = provider.models[0]
-                        except Exception:
-                            pass
-
-                        ai_entities, ai_relations = self._extract_with_ai(chapter, config)
-                        entities.extend(ai_entities)
-                        relations.extend(ai_relations)
-                        # 注意：不再回退到规则提取。AI为空即视为失败，由上层处理失败逻辑。
-                    else:
-                        # 使用规则提取
-                        rule_entities, rule_relations = self._extract_with_rules(chapter, config)
-                        entities.extend(rule_entities)
-                        relations.extend(rule_relations)
+            if use_ai and self.ai_manager:
+                # AI配置每章节只解析一次（含默认模型），后续检查与提取复用
+                ai_config = resolved_ai_config or self._resolve_ai_config(config)
 
-                    logger.info(f"提取完成 - 实体: {len(entities)}, 关系: {len(relations)}")
-                    return entities, relations
-                except Exception as e:
-                    session.rollback()
+                # 若Provider暂停，立刻中断，交由上层处理（避免将章节误标为失败）
+                try:
+                    if ai_config.get('provider_name') and is_suspended(ai_config.get('provider_name')):
+                        logger.warning(f"Provider 暂停中，跳过章节提取: provider={ai_config.get('provider_name')}, chapter_id={chapter.id}")
+                        # 通过抛出特定异常通知上层逻辑暂停任务并回退章节状态
+                        raise RuntimeError('provider_suspended')
+                except RuntimeError:
                     raise
+                except Exception:
+                    # 覆盖失败时不影响正常流程
+                    pass
+
+                # 使用AI提取
+                ai_entities, ai_relations = self._extract_with_ai(chapter, config, ai_config=ai_config)
+                entities.extend(ai_entities)
+                relations.extend(ai_relations)
+                # 注意：不再回退到规则提取。AI为空即视为失败，由上层处理失败逻辑。
+            else:
+                # 使用规则提取
+                rule_entities, rule_relations = self._extract_with_rules(chapter, config)
+                entities.extend(rule_entities)
+                relations.extend(rule_relations)
+
+            logger.info(f"提取完成 - 实体: {len(entities)}, 关系: {len(relations)}")
+            return entities, relations
 
         except Exception as e:
             # 对 Provider 暂停的情况，向上抛出，交由上层处理（不要在这里吞掉）
@@ -241,7 +702,8 @@ class KnowledgeGraphExtractor:
             logger.error(f"章节知识图谱提取失败: {e}")
             return [], []
 
-    def _extract_with_ai(self, chapter: Chapter, config=None) -> Tuple[List[ExtractedEntity], List[ExtractedRelation]]:
+    def _extract_with_ai(self, chapter: Chapter, config=None,
+                         ai_config: Optional[Dict[str, Any]] = None) -> Tuple[List[ExtractedEntity], List[ExtractedRelation]]:
         """使用AI提取知识图谱数据"""
         entities = []
         relations = []
@@ -253,64 +715,40 @@ class KnowledgeGraphExtractor:
                 return entities, relations
 
             # 获取配置
-            from ..services.kg_config_service import kg_config_service
-            ai_config = kg_config_service.get_ai_config(config)
-            
+            if ai_config is None:
+                ai_config = self._resolve_ai_config(config)
+
             if not ai_config['use_ai'] or not ai_config['provider_name']:
                 logger.info("AI提取未启用或未配置AI服务商，跳过AI提取")
                 return entities, relations
 
-            # 提取实体
-            entity_prompt = self.extraction_prompts['entities'].format(
-                title=chapter.title,
-                content=chapter.content[:ai_config['max_content_length']]
-            )
-
-            entity_result = self.ai_manager.generate_response(
-                prompt=entity_prompt,
-                provider_name=ai_config['provider_name'],
-                model_name=ai_config['model_name']
-            )
-
-            if entity_result and entity_result.get('success'):
-                entity_data = self._parse_ai_response(entity_result['response'])
-                if entity_data:
-                    entities.extend(self._convert_ai_entities(entity_data, chapter, config))
-
-            # 进行额外的主角分析（如果有人物实体）
-            if any(e.entity_type == 'character' for e in entities):
-                protagonist_data = self._analyze_protagonist(chapter, ai_config)
-                if protagonist_data:
-                    self._merge_protagonist_analysis(entities, protagonist_data)
-
-            # 提取关系
-            relation_prompt = self.extraction_prompts['relationships'].format(
-                title=chapter.title,
-                content=chapter.content[:ai_config['max_content_length']]
-            )
-
-            relation_result = self.ai_manager.generate_response(
-                prompt=relation_prompt,
-                provider_name=ai_config['provider_name'],
-                model_name=ai_config['model_name']
-            )
-
-            if relation_result and relation_result.get('success'):
-                relation_data = self._parse_ai_response(relation_result['response'])
-                if relation_data:
-                    relations.extend(self._convert_ai_relations(relation_data, chapter, config))
+            # 超长章节切分为多个窗口并发提取后合并，避免截断丢失章节尾部
+            content = chapter.content or ''
+            spans = _split_content(content, ai_config['max_content_length'], CHUNK_OVERLAP)
+            if len(spans) == 1:
+                # 传入已确定的内容，合并提取及回退后的各步提示词共用同一字符串，不再各自截断
+                return self._extract_span(chapter, ai_config, config, spans[0])
+
+            logger.info(f"章节内容过长，切分为 {len(spans)} 段提取: chapter_id={chapter.id}, 长度={len(content)}")
+            if CHUNK_PARALLELISM > 1:
+                with ThreadPoolExecutor(max_workers=min(len(spans), CHUNK_PARALLELISM),
+                                        thread_name_prefix=f"KG-Chunk-{chapter.id}") as pool:
+                    results = list(pool.map(lambda span: self._extract_span(chapter, ai_config, config, span), spans))
+            else:
+                results = [self._extract_span(chapter, ai_config, config, span) for span in spans]
+            # 任一分段没有提取结果（调用失败或响应无效）时整章按失败处理，避免部分内容未提取却标记为完成
+            empty_spans = [i for i, (span_entities, span_relations) in enumerate(results)
+                           if not span_entities and not span_relations]
+            if empty_spans:
+                logger.warning(f"章节分段提取结果为空，整章按失败处理: chapter_id={chapter.id}, 分段={empty_spans}/{len(spans)}")
+                return [], []
+            entities, relations = self._merge_chunk_results(results)
 
         except Exception as e:
             logger.error(f"AI提取失败: {e}")
             # 记录服务商失败次数用于节流/暂停
             try:
-                from ..services.ai_provider_throttle import increment_failure
-                provider_name = None
-                try:
-                    from ..services.kg_config_service import kg_config_service
-                    provider_name = kg_config_service.get_ai_config(config).get('provider_name')
-                except Exception:
-                    provider_name = None
+                provider_name = (ai_config or {}).get('provider_name')
                 if provider_name:
                     increment_failure(provider_name)
             except Exception:
@@ -318,6 +756,112 @@ class KnowledgeGraphExtractor:
 
         return entities, relations
 
+    def _extract_span(self, chapter: Chapter, ai_config: Dict, config=None,
+                      content: Optional[str] = None) -> Tuple[List[ExtractedEntity], List[ExtractedRelation]]:
+        """对章节（或其中一段内容）执行 AI 提取，异常由调用方处理"""
+        # 优先一次调用完成实体/关系/主角分析；合并响应不可用时回退到分步提取
+        if COMBINED_EXTRACTION_ENABLED:
+            combined = self._extract_combined(chapter, ai_config, config, content)
+            if combined is not None:
+                return combined
+            logger.info(f"合并提取未返回有效结果，回退到分步提取: chapter_id={chapter.id}")
+
+        entities = []
+        relations = []
+
+        # 提取实体
+        _, entity_data, cache_key = self._generate_parsed('entities', chapter, ai_config, content=content)
+        if entity_data:
+            entities.extend(self._convert_ai_entities(entity_data, chapter, config))
+            self._cache_response(cache_key, entity_data, bool(entities))
+
+        # 进行额外的主角分析（如果有人物实体）
+        if any(e.entity_type == 'character' for e in entities):
+            protagonist_data = self._analyze_protagonist(chapter, ai_config, content)
+            if protagonist_data:
+                self._merge_protagonist_analysis(entities, protagonist_data)
+
+        # 提取关系
+        _, relation_data, cache_key = self._generate_parsed('relationships', chapter, ai_config, content=content)
+        if relation_data:
+            relations.extend(self._convert_ai_relations(relation_data, chapter, config))
+            self._cache_response(cache_key, relation_data, bool(relations))
+
+        return entities, relations
+
+    @staticmethod
+    def _merge_chunk_results(results: List[Tuple[List[ExtractedEntity], List[ExtractedRelation]]]
+                             ) -> Tuple[List[ExtractedEntity], List[ExtractedRelation]]:
+        """合并各分段的提取结果
+
+        实体按 (类型, 小写名称) 去重：保留主角评分最高的一组主角属性，traits 取并集；
+        关系按 (起点, 终点, 类型) 去重。properties['source_chunks'] 记录来源分段序号。
+        """
+        protagonist_keys = ('protagonist_score', 'is_protagonist', 'protagonist_reasons', 'protagonist_evidence')
+        merged_entities: Dict[Tuple[str, str], ExtractedEntity] = {}
+        merged_relations: Dict[Tuple[str, str, str], ExtractedRelation] = {}
+
+        for index, (entities, relations) in enumerate(results):
+            for entity in entities:
+                key = (entity.entity_type, entity.name.lower())
+                existing = merged_entities.get(key)
+                if existing is None:
+                    entity.properties['source_chunks'] = [index]
+                    merged_entities[key] = entity
+                    continue
+                props = existing.properties
+                if index not in props['source_chunks']:
+                    props['source_chunks'].append(index)
+                if _as_score(entity.properties.get('protagonist_score')) > _as_score(props.get('protagonist_score')):
+                    for k in protagonist_keys:
+                        if k in entity.properties:
+                            props[k] = entity.properties[k]
+                if isinstance(props.get('traits'), list) and isinstance(entity.properties.get('traits'), list):
+                    props['traits'] += [t for t in entity.properties['traits'] if t not in props['traits']]
+                if not props.get('description') and entity.properties.get('description'):
+                    props['description'] = entity.properties['description']
+
+            for relation in relations:
+                key = (relation.from_entity, relation.to_entity, relation.relation_type)
+                existing = merged_relations.get(key)
+                if existing is None:
+                    relation.properties['source_chunks'] = [index]
+                    merged_relations[key] = relation
+                elif index not in existing.properties['source_chunks']:
+                    existing.properties['source_chunks'].append(index)
+
+        return list(merged_entities.values()), list(merged_relations.values())
+
+    def _extract_combined(self, chapter: Chapter, ai_config: Dict, config=None,
+                          content: Optional[str] = None) -> Optional[Tuple[List[ExtractedEntity], List[ExtractedRelation]]]:
+        """使用合并提示词一次调用提取实体、关系与主角分析
+
+        Returns:
+            (entities, relations)；调用本身失败时返回空结果（不再用分步提示词重复请求同一服务商），
+            响应缺少 entities/relationships 部分（如输出被截断）时返回 None，由调用方回退到分步提取
+        """
+        called_ok, data, cache_key = self._generate_parsed(
+            'combined', chapter, ai_config,
+            content=content,
+            max_tokens=COMBINED_MAX_TOKENS
+        )
+        if not called_ok:
+            return [], []
+        if not isinstance(data, dict):
+            return None
+        entity_data = data.get('entities')
+        relation_data = data.get('relationships')
+        if not isinstance(entity_data, dict) or not isinstance(relation_data, dict):
+            return None
+
+        entities = self._convert_ai_entities(entity_data, chapter, config)
+        relations = self._convert_ai_relations(relation_data, chapter, config)
+        self._cache_response(cache_key, data, bool(entities or relations))
+        protagonist_data = data.get('protagonist')
+        if isinstance(protagonist_data, dict) and any(e.entity_type == 'character' for e in entities):
+            self._merge_protagonist_analysis(entities, protagonist_data)
+        return entities, relations
+
     def _extract_with_rules(self, chapter: Chapter, config=None) -> Tuple[List[ExtractedEntity], List[ExtractedRelation]]:
         """使用规则提取知识图谱数据"""
         entities = []
@@ -327,7 +871,6 @@ class KnowledgeGraphExtractor:
             content = chapter.content
             
             # 获取规则配置
-            from ..services.kg_config_service import kg_config_service
             rule_config = kg_config_service.get_rule_config(config)
 
             # 简单的人物名提取（中文姓名模式）
@@ -339,22 +882,23 @@ class KnowledgeGraphExtractor:
             ])
 
             characters = set()
-            for pattern in character_patterns:
-                matches = re.findall(pattern, content)
-                characters.update(matches)
+            for regex in _compile_rule_patterns(tuple(character_patterns)):
+                characters.update(regex.findall(content))
 
             # 过滤常见词汇
-            filter_words = set(rule_config.get('filter_words', [
+            filter_words = _frozen_words(tuple(rule_config.get('filter_words', [
                 '什么', '这样', '那样', '如何', '怎么', '为何', '哪里', '这里', '那里'
-            ]))
+            ])))
             characters = {char for char in characters if char not in filter_words and len(char) >= 2}
 
-            # 创建人物实体
-            for char_name in characters:
+            # 按出现次数排序创建人物实体，出现次数记入 mention_count 供后续主角排序参考
+            mentions = _count_mentions(characters, content)
+            for char_name in sorted(characters, key=lambda name: mentions.get(name, 0), reverse=True):
                 entity = ExtractedEntity(
                     name=char_name,
                     entity_type='character',
-                    properties={'extracted_by': 'rule', 'confidence': 0.7},
+                    properties={'extracted_by': 'rule', 'confidence': 0.7,
+                                'mention_count': mentions.get(char_name, 0)},
                     chapter_id=chapter.id,
                     novel_id=chapter.novel_id
                 )
@@ -367,9 +911,8 @@ class KnowledgeGraphExtractor:
             ])
 
             locations = set()
-            for pattern in location_patterns:
-                matches = re.findall(pattern, content)
-                locations.update(matches)
+            for regex in _compile_rule_patterns(tuple(location_patterns)):
+                locations.update(regex.findall(content))
 
             # 创建地点实体
             for loc_name in locations:
@@ -390,16 +933,22 @@ class KnowledgeGraphExtractor:
     def _parse_ai_response(self, response_text: str) -> Optional[Dict]:
         """解析AI响应的JSON数据"""
         try:
-            # 尝试提取JSON部分
+            # 单次扫描定位第一个完整的 JSON 对象（跳过字符串内的括号），避免对象后的说明文字干扰
+            json_str = _first_json_object(response_text)
+            if json_str is not None:
+                try:
+                    return json_loads(json_str)
+                except json.JSONDecodeError:
+                    pass
+
+            # 回退：取第一个 '{' 到最后一个 '}' 之间的内容
             json_start = response_text.find('{')
             json_end = response_text.rfind('}') + 1
-
             if json_start >= 0 and json_end > json_start:
-                json_str = response_text[json_start:json_end]
-                return json.loads(json_str)
+                return json_loads(response_text[json_start:json_end])
 
             # 如果没有找到JSON，尝试直接解析整个响应
-            return json.loads(response_text)
+            return json_loads(response_text)
 
         except json.JSONDecodeError as e:
             logger.error(f"JSON解析失败: {e}, 响应内容: {response_text[:500]}")
@@ -408,75 +957,15 @@ class KnowledgeGraphExtractor:
     def _convert_ai_entities(self, data: Dict, chapter: Chapter, config=None) -> List[ExtractedEntity]:
         """转换AI提取的实体数据"""
         entities = []
+        chapter_id, novel_id = chapter.id, chapter.novel_id
 
         try:
-            # 转换人物
-            for char_data in data.get('characters', []):
-                entity = ExtractedEntity(
-                    name=char_data['name'],
-                    entity_type='character',
-                    properties={
-                        'description': char_data.get('description', ''),
-                        'traits': char_data.get('traits', []),
-                        'title': char_data.get('title', ''),
-                        'is_protagonist': char_data.get('is_protagonist', False),
-                        'protagonist_score': char_data.get('protagonist_score', 0),
-                        'extracted_by': 'ai',
-                        'confidence': 0.9
-                    },
-                    chapter_id=chapter.id,
-                    novel_id=chapter.novel_id
-                )
-                entities.append(entity)
-
-            # 转换地点
-            for loc_data in data.get('locations', []):
-                entity = ExtractedEntity(
-                    name=loc_data['name'],
-                    entity_type='location',
-                    properties={
-                        'description': loc_data.get('description', ''),
-                        'type': loc_data.get('type', ''),
-                        'extracted_by': 'ai',
-                        'confidence': 0.9
-                    },
-                    chapter_id=chapter.id,
-                    novel_id=chapter.novel_id
-                )
-                entities.append(entity)
-
-            # 转换组织
-            for org_data in data.get('organizations', []):
-                entity = ExtractedEntity(
-                    name=org_data['name'],
-                    entity_type='organization',
-                    properties={
-                        'description': org_data.get('description', ''),
-                        'type': org_data.get('type', ''),
-                        'extracted_by': 'ai',
-                        'confidence': 0.9
-                    },
-                    chapter_id=chapter.id,
-                    novel_id=chapter.novel_id
-                )
-                entities.append(entity)
-
-            # 转换事件
-            for event_data in data.get('events', []):
-                entity = ExtractedEntity(
-                    name=event_data['name'],
-                    entity_type='event',
-                    properties={
-                        'description': event_data.get('description', ''),
-                        'importance': event_data.get('importance', ''),
-                        'participants': event_data.get('participants', []),
-                        'extracted_by': 'ai',
-                        'confidence': 0.9
-                    },
-                    chapter_id=chapter.id,
-                    novel_id=chapter.novel_id
-                )
-                entities.append(entity)
+            for section, entity_type, fields in AI_ENTITY_SPECS:
+                for item in data.get(section) or ():
+                    properties = {key: item[key] if key in item else default() for key, default in fields}
+                    properties['extracted_by'] = 'ai'
+                    properties['confidence'] = 0.9
+                    entities.append(ExtractedEntity(item['name'], entity_type, properties, chapter_id, novel_id))
 
         except Exception as e:
             logger.error(f"转换AI实体数据失败: {e}")
@@ -486,57 +975,18 @@ class KnowledgeGraphExtractor:
     def _convert_ai_relations(self, data: Dict, chapter: Chapter, config=None) -> List[ExtractedRelation]:
         """转换AI提取的关系数据"""
         relations = []
+        chapter_id, novel_id = chapter.id, chapter.novel_id
 
         try:
-            # 转换人物关系
-            for rel_data in data.get('character_relationships', []):
-                relation = ExtractedRelation(
-                    from_entity=rel_data['from'],
-                    to_entity=rel_data['to'],
-                    relation_type=rel_data['relation'],
-                    properties={
-                        'description': rel_data.get('description', ''),
-                        'strength': rel_data.get('strength', ''),
-                        'extracted_by': 'ai',
-                        'confidence': 0.9
-                    },
-                    chapter_id=chapter.id,
-                    novel_id=chapter.novel_id
-                )
-                relations.append(relation)
-
-            # 转换事件关系
-            for rel_data in data.get('event_relationships', []):
-                relation = ExtractedRelation(
-                    from_entity=rel_data['character'],
-                    to_entity=rel_data['event'],
-                    relation_type='PARTICIPATES_IN',
-                    properties={
-                        'role': rel_data.get('role', ''),
-                        'description': rel_data.get('description', ''),
-                        'extracted_by': 'ai',
-                        'confidence': 0.9
-                    },
-                    chapter_id=chapter.id,
-                    novel_id=chapter.novel_id
-                )
-                relations.append(relation)
-
-            # 转换位置关系
-            for rel_data in data.get('location_relationships', []):
-                relation = ExtractedRelation(
-                    from_entity=rel_data['event'],
-                    to_entity=rel_data['location'],
-                    relation_type='OCCURS_IN',
-                    properties={
-                        'description': rel_data.get('description', ''),
-                        'extracted_by': 'ai',
-                        'confidence': 0.9
-                    },
-                    chapter_id=chapter.id,
-                    novel_id=chapter.novel_id
-                )
-                relations.append(relation)
+            for section, from_key, to_key, relation_type, fields in AI_RELATION_SPECS:
+                for item in data.get(section) or ():
+                    properties = {key: item[key] if key in item else default() for key, default in fields}
+                    properties['extracted_by'] = 'ai'
+                    properties['confidence'] = 0.9
+                    relations.append(ExtractedRelation(
+                        item[from_key], item[to_key], relation_type or item['relation'],
+                        properties, chapter_id, novel_id
+                    ))
 
         except Exception as e:
             logger.error(f"转换AI关系数据失败: {e}")
@@ -546,7 +996,6 @@ class KnowledgeGraphExtractor:
     def create_knowledge_graph_task(self, novel_id: int, chapter_ids: List[int] = None,
                                    use_ai: bool = True, task_name: str = None) -> Dict:
         """创建知识图谱构建任务"""
-        from ..services.knowledge_graph_task_service import kg_task_service
 
         return kg_task_service.create_task(
             novel_id=novel_id,
@@ -557,7 +1006,6 @@ class KnowledgeGraphExtractor:
 
     def build_knowledge_graph_with_task(self, task_id: int) -> bool:
         """基于任务构建知识图谱（支持断点续传）"""
-        from ..services.knowledge_graph_task_service import kg_task_service
 
         try:
             # 原子性地尝试启动任务（解决并发竞态条件）
@@ -579,13 +1027,13 @@ class KnowledgeGraphExtractor:
             pending_chapter_ids = kg_task_service.get_pending_chapters(task_id)
             if not pending_chapter_ids:
                 logger.info(f"任务 {task_id} 没有待处理的章节，检查任务完成状态")
-                # 检查是否真正完成（所有章节都成功）
-                if kg_task_service.is_task_fully_completed(task_id):
+                # 检查是否真正完成（所有章节都成功），一次查询同时得到失败时记录的章节统计
+                completion_status = kg_task_service.get_task_completion_status(task_id)
+                if completion_status.get('should_be_completed'):
                     kg_task_service.update_task_status(task_id, 'completed')
                     logger.info(f"任务 {task_id} 已完成：所有章节都成功处理")
                 else:
                     # 有失败的章节，标记任务为失败
-                    completion_status = kg_task_service.get_task_completion_status(task_id)
                     kg_task_service.update_task_status(task_id, 'failed')
                     logger.warning(f"任务 {task_id} 标记为失败：未完成章节统计 {completion_status}")
                 return True
@@ -613,6 +1061,7 @@ class KnowledgeGraphExtractor:
             novel_id = task_info['novel_id']
             use_ai = task_info['use_ai']
 
+            executor = None
             with db_manager.get_session() as session:
                 try:
                     # 获取小说信息
@@ -635,9 +1084,42 @@ class KnowledgeGraphExtractor:
                     total_entities = 0
                     total_relations = 0
 
+                    # 章节提取（LLM 调用）可并发预取；状态更新与 Neo4j 写入仍在当前线程按章节顺序执行
+                    max_parallel = MAX_PARALLEL_CHAPTERS
+                    if max_parallel > 1:
+                        executor = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix=f"KG-Extract-{task_id}")
+                    extract_futures = {}
+
+                    # AI配置在任务内不变，只解析一次供各章节复用
+                    resolved_ai_config = None
+                    if use_ai:
+                        try:
+                            resolved_ai_config = self._resolve_ai_config(None)
+                        except Exception as e:
+                            logger.warning(f"解析AI配置失败，章节提取时重新解析: {e}")
+                    provider_name = (resolved_ai_config or {}).get('provider_name')
+
+                    # 任务内人物名称归一化，以图谱中已有的人物名称为初始规范名称（任务结束即释放）
+                    canonicalizer = None
+                    if CANONICALIZE_ENABLED:
+                        try:
+                            known_names = kg_service.get_character_names_by_novel(novel.id)
+                        except Exception as e:
+                            logger.warning(f"加载已有人物名称失败，从空名称表开始归一化: {e}")
+                            known_names = []
+                        canonicalizer = NameCanonicalizer(known_names)
+
+                    # 内容完全相同的章节（转载的重复章节、重跑的样板内容）只提取一次；
+                    # 只缓存内容在本任务中出现多次的章节结果，任务结束即释放
+                    content_hashes = {c.id: hashlib.sha256((c.content or '').encode('utf-8')).hexdigest() for c in chapters}
+                    repeated_hashes = {h for h, n in Counter(content_hashes.values()).items() if n > 1}
+                    seen_content: Dict[str, Tuple[List[ExtractedEntity], List[ExtractedRelation]]] = {}
+                    # 本任务已保存到 Redis 的失败数据键，Neo4j 不稳定时同一数据不重复保存
+                    failed_keys: Set[Tuple] = set()
+
                     for i, chapter in enumerate(chapters):
                         # 检查任务状态，支持暂停
-                        current_task = kg_task_service.get_task(task_id)
+                        current_task = kg_task_service.get_task_progress(task_id)
                         if current_task and current_task['status'] == 'paused':
                             logger.info(f"任务 {task_id} 已暂停")
                             return True
@@ -646,13 +1128,10 @@ class KnowledgeGraphExtractor:
                             logger.debug(f"开始处理章节 {i+1}/{len(chapters)} - 小说: {novel.title}, 章节号 {chapter.chapter_number} (ID {chapter.id}), 标题: {chapter.title}")
 
                             # 在切换章节前检查 Provider 是否暂停：若暂停则回退并中止任务
-                            if use_ai:
+                            if use_ai and provider_name:
                                 try:
-                                    from ..services.kg_config_service import kg_config_service
-                                    ai_cfg_loop = kg_config_service.get_ai_config(None)
-                                    from ..services.ai_provider_throttle import is_suspended as _is_suspended
-                                    if ai_cfg_loop.get('provider_name') and _is_suspended(ai_cfg_loop.get('provider_name')):
-                                        logger.warning(f"Provider 暂停中，暂停任务 {task_id}，保留未处理章节: provider={ai_cfg_loop.get('provider_name')}")
+                                    if is_suspended(provider_name):
+                                        logger.warning(f"Provider 暂停中，暂停任务 {task_id}，保留未处理章节: provider={provider_name}")
                                         # 不更新章节为running，直接将任务置为paused并退出
                                         kg_task_service.update_task_status(task_id, 'paused')
                                         return True
@@ -673,8 +1152,32 @@ class KnowledgeGraphExtractor:
                             )
 
                             # 提取实体和关系
+                            content_hash = content_hashes[chapter.id]
                             try:
-                                entities, relations = self.extract_from_chapter(chapter.id, use_ai)
+                                if content_hash in seen_content:
+                                    entities, relations = self._copy_for_chapter(seen_content[content_hash], chapter)
+                                    logger.info(f"章节内容与本任务已提取章节相同，复用提取结果: chapter_id={chapter.id}")
+                                elif executor is not None:
+                                    # 提交当前章节及其后 max_parallel-1 个章节的提取，取回当前章节结果；
+                                    # 内容与正在提取的章节相同的不重复提交，轮到该章节时复用先提取章节的结果
+                                    inflight_hashes = {content_hashes[cid] for cid in extract_futures}
+                                    for ahead in chapters[i:i + max_parallel]:
+                                        ahead_hash = content_hashes[ahead.id]
+                                        if ahead.id in extract_futures or ahead_hash in seen_content or ahead_hash in inflight_hashes:
+                                            continue
+                                        extract_futures[ahead.id] = executor.submit(
+                                            self._extract_from_chapter_obj, ahead, use_ai, None, resolved_ai_config
+                                        )
+                                        inflight_hashes.add(ahead_hash)
+                                    future = extract_futures.pop(chapter.id, None)
+                                    if future is None:
+                                        # 相同内容的先提取章节没有得到结果（未写入 seen_content），由本章节自行提取
+                                        future = executor.submit(self._extract_from_chapter_obj, chapter, use_ai, None, resolved_ai_config)
+                                    entities, relations = future.result()
+                                else:
+                                    entities, relations = self._extract_from_chapter_obj(
+                                        chapter, use_ai, resolved_ai_config=resolved_ai_config
+                                    )
                             except Exception as e:
                                 if 'provider_suspended' in str(e):
                                     # 回退章节状态为pending，不计入失败；暂停任务等待恢复
@@ -694,11 +1197,7 @@ class KnowledgeGraphExtractor:
                                     f"AI提取结果为空，标记章节失败（不回退规则） - 小说: {novel.title}, 章节号 {chapter.chapter_number} (ID {chapter.id})"
                                 )
                                 try:
-                                    from ..services.ai_provider_throttle import increment_failure
-                                    from ..services.kg_config_service import kg_config_service
-                                    # 尝试获取当前配置的服务商名称并记录失败
-                                    ai_cfg = kg_config_service.get_ai_config(None)
-                                    provider_name = ai_cfg.get('provider_name') if ai_cfg else None
+                                    # 记录当前配置的服务商失败
                                     if provider_name:
                                         increment_failure(provider_name)
                                 except Exception:
@@ -709,6 +1208,12 @@ class KnowledgeGraphExtractor:
                                 )
                                 continue
 
+                            if content_hash in repeated_hashes and content_hash not in seen_content:
+                                seen_content[content_hash] = self._copy_for_chapter((entities, relations), chapter)
+
+                            if canonicalizer is not None:
+                                canonicalizer.apply(entities, relations)
+
                             # 尝试创建实体和关系（可能失败）
                             neo4j_success = False
                             chapter_entities = 0
@@ -716,7 +1221,7 @@ class KnowledgeGraphExtractor:
 
                             try:
                                 chapter_entities, chapter_relations = self._create_entities_and_relations(
-                                    entities, relations, kg_service, task_id
+                                    entities, relations, kg_service, task_id, failed_keys
                                 )
                                 neo4j_success = True
                                 total_entities += chapter_entities
@@ -756,23 +1261,25 @@ class KnowledgeGraphExtractor:
                             )
                             continue
 
-                        # 每处理5个章节进行一次垃圾回收
+                        # 每处理5个章节回收一次年轻代；完整回收耗时与存活对象数成正比，按批次间隔或内存压力触发
                         if (i + 1) % batch_size == 0:
-                            gc.collect()
+                            gc.collect(0)
+                            if (i + 1) % (batch_size * FULL_GC_EVERY_BATCHES) == 0 or _rss_high():
+                                gc.collect()
                             logger.info(f"小说: {novel.title} 已处理 {i+1} 个章节")
 
                     # 检查是否所有章节都处理完成
                     remaining_pending = kg_task_service.get_pending_chapters(task_id)
                     if not remaining_pending:
-                        # 检查是否真正完成（所有章节都成功）
-                        if kg_task_service.is_task_fully_completed(task_id):
+                        # 检查是否真正完成（所有章节都成功），一次查询同时得到失败时记录的章节统计
+                        completion_status = kg_task_service.get_task_completion_status(task_id)
+                        if completion_status.get('should_be_completed'):
                             kg_task_service.update_task_status(
                                 task_id, 'completed', total_entities, total_relations
                             )
                             logger.info(f"任务 {task_id} 完成，总实体: {total_entities}, 总关系: {total_relations}")
                         else:
                             # 有失败的章节，标记任务为失败
-                            completion_status = kg_task_service.get_task_completion_status(task_id)
                             kg_task_service.update_task_status(task_id, 'failed')
                             logger.warning(f"任务 {task_id} 标记为失败：章节完成情况 {completion_status}")
                     else:
@@ -783,18 +1290,120 @@ class KnowledgeGraphExtractor:
                 except Exception as e:
                     session.rollback()
                     raise
+                finally:
+                    # 暂停/中断时丢弃尚未开始的预取
+                    if executor is not None:
+                        executor.shutdown(wait=False, cancel_futures=True)
 
         except Exception as e:
             logger.error(f"构建知识图谱任务失败: {e}")
             kg_task_service.update_task_status(task_id, 'failed')
             return False
 
-    def _create_entities_and_relations(self, entities: List, relations: List, kg_service, task_id: int = None) -> Tuple[int, int]:
-        """创建实体和关系，返回创建的数量"""
+    @staticmethod
+    def _copy_for_chapter(result: Tuple[List[ExtractedEntity], List[ExtractedRelation]],
+                          chapter: Chapter) -> Tuple[List[ExtractedEntity], List[ExtractedRelation]]:
+        """复制提取结果并改写为指定章节（属性深拷贝，后续归一化等原地修改互不影响）"""
+        entities, relations = result
+        return (
+            [replace(e, properties=copy.deepcopy(e.properties), chapter_id=chapter.id, novel_id=chapter.novel_id)
+             for e in entities],
+            [replace(r, properties=copy.deepcopy(r.properties), chapter_id=chapter.id, novel_id=chapter.novel_id)
+             for r in relations],
+        )
+
+    def _create_entities_and_relations(self, entities: List, relations: List, kg_service, task_id: int = None,
+                                       failed_keys: Optional[Set[Tuple]] = None) -> Tuple[int, int]:
+        """创建实体和关系，返回创建的数量
+
+        按实体类型 / 关系类型分组，每组一条 UNWIND 语句，整章在同一写事务中提交；
+        批量写入失败时回退为逐条写入，以便定位并记录具体失败的数据。
+        """
+        if not entities and not relations:
+            return 0, 0
+        try:
+            statements = self._build_batch_statements(entities, relations, kg_service, task_id)
+            kg_service.execute_write_batch(statements)
+            return len(entities), len(relations)
+        except Exception as e:
+            logger.warning(f"批量写入Neo4j失败，回退逐条写入: 实体{len(entities)}个, 关系{len(relations)}个, 错误: {e}")
+        return self._create_entities_and_relations_one_by_one(entities, relations, kg_service, task_id, failed_keys)
+
+    def _build_batch_statements(self, entities: List, relations: List, kg_service, task_id: int = None) -> List[Tuple[str, Dict]]:
+        """将一章的实体与关系分组为 UNWIND 语句（先节点后关系）"""
+        sanitize = kg_service.sanitize_properties
+        # 按节点的合并键去重：同一节点多次出现时合并属性（与逐行 SET += 的结果一致），每个节点只 MERGE 一次
+        node_rows = {'character': {}, 'location': {}, 'organization': {}}
+        event_rows = {}
+        for entity in entities:
+            props = sanitize(entity.properties)
+            if entity.entity_type in node_rows:
+                rows = node_rows[entity.entity_type]
+                key = (entity.name, entity.novel_id)
+                if key in rows:
+                    merged = rows[key]['properties']
+                    aliases = merged.get('aliases')
+                    merged.update(props)
+                    # 别称取并集（同一章节内多个称呼归一化到同一人物）
+                    if aliases and props.get('aliases'):
+                        merged['aliases'] = aliases + [a for a in props['aliases'] if a not in aliases]
+                else:
+                    rows[key] = {'name': entity.name, 'novel_id': entity.novel_id, 'properties': props}
+            elif entity.entity_type == 'event':
+                event_id = _event_id(entity.novel_id, entity.chapter_id, entity.name)
+                if event_id in event_rows:
+                    event_rows[event_id]['properties'].update(props)
+                else:
+                    event_rows[event_id] = {
+                        'event_id': event_id,
+                        'name': entity.name,
+                        'chapter_id': entity.chapter_id,
+                        'novel_id': entity.novel_id,
+                        'properties': props,
+                    }
+
+        relation_rows = defaultdict(list)
+        for relation in relations:
+            relation_type = relation.relation_type
+            props = sanitize({'novel_id': relation.novel_id, **relation.properties})
+            if relation_type in CHARACTER_RELATION_TYPES:
+                key = ('Character', 'name', 'Character', 'name', relation_type)
+                row = {'from': relation.from_entity, 'to': relation.to_entity}
+            elif relation_type == 'PARTICIPATES_IN':
+                key = ('Character', 'name', 'Event', 'id', relation_type)
+                row = {'from': relation.from_entity, 'to': _event_id(relation.novel_id, relation.chapter_id, relation.to_entity)}
+            elif relation_type == 'OCCURS_IN':
+                key = ('Event', 'id', 'Location', 'name', relation_type)
+                row = {'from': _event_id(relation.novel_id, relation.chapter_id, relation.from_entity), 'to': relation.to_entity}
+            else:
+                continue
+            row['novel_id'] = relation.novel_id
+            row['properties'] = props
+            relation_rows[key].append(row)
+
+        statements = [
+            kg_service.build_named_nodes_statement(label, list(node_rows[entity_type].values()), task_id)
+            for entity_type, label in (('character', 'Character'), ('location', 'Location'), ('organization', 'Organization'))
+            if node_rows[entity_type]
+        ]
+        if event_rows:
+            statements.append(kg_service.build_events_statement(list(event_rows.values()), task_id))
+        for key, rows in relation_rows.items():
+            statements.append(kg_service.build_relationships_statement(*key, rows))
+        return statements
+
+    def _create_entities_and_relations_one_by_one(self, entities: List, relations: List, kg_service, task_id: int = None,
+                                                  failed_keys: Optional[Set[Tuple]] = None) -> Tuple[int, int]:
+        """逐条创建实体和关系，失败的数据保存到 Redis，返回创建的数量
+
+        failed_keys 记录已保存的失败数据键（由调用方按任务传入），同一数据重复失败时只保存一次。
+        """
         from ..services.neo4j_failed_data_service import neo4j_failed_data_service
 
         entity_count = 0
         relation_count = 0
+        if failed_keys is None:
+            failed_keys = set()
 
         # 创建实体
         for entity in entities:
@@ -806,12 +1415,15 @@ class KnowledgeGraphExtractor:
                 elif entity.entity_type == 'organization':
                     kg_service.create_organization(entity.name, entity.novel_id, task_id=task_id, **entity.properties)
                 elif entity.entity_type == 'event':
-                    name_hash = hashlib.md5(entity.name.encode('utf-8')).hexdigest()[:8]
-                    event_id = f"{entity.novel_id}_{entity.chapter_id}_{name_hash}"
+                    event_id = _event_id(entity.novel_id, entity.chapter_id, entity.name)
                     kg_service.create_event(event_id, entity.name, entity.chapter_id, entity.novel_id, task_id=task_id, **entity.properties)
                 entity_count += 1
             except Exception as e:
                 logger.error(f"创建实体失败: {entity.name}, 错误: {e}")
+                failed_key = ('entity', entity.entity_type, entity.name, entity.novel_id, getattr(entity, 'chapter_id', None))
+                if failed_key in failed_keys:
+                    continue
+                failed_keys.add(failed_key)
                 # 保存失败的实体到Redis
                 entity_data = {
                     'type': entity.entity_type,
@@ -827,26 +1439,29 @@ class KnowledgeGraphExtractor:
         for relation in relations:
             try:
                 relation_type = relation.relation_type
-                if relation_type in ['FRIEND', 'ENEMY', 'LOVES', 'HATES', 'KNOWS', 'LEADS', 'FOLLOWS']:
+                if relation_type in CHARACTER_RELATION_TYPES:
                     kg_service.character_relationship(
                         relation.from_entity, relation.to_entity, relation_type,
                         relation.novel_id, **relation.properties
                     )
                 elif relation_type == 'PARTICIPATES_IN':
-                    name_hash = hashlib.md5(relation.to_entity.encode('utf-8')).hexdigest()[:8]
-                    event_id = f"{relation.novel_id}_{relation.chapter_id}_{name_hash}"
+                    event_id = _event_id(relation.novel_id, relation.chapter_id, relation.to_entity)
                     kg_service.character_participates_in_event(
                         relation.from_entity, event_id, relation.novel_id, **relation.properties
                     )
                 elif relation_type == 'OCCURS_IN':
-                    name_hash = hashlib.md5(relation.from_entity.encode('utf-8')).hexdigest()[:8]
-                    event_id = f"{relation.novel_id}_{relation.chapter_id}_{name_hash}"
+                    event_id = _event_id(relation.novel_id, relation.chapter_id, relation.from_entity)
                     kg_service.event_occurs_in_location(
                         event_id, relation.to_entity, relation.novel_id, **relation.properties
                     )
                 relation_count += 1
             except Exception as e:
                 logger.error(f"创建关系失败: {relation.from_entity} -> {relation.to_entity}, 错误: {e}")
+                failed_key = ('relation', relation_type, relation.from_entity, relation.to_entity,
+                              relation.novel_id, getattr(relation, 'chapter_id', None))
+                if failed_key in failed_keys:
+                    continue
+                failed_keys.add(failed_key)
                 # 保存失败的关系到Redis
                 relation_data = {
                     'type': relation_type,
@@ -862,45 +1477,12 @@ class KnowledgeGraphExtractor:
         return entity_count, relation_count
 
     def _send_progress_update(self, task_id: int, task_info: Dict):
-        """发送进度更新（通过 Redis 转发到主进程统一推送），避免直接依赖 Flask 上下文"""
+        """发送进度更新：只把任务ID放入队列，由后台线程查询进度并发布，不阻塞章节处理"""
         try:
-            # 获取最新的任务信息
-            from ..services.knowledge_graph_task_service import kg_task_service
-            updated_task = kg_task_service.get_task(task_id)
-            if not updated_task:
-                return
-
-            # 计算进度
-            progress = 0
-            if updated_task['total_chapters'] > 0:
-                progress = round((updated_task['completed_chapters'] / updated_task['total_chapters']) * 100, 1)
-
-            # 仅经由 Redis Pub/Sub 转发到主进程，再由主进程统一 emit 到 SocketIO
-            try:
-                from src.utils.redis_client import get_redis_client
-                from src.services.chapter_write_worker import PROGRESS_CHANNEL
-                redis_client = get_redis_client()
-            except Exception:
-                redis_client = None
-
-            if redis_client:
-                event_data = {
-                    'type': 'kg_task_progress',
-                    'task_id': task_id,
-                    'status': updated_task['status'],
-                    'progress': progress,
-                    'completed_chapters': updated_task['completed_chapters'],
-                    'failed_chapters': updated_task['failed_chapters'],
-                    'total_chapters': updated_task['total_chapters'],
-                    'updated_at': updated_task['updated_at']
-                }
-                redis_client.publish(PROGRESS_CHANNEL, event_data)
-                # 降低日志级别为调试，避免刷屏
-                logger.debug(f"已发布任务进度事件到Redis: 任务{task_id}, 进度{progress}%")
-
-        except Exception as e:
-            # 保守处理：不因进度推送失败影响任务主流程
-            logger.debug(f"进度推送跳过/失败（不影响主流程）: {e}")
+            _get_progress_queue().put_nowait(task_id)
+        except queue.Full:
+            # 积压过多时丢弃本次通知，后续推送会带上最新进度
+            logger.debug(f"进度推送队列已满，跳过本次通知: 任务{task_id}")
 
     def build_knowledge_graph(self, novel_id: int, chapter_ids: List[int] = None, use_ai: bool = True) -> bool:
         """构建小说知识图谱"""
@@ -925,32 +1507,29 @@ class KnowledgeGraphExtractor:
                     # 创建小说节点
                     kg_service.create_novel_node(novel.id, novel.title, novel.author)
 
-                    # 获取要处理的章节
+                    # 先只查询章节ID，再按批短查询加载章节内容：不一次性加载全部章节，
+                    # 也不在耗时的 AI 调用期间保持服务端游标（MySQL 会因 net_write_timeout 断开流式查询）
+                    id_query = session.query(Chapter.id).filter(Chapter.novel_id == novel_id)
                     if chapter_ids:
-                        chapters = session.query(Chapter).filter(
-                            Chapter.novel_id == novel_id,
-                            Chapter.id.in_(chapter_ids)
-                        ).all()
-                    else:
-                        chapters = session.query(Chapter).filter_by(novel_id=novel_id).all()
-
-                    logger.info(f"开始构建知识图谱，小说: {novel.title}, 章节数: {len(chapters)}")
+                        id_query = id_query.filter(Chapter.id.in_(chapter_ids))
+                    all_chapter_ids = [row[0] for row in id_query.order_by(Chapter.id)]
+                    total_chapters = len(all_chapter_ids)
 
-                    # 存储所有提取的实体和关系
-                    all_entities = []
-                    all_relations = []
+                    logger.info(f"开始构建知识图谱，小说: {novel.title}, 章节数: {total_chapters}")
 
-                    # 分批处理章节，避免内存问题
+                    # 每批章节提取完成后立即写入并清空，内存占用不随小说长度增长
                     batch_size = 10  # 每批处理10个章节
-                    total_batches = (len(chapters) + batch_size - 1) // batch_size
+                    total_batches = (total_chapters + batch_size - 1) // batch_size
+                    entity_stats = {'character': 0, 'location': 0, 'organization': 0, 'event': 0}
+                    relation_stats = {}
 
-                    for batch_idx in range(0, len(chapters), batch_size):
-                        batch_chapters = chapters[batch_idx:batch_idx + batch_size]
-                        current_batch = batch_idx // batch_size + 1
-                        logger.info(f"处理第 {current_batch}/{total_batches} 批章节 ({len(batch_chapters)}个)")
+                    for batch_index, start in enumerate(range(0, total_chapters, batch_size), 1):
+                        batch_ids = all_chapter_ids[start:start + batch_size]
+                        chapters = session.query(Chapter).filter(Chapter.id.in_(batch_ids)).order_by(Chapter.id).all()
+                        batch_entities = []
+                        batch_relations = []
 
-                        # 逐章节提取
-                        for chapter in batch_chapters:
+                        for chapter in chapters:
                             # 创建章节节点
                             kg_service.create_chapter_node(
                                 chapter.id,
@@ -962,91 +1541,19 @@ class KnowledgeGraphExtractor:
                             )
 
                             # 提取实体和关系
-                            entities, relations = self.extract_from_chapter(chapter.id, use_ai)
-                            all_entities.extend(entities)
-                            all_relations.extend(relations)
-
-                        # 批次间强制垃圾回收，释放内存
+                            entities, relations = self._extract_from_chapter_obj(chapter, use_ai)
+                            batch_entities.extend(entities)
+                            batch_relations.extend(relations)
+
+                        self._write_chapter_batch(batch_entities, batch_relations, kg_service, novel_id,
+                                                  entity_stats, relation_stats)
+                        logger.info(f"第 {batch_index}/{total_batches} 批处理完成，"
+                                    f"已写入 {sum(entity_stats.values())} 个实体")
+                        # 释放本批章节对象（含章节内容），批次间强制垃圾回收
+                        for chapter in chapters:
+                            session.expunge(chapter)
+                        del chapters, batch_entities, batch_relations
                         gc.collect()
-                        logger.info(f"第 {current_batch} 批处理完成，已处理 {len(all_entities)} 个实体")
-
-                    # 创建实体节点并建立基础关系
-                    entity_stats = {'character': 0, 'location': 0, 'organization': 0, 'event': 0}
-                    character_chapter_map = {}  # 记录人物在哪些章节出现
-
-                    for entity in all_entities:
-                        try:
-                            if entity.entity_type == 'character':
-                                kg_service.create_character(entity.name, entity.novel_id, **entity.properties)
-                                entity_stats['character'] += 1
-
-                                # 记录人物出现的章节
-                                if entity.name not in character_chapter_map:
-                                    character_chapter_map[entity.name] = set()
-                                character_chapter_map[entity.name].add(entity.chapter_id)
-
-                            elif entity.entity_type == 'location':
-                                kg_service.create_location(entity.name, entity.novel_id, **entity.properties)
-                                entity_stats['location'] += 1
-                            elif entity.entity_type == 'organization':
-                                kg_service.create_organization(entity.name, entity.novel_id, **entity.properties)
-                                entity_stats['organization'] += 1
-                            elif entity.entity_type == 'event':
-                                # 使用更稳定的ID生成方式
-                                name_hash = hashlib.md5(entity.name.encode('utf-8')).hexdigest()[:8]
-                                event_id = f"{entity.novel_id}_{entity.chapter_id}_{name_hash}"
-                                kg_service.create_event(event_id, entity.name, entity.chapter_id, entity.novel_id, **entity.properties)
-                                entity_stats['event'] += 1
-                        except Exception as e:
-                            logger.error(f"创建实体失败: {entity.name}, 错误: {e}")
-
-                    # 创建人物出现在章节的关系
-                    for character_name, chapter_ids in character_chapter_map.items():
-                        for chapter_id in chapter_ids:
-                            try:
-                                kg_service.character_appears_in_chapter(character_name, chapter_id, novel_id)
-                            except Exception as e:
-                                logger.error(f"创建人物章节关系失败: {character_name} -> 章节ID {chapter_id}, 错误: {e}")
-
-                    # 创建关系
-                    relation_stats = {}
-                    for relation in all_relations:
-                        try:
-                            relation_type = relation.relation_type
-
-                            if relation_type in ['FRIEND', 'ENEMY', 'LOVES', 'HATES', 'KNOWS', 'LEADS', 'FOLLOWS']:
-                                # 人物关系
-                                kg_service.character_relationship(
-                                    relation.from_entity,
-                                    relation.to_entity,
-                                    relation_type,
-                                    relation.novel_id,
-                                    **relation.properties
-                                )
-                            elif relation_type == 'PARTICIPATES_IN':
-                                # 人物参与事件
-                                name_hash = hashlib.md5(relation.to_entity.encode('utf-8')).hexdigest()[:8]
-                                event_id = f"{relation.novel_id}_{relation.chapter_id}_{name_hash}"
-                                kg_service.character_participates_in_event(
-                                    relation.from_entity,
-                                    event_id,
-                                    relation.novel_id,
-                                    **relation.properties
-                                )
-                            elif relation_type == 'OCCURS_IN':
-                                # 事件发生在地点
-                                name_hash = hashlib.md5(relation.from_entity.encode('utf-8')).hexdigest()[:8]
-                                event_id = f"{relation.novel_id}_{relation.chapter_id}_{name_hash}"
-                                kg_service.event_occurs_in_location(
-                                    event_id,
-                                    relation.to_entity,
-                                    relation.novel_id,
-                                    **relation.properties
-                                )
-
-                            relation_stats[relation_type] = relation_stats.get(relation_type, 0) + 1
-                        except Exception as e:
-                            logger.error(f"创建关系失败: {relation.from_entity} -> {relation.to_entity}, 错误: {e}")
 
                     logger.info(f"知识图谱构建完成")
                     logger.info(f"实体统计: {entity_stats}")
@@ -1061,27 +1568,57 @@ class KnowledgeGraphExtractor:
             logger.error(f"构建知识图谱失败: {e}")
             return False
 
-    def _analyze_protagonist(self, chapter: Chapter, ai_config: Dict) -> Optional[Dict]:
+    def _write_chapter_batch(self, entities: List[ExtractedEntity], relations: List[ExtractedRelation], kg_service,
+                             novel_id: int, entity_stats: Dict[str, int], relation_stats: Dict[str, int]):
+        """按章节分组批量写入一批章节的实体与关系，累加统计
+
+        先写入各章节的实体（连同人物出现在章节的关系），再写入关系，保证批内跨章节引用的实体在建立关系时已存在；
+        每章每个阶段一个写事务。
+        """
+        entity_groups: Dict[int, List[ExtractedEntity]] = defaultdict(list)
+        relation_groups: Dict[int, List[ExtractedRelation]] = defaultdict(list)
+        for entity in entities:
+            entity_groups[entity.chapter_id].append(entity)
+        for relation in relations:
+            relation_groups[relation.chapter_id].append(relation)
+
+        for chapter_id, chapter_entities in entity_groups.items():
+            try:
+                statements = self._build_batch_statements(chapter_entities, [], kg_service)
+                appears_rows = [
+                    {'name': name, 'novel_id': novel_id, 'chapter_id': chapter_id}
+                    for name in {e.name for e in chapter_entities if e.entity_type == 'character'}
+                ]
+                if appears_rows:
+                    statements.append(kg_service.build_character_appearances_statement(appears_rows))
+                kg_service.execute_write_batch(statements)
+            except Exception as e:
+                logger.error(f"批量创建实体失败: 章节ID {chapter_id}, 实体{len(chapter_entities)}个, 错误: {e}")
+                continue
+            for entity_type, count in Counter(e.entity_type for e in chapter_entities).items():
+                if entity_type in entity_stats:
+                    entity_stats[entity_type] += count
+
+        for chapter_id, chapter_relations in relation_groups.items():
+            try:
+                kg_service.execute_write_batch(self._build_batch_statements([], chapter_relations, kg_service))
+            except Exception as e:
+                logger.error(f"批量创建关系失败: 章节ID {chapter_id}, 关系{len(chapter_relations)}个, 错误: {e}")
+                continue
+            for relation_type, count in Counter(r.relation_type for r in chapter_relations).items():
+                relation_stats[relation_type] = relation_stats.get(relation_type, 0) + count
+
+    def _analyze_protagonist(self, chapter: Chapter, ai_config: Dict, content: Optional[str] = None) -> Optional[Dict]:
         """使用AI进行主角分析"""
         try:
             if not self.ai_manager:
                 return None
 
-            # 构建主角分析提示词
-            protagonist_prompt = self.extraction_prompts['protagonist_analysis'].format(
-                title=chapter.title,
-                content=chapter.content[:ai_config['max_content_length']]
-            )
-
-            # 调用AI分析
-            result = self.ai_manager.generate_response(
-                prompt=protagonist_prompt,
-                provider_name=ai_config['provider_name'],
-                model_name=ai_config['model_name']
-            )
-
-            if result and result.get('success'):
-                return self._parse_ai_response(result['response'])
+            # 调用AI分析（有主角候选人时按提示词内容缓存）
+            _, data, cache_key = self._generate_parsed('protagonist_analysis', chapter, ai_config, content=content)
+            if isinstance(data, dict):
+                self._cache_response(cache_key, data, bool(data.get('protagonist_candidates')))
+            return data
 
         except Exception as e:
             logger.error(f"主角分析失败: {e}")
@@ -1092,26 +1629,28 @@ class KnowledgeGraphExtractor:
         """将主角分析结果合并到实体中"""
         try:
             protagonist_candidates = protagonist_data.get('protagonist_candidates', [])
-            
+
+            # 人物名称索引（同名时取第一个），候选人按名称直接查找
+            character_index = {}
+            for entity in entities:
+                if entity.entity_type == 'character':
+                    character_index.setdefault(entity.name, entity)
+
             # 为每个主角候选人更新对应的人物实体
             for candidate in protagonist_candidates:
-                candidate_name = candidate.get('name', '')
-                candidate_score = candidate.get('score', 0)
-                
-                # 找到对应的人物实体
-                for entity in entities:
-                    if (entity.entity_type == 'character' and 
-                        entity.name == candidate_name):
-                        
-                        # 更新主角相关属性
-                        current_score = entity.properties.get('protagonist_score', 0)
-                        # 取最高分数
-                        if candidate_score > current_score:
-                            entity.properties['protagonist_score'] = candidate_score
-                            entity.properties['is_protagonist'] = candidate_score >= 80
-                            entity.properties['protagonist_reasons'] = candidate.get('reasons', [])
-                            entity.properties['protagonist_evidence'] = candidate.get('evidence', [])
-                        break
+                entity = character_index.get(candidate.get('name', ''))
+                if entity is None:
+                    continue
+                candidate_score = _as_score(candidate.get('score'))
+
+                # 更新主角相关属性
+                current_score = _as_score(entity.properties.get('protagonist_score'))
+                # 取最高分数
+                if candidate_score > current_score:
+                    entity.properties['protagonist_score'] = candidate_score
+                    entity.properties['is_protagonist'] = candidate_score >= 80
+                    entity.properties['protagonist_reasons'] = candidate.get('reasons', [])
+                    entity.properties['protagonist_evidence'] = candidate.get('evidence', [])
             
             # 记录章节的叙述视角信息
             narrative_perspective = protagonist_data.get('narrative_perspective', '')
@@ -1122,7 +1661,12 @@ class KnowledgeGraphExtractor:
             logger.error(f"合并主角分析结果失败: {e}")
 
     def get_novel_protagonists(self, novel_id: int) -> List[Dict]:
-        """获取小说的主角列表（基于所有章节的分析结果）"""
+        """获取小说的主角列表（基于所有章节的分析结果，带 PROTAGONIST_CACHE_TTL 秒的进程内缓存）"""
+        cached = _protagonist_cache.get(novel_id)
+        if cached and cached[0] > time.monotonic():
+            # 返回副本，调用方修改结果不影响缓存
+            return copy.deepcopy(cached[1])
+
         try:
             from ..services.knowledge_graph_service import get_kg_service
             kg_service = get_kg_service()
@@ -1130,32 +1674,38 @@ class KnowledgeGraphExtractor:
             if not kg_service:
                 return []
 
-            with kg_service.driver.session() as session:
-                # 查询所有被标记为主角的人物
-                query = """
-                MATCH (c:Character {novel_id: $novel_id})
-                WHERE c.is_protagonist = true OR c.protagonist_score >= 80
-                RETURN c.name as name, 
-                       c.protagonist_score as score,
-                       c.description as description,
-                       c.protagonist_reasons as reasons,
-                       c.traits as traits
-                ORDER BY c.protagonist_score DESC
-                """
-                
-                result = session.run(query, novel_id=novel_id)
-                
-                protagonists = []
-                for record in result:
-                    protagonists.append({
+            # 查询所有被标记为主角的人物
+            query = """
+            MATCH (c:Character {novel_id: $novel_id})
+            WHERE c.is_protagonist = true OR c.protagonist_score >= 80
+            RETURN c.name as name, 
+                   c.protagonist_score as score,
+                   c.description as description,
+                   c.protagonist_reasons as reasons,
+                   c.traits as traits
+            ORDER BY c.protagonist_score DESC
+            """
+
+            def _read_protagonists(tx):
+                return [
+                    {
                         'name': record['name'],
                         'score': record['score'] or 0,
                         'description': record['description'] or '',
                         'reasons': record['reasons'] or [],
                         'traits': record['traits'] or []
-                    })
-                
-                return protagonists
+                    }
+                    for record in tx.run(query, novel_id=novel_id)
+                ]
+
+            # 读事务：集群部署时可路由到只读副本，瞬时错误由驱动自动重试
+            with kg_service.driver.session() as session:
+                protagonists = session.execute_read(_read_protagonists)
+
+            if len(_protagonist_cache) >= PROTAGONIST_CACHE_SIZE:
+                _protagonist_cache.clear()
+            _protagonist_cache[novel_id] = (time.monotonic() + PROTAGONIST_CACHE_TTL, protagonists)
+            return copy.deepcopy(protagonists)
 
         except Exception as e:
             logger.error(f"获取小说主角失败: {e}")
@@ -1176,5 +1726,12 @@ def get_kg_extractor():
             _kg_extractor = None
     return _kg_extractor
 
-# 向后兼容的属性访问
-kg_extractor = property(lambda self: get_kg_extractor())
+
+def __getattr__(name: str):
+    """向后兼容的模块属性 kg_extractor：访问时返回惰性创建的单例（PEP 562）
+
+    原先的 kg_extractor = property(...) 只在类中生效，模块级访问得到的是 property 对象本身。
+    """
+    if name == 'kg_extractor':
+        return get_kg_extractor()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,16 +2,45 @@
 知识图谱服务模块
 用于管理小说人物、事件的知识图谱
 """
+import json
 import logging
 import os
 import time
-from functools import wraps
+from functools import lru_cache, wraps
 from typing import Dict, List, Any, Optional, Tuple
 from neo4j import GraphDatabase, exceptions
 from neo4j.exceptions import ServiceUnavailable
 
 logger = logging.getLogger(__name__)
 
+# 批量写入允许的节点标签与关系类型：二者无法作为参数传入，只能拼入语句文本，因此按白名单校验
+BATCH_NODE_LABELS = frozenset(('Character', 'Location', 'Organization', 'Event', 'Chapter'))
+BATCH_RELATIONSHIP_TYPES = frozenset((
+    'FRIEND', 'ENEMY', 'LOVES', 'HATES', 'KNOWS', 'LEADS', 'FOLLOWS',
+    'PARTICIPATES_IN', 'OCCURS_IN', 'APPEARS_IN',
+))
+
+
+@lru_cache(maxsize=64)
+def _relationship_query(from_label: str, from_property: str, to_label: str, to_property: str,
+                        relationship_type: str) -> str:
+    """按端点与关系类型生成批量关系语句（同一组合的语句文本固定，可复用 Neo4j 查询计划缓存）"""
+    if from_label not in BATCH_NODE_LABELS or to_label not in BATCH_NODE_LABELS:
+        raise ValueError(f"不支持的节点标签: {from_label} -> {to_label}")
+    if relationship_type not in BATCH_RELATIONSHIP_TYPES:
+        raise ValueError(f"不支持的关系类型: {relationship_type}")
+    # 按名称匹配的端点同时匹配 novel_id
+    from_match = f"{from_property}: row.from" + (", novel_id: row.novel_id" if from_property == 'name' else "")
+    to_match = f"{to_property}: row.to" + (", novel_id: row.novel_id" if to_property == 'name' else "")
+    return f"""
+        UNWIND $rows AS row
+        MATCH (a:{from_label} {{{from_match}}})
+        MATCH (b:{to_label} {{{to_match}}})
+        MERGE (a)-[r:{relationship_type}]->(b)
+        SET r += row.properties
+        SET r.created_at = datetime()
+        """
+
 
 def retry_on_defunct_connection(max_retries=2, delay=0.5):
     """装饰器：当遇到defunct连接时自动重试"""
@@ -178,6 +207,8 @@ class KnowledgeGraphService:
 
     def create_character(self, name: str, novel_id: int, task_id: int = None, **properties) -> Dict:
         """创建人物节点"""
+        aliases = properties.pop('aliases', None) or []
+
         def _create_character_operation():
             query = """
             MERGE (c:Character {name: $name, novel_id: $novel_id})
@@ -185,6 +216,7 @@ class KnowledgeGraphService:
             SET c.created_at = datetime()
             SET c.updated_at = datetime()
             """
+            query += self._ALIASES_APPEND.format(v='c', aliases='$aliases')
             
             # 如果提供了task_id，将其添加到节点属性中
             if task_id is not None:
@@ -197,7 +229,8 @@ class KnowledgeGraphService:
             query += " RETURN c"
 
             with self.driver.session() as session:
-                result = session.run(query, name=name, novel_id=novel_id, task_id=task_id, properties=properties)
+                result = session.run(query, name=name, novel_id=novel_id, task_id=task_id,
+                                     properties=properties, aliases=aliases)
                 record = result.single()
                 if record:
                     return dict(record['c'])
@@ -387,11 +420,20 @@ class KnowledgeGraphService:
     def create_relationship(self, from_label: str, from_property: str, from_value: Any,
                           to_label: str, to_property: str, to_value: Any,
                           relationship_type: str, **properties) -> bool:
-        """创建关系"""
+        """创建关系
+
+        properties 包含 novel_id 时，按名称匹配的端点（人物 / 地点 / 组织）同时匹配 novel_id，
+        与批量写入（build_relationships_statement）一致，不会连到其他小说的同名节点。
+        """
+        novel_id = properties.get('novel_id')
+        scope = ", novel_id: $novel_id" if novel_id is not None else ""
+        from_match = f"{from_property}: $from_value" + (scope if from_property == 'name' else "")
+        to_match = f"{to_property}: $to_value" + (scope if to_property == 'name' else "")
+
         def _create_relationship_operation():
             query = f"""
-            MATCH (a:{from_label} {{{from_property}: $from_value}})
-            MATCH (b:{to_label} {{{to_property}: $to_value}})
+            MATCH (a:{from_label} {{{from_match}}})
+            MATCH (b:{to_label} {{{to_match}}})
             MERGE (a)-[r:{relationship_type}]->(b)
             SET r += $properties
             SET r.created_at = datetime()
@@ -402,6 +444,7 @@ class KnowledgeGraphService:
                 result = session.run(query,
                                    from_value=from_value,
                                    to_value=to_value,
+                                   novel_id=novel_id,
                                    properties=properties)
                 return result.single() is not None
 
@@ -465,6 +508,147 @@ class KnowledgeGraphService:
             **properties
         )
 
+    # === 批量写入方法 ===
+
+    # 追加 task_id 到节点的 task_id 列表（去重），{v} 为节点变量名
+    _TASK_ID_APPEND = """
+    SET {v}.task_id = CASE WHEN {v}.task_id IS NULL THEN [$task_id]
+                        WHEN NOT $task_id IN {v}.task_id THEN {v}.task_id + [$task_id]
+                        ELSE {v}.task_id END
+    """
+
+    # 合并人物别称列表（去重）：别称按章节累积，不能随 SET += 整体覆盖；{v} 为节点变量名，{aliases} 为别称列表表达式
+    _ALIASES_APPEND = """
+    SET {v}.aliases = CASE WHEN size({aliases}) = 0 THEN {v}.aliases
+                        ELSE coalesce({v}.aliases, []) + [a IN {aliases} WHERE NOT a IN coalesce({v}.aliases, [])] END
+    """
+
+    @staticmethod
+    def sanitize_properties(properties: Optional[Dict]) -> Dict:
+        """清洗属性：Neo4j 只接受基本类型及其列表，其余值序列化为 JSON 字符串"""
+        scalar_types = (str, int, float, bool)
+        clean = {}
+        for key, value in (properties or {}).items():
+            if value is None or isinstance(value, scalar_types):
+                clean[key] = value
+            elif isinstance(value, (list, tuple)) and all(isinstance(v, scalar_types) for v in value):
+                clean[key] = list(value)
+            else:
+                clean[key] = json.dumps(value, ensure_ascii=False, default=str)
+        return clean
+
+    def build_named_nodes_statement(self, label: str, rows: List[Dict], task_id: int = None) -> Tuple[str, Dict]:
+        """构建按 (name, novel_id) 合并节点的 UNWIND 语句（Character / Location / Organization）
+
+        rows: [{'name': ..., 'novel_id': ..., 'properties': {...}}]
+        properties 中的 aliases（人物别称）与节点已有的别称合并，而不是覆盖。
+        """
+        for row in rows:
+            row['aliases'] = row['properties'].pop('aliases', None) or []
+        query = f"""
+        UNWIND $rows AS row
+        MERGE (n:{label} {{name: row.name, novel_id: row.novel_id}})
+        SET n += row.properties
+        SET n.created_at = datetime()
+        SET n.updated_at = datetime()
+        """
+        query += self._ALIASES_APPEND.format(v='n', aliases='row.aliases')
+        if task_id is not None:
+            query += self._TASK_ID_APPEND.format(v='n')
+        return query, {'rows': rows, 'task_id': task_id}
+
+    def build_events_statement(self, rows: List[Dict], task_id: int = None) -> Tuple[str, Dict]:
+        """构建批量合并事件节点的 UNWIND 语句，章节号按涉及的章节一次性查询
+
+        rows: [{'event_id': ..., 'name': ..., 'chapter_id': ..., 'novel_id': ..., 'properties': {...}}]
+        """
+        chapter_numbers = self._get_chapter_numbers({row['chapter_id'] for row in rows})
+        for row in rows:
+            row['chapter_number'] = chapter_numbers.get(row['chapter_id'])
+
+        query = """
+        UNWIND $rows AS row
+        MERGE (e:Event {id: row.event_id})
+        SET e.name = row.name
+        SET e.chapter_id = row.chapter_id
+        SET e.chapter_number = row.chapter_number
+        SET e.novel_id = row.novel_id
+        SET e += row.properties
+        SET e.created_at = datetime()
+        SET e.updated_at = datetime()
+        """
+        if task_id is not None:
+            query += self._TASK_ID_APPEND.format(v='e')
+        return query, {'rows': rows, 'task_id': task_id}
+
+    @staticmethod
+    def build_relationships_statement(from_label: str, from_property: str,
+                                      to_label: str, to_property: str,
+                                      relationship_type: str, rows: List[Dict]) -> Tuple[str, Dict]:
+        """构建批量创建关系的 UNWIND 语句（MERGE 关系并合并属性，与 create_relationship 相同）
+
+        按名称匹配的端点（人物 / 地点 / 组织）同时匹配 novel_id，命中 (name, novel_id) 唯一约束索引，
+        也不会连到其他小说的同名节点。
+        标签与关系类型须在 BATCH_NODE_LABELS / BATCH_RELATIONSHIP_TYPES 白名单内，否则抛出 ValueError。
+        rows: [{'from': ..., 'to': ..., 'novel_id': ..., 'properties': {...}}]
+        """
+        query = _relationship_query(from_label, from_property, to_label, to_property, relationship_type)
+        return query, {'rows': rows}
+
+    @staticmethod
+    def build_character_appearances_statement(rows: List[Dict]) -> Tuple[str, Dict]:
+        """构建批量创建“人物出现在章节”关系的 UNWIND 语句
+
+        人物按 (name, novel_id) 匹配，命中唯一约束索引，且不会连到其他小说的同名人物。
+        rows: [{'name': ..., 'novel_id': ..., 'chapter_id': ...}]
+        """
+        query = """
+        UNWIND $rows AS row
+        MATCH (c:Character {name: row.name, novel_id: row.novel_id})
+        MATCH (ch:Chapter {id: row.chapter_id})
+        MERGE (c)-[r:APPEARS_IN]->(ch)
+        SET r.novel_id = row.novel_id
+        SET r.created_at = datetime()
+        """
+        return query, {'rows': rows}
+
+    def execute_write_batch(self, statements: List[Tuple[str, Dict]]) -> int:
+        """在单个写事务中依次执行多条语句（全部成功或全部回滚），返回执行的语句数"""
+        statements = [(query, params) for query, params in statements if params.get('rows')]
+        if not statements:
+            return 0
+
+        def _write_batch(tx):
+            for query, params in statements:
+                tx.run(query, **params).consume()
+
+        def _execute_write_batch_operation():
+            with self.driver.session() as session:
+                session.execute_write(_write_batch)
+            return len(statements)
+
+        return self._execute_with_retry(_execute_write_batch_operation)
+
+    @staticmethod
+    def _get_chapter_numbers(chapter_ids) -> Dict[int, Any]:
+        """批量查询章节号，失败时返回空字典（章节号置空，不影响写入）"""
+        chapter_ids = [cid for cid in chapter_ids if cid is not None]
+        if not chapter_ids:
+            return {}
+        from ..models.database import db_manager
+        from sqlalchemy import text as sql_text, bindparam
+
+        with db_manager.get_session() as db_session:
+            try:
+                stmt = sql_text("SELECT id, chapter_number FROM chapters WHERE id IN :chapter_ids").bindparams(
+                    bindparam('chapter_ids', expanding=True)
+                )
+                return {row[0]: row[1] for row in db_session.execute(stmt, {"chapter_ids": chapter_ids})}
+            except Exception as e:
+                db_session.rollback()
+                logger.warning(f"批量查询章节号失败 (chapter_ids={chapter_ids}): {e}")
+                return {}
+
     # === 查询方法 ===
 
     def get_character_by_name(self, name: str, novel_id: int = None) -> Optional[Dict]:
@@ -491,6 +675,14 @@ class KnowledgeGraphService:
             result = session.run(query, novel_id=novel_id)
             return [dict(record['c']) for record in result]
 
+    def get_character_names_by_novel(self, novel_id: int) -> List[str]:
+        """获取小说中所有人物的名称"""
+        query = "MATCH (c:Character {novel_id: $novel_id}) RETURN c.name AS name"
+
+        with self.driver.session() as session:
+            result = session.run(query, novel_id=novel_id)
+            return [record['name'] for record in result if record['name']]
+
     def get_events_by_chapter(self, chapter_id: int) -> List[Dict]:
         """获取章节中的所有事件"""
         query = "MATCH (e:Event {chapter_id: $chapter_id}) RETURN e ORDER BY e.name"
@@ -129,6 +129,36 @@ class KnowledgeGraphTaskService:
                 logger.error(f"获取任务信息失败: {e}")
                 return None
 
+    def get_task_progress(self, task_id: int) -> Optional[Dict]:
+        """获取任务状态与进度计数（只查询任务表的一行，供章节循环中频繁调用）
+
+        get_task 会额外加载该任务全部章节状态做统计，随章节数线性增长，进度推送与暂停检查不需要这些数据。
+        """
+        with db_manager.get_session() as session:
+            try:
+                row = session.query(
+                    KnowledgeGraphTask.status,
+                    KnowledgeGraphTask.total_chapters,
+                    KnowledgeGraphTask.completed_chapters,
+                    KnowledgeGraphTask.failed_chapters,
+                    KnowledgeGraphTask.updated_at
+                ).filter(KnowledgeGraphTask.id == task_id).first()
+                if not row:
+                    return None
+
+                return {
+                    'task_id': task_id,
+                    'status': row.status,
+                    'total_chapters': row.total_chapters,
+                    'completed_chapters': row.completed_chapters,
+                    'failed_chapters': row.failed_chapters,
+                    'updated_at': row.updated_at.isoformat() if row.updated_at else None
+                }
+
+            except Exception as e:
+                logger.error(f"获取任务进度失败: {e}")
+                return None
+
     def get_pending_chapters(self, task_id: int) -> List[int]:
         """获取待处理的章节ID列表"""
         with db_manager.get_session() as session:
@@ -6,11 +6,42 @@ import redis
 import json
 import logging
 import os
+import time
 from typing import Optional, List, Dict, Any
 from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
+# 可选依赖：orjson 序列化/反序列化比标准库 json 快数倍，未安装时回退
+# 滚动发布等需要与旧版本行为完全一致时，可通过 REDIS_USE_ORJSON=false 强制使用标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+if os.environ.get('REDIS_USE_ORJSON', 'true').strip().lower() in ('0', 'false', 'no', 'off'):
+    orjson = None
+
+# is_connected() 成功 PING 的缓存窗口（秒），避免每次操作前都额外一次往返
+_PING_CACHE_SECONDS = 5.0
+
+
+def json_dumps(value: Any):
+    """序列化为 JSON（优先 orjson，返回 bytes；否则返回 str），redis 均可直接写入"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # orjson 不支持的类型（如超出 64 位的整数、非 str 键）回退标准库
+            pass
+    return json.dumps(value, ensure_ascii=False)
+
+
+def json_loads(value: Any) -> Any:
+    """反序列化 JSON（优先 orjson；orjson.JSONDecodeError 是 json.JSONDecodeError 的子类）"""
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
 
 class RedisClient:
     """Redis客户端管理类"""
@@ -40,6 +71,10 @@ class RedisClient:
         port = port or int(os.environ.get('REDIS_PORT', '6379'))
         password = password or os.environ.get('REDIS_PASSWORD', '')
         db = db if db is not None else int(os.environ.get('REDIS_DB', '0'))
+        # 各连接池上限（连接按需创建，这里只是上限）；Worker 子进程会设置较小的值
+        pool_size = int(os.environ.get('REDIS_POOL_MAX_CONNECTIONS', '50'))
+        pubsub_pool_size = int(os.environ.get('REDIS_PUBSUB_POOL_MAX_CONNECTIONS', '10'))
+        blpop_pool_size = int(os.environ.get('REDIS_BLOCKING_POOL_MAX_CONNECTIONS', '20'))
 
         try:
             # 创建连接池（供普通操作使用）
@@ -51,7 +86,7 @@ class RedisClient:
                 decode_responses=decode_responses,
                 socket_connect_timeout=5,
                 socket_timeout=30,  # 普通操作 30 秒超时（支持超大章节推送）
-                max_connections=50  # 连接池最大连接数
+                max_connections=pool_size  # 连接池最大连接数
             )
 
             # 创建 pubsub 专用连接池（使用更长超时）
@@ -63,7 +98,7 @@ class RedisClient:
                 decode_responses=decode_responses,
                 socket_connect_timeout=5,
                 socket_timeout=60,  # pubsub 60 秒超时，避免频繁重连
-                max_connections=10  # pubsub 连接数较少
+                max_connections=pubsub_pool_size  # pubsub 连接数较少
             )
 
             # 创建 BLPOP 专用连接池（使用更长超时，避免队列空闲时超时）
@@ -75,17 +110,21 @@ class RedisClient:
                 decode_responses=decode_responses,
                 socket_connect_timeout=5,
                 socket_timeout=300,  # BLPOP 300 秒（5分钟）超时，适应长时间空队列
-                max_connections=20  # BLPOP 连接数中等
+                max_connections=blpop_pool_size  # BLPOP 连接数中等
             )
 
             self.client = redis.Redis(connection_pool=self.pool)
+            # 阻塞命令（BLPOP/BRPOP）专用客户端，长期复用，不占用普通连接池
+            self.blocking_client = redis.Redis(connection_pool=self.blpop_pool)
 
             # 测试连接
             self.client.ping()
-            logger.info(f"Redis连接成功: {host}:{port} (db={db}, pool_size=50, pubsub_pool_size=10, blpop_pool_size=20)")
+            self._last_ping_ok = time.monotonic()
+            logger.info(f"Redis连接成功: {host}:{port} (db={db}, pool_size={pool_size}, pubsub_pool_size={pubsub_pool_size}, blpop_pool_size={blpop_pool_size})")
         except Exception as e:
             logger.error(f"Redis连接失败: {e}")
             self.client = None
+            self.blocking_client = None
             self.pool = None
             self.pubsub_pool = None
             self.blpop_pool = None
@@ -94,10 +133,15 @@ class RedisClient:
         """检查Redis是否连接"""
         if not self.client:
             return False
+        # 最近一次 PING 成功则直接认为可用；连接真断开时具体操作会抛异常并被各方法捕获
+        if time.monotonic() - getattr(self, '_last_ping_ok', 0.0) < _PING_CACHE_SECONDS:
+            return True
         try:
             self.client.ping()
+            self._last_ping_ok = time.monotonic()
             return True
         except:
+            self._last_ping_ok = 0.0
             return False
 
     def set(
@@ -259,21 +303,19 @@ class RedisClient:
         for attempt in range(max_retries):
             try:
                 # 使用 BLPOP 专用连接池（300秒超时）
-                blpop_client = redis.Redis(connection_pool=self.blpop_pool)
-                result = blpop_client.blpop(key, timeout=timeout)
+                result = self.blocking_client.blpop(key, timeout=timeout)
 
                 if result is None:
                     return None
 
                 # result 是 tuple: (key, value)
                 key_name, value = result
-                return json.loads(value)
+                return json_loads(value)
 
             except (redis.exceptions.TimeoutError, redis.exceptions.ConnectionError) as e:
                 if attempt < max_retries - 1:
                     logger.warning(f"Redis blpop 连接超时 ({key}), 第 {attempt + 1}/{max_retries} 次重试: {e}")
                     # 短暂延迟后重试
-                    import time
                     time.sleep(0.5)
                     continue
                 else:
@@ -291,15 +333,15 @@ class RedisClient:
         return None
 
     def brpop(self, key: str, timeout: int = 0) -> Optional[Any]:
-        """从列表右侧阻塞弹出值（timeout=0表示永久阻塞）"""
+        """从列表右侧阻塞弹出值（timeout=0表示永久阻塞，使用阻塞专用连接池）"""
         if not self.is_connected():
             return None
         try:
-            result = self.client.brpop(key, timeout=timeout)
+            result = self.blocking_client.brpop(key, timeout=timeout)
             if result is None:
                 return None
             key_name, value = result
-            return json.loads(value)
+            return json_loads(value)
         except Exception as e:
             logger.error(f"Redis brpop失败 ({key}): {e}")
             return None
@@ -322,7 +364,7 @@ class RedisClient:
             value = self.client.lpop(key)
             if value is None:
                 return None
-            return json.loads(value)
+            return json_loads(value)
         except Exception as e:
             logger.error(f"Redis lpop失败 ({key}): {e}")
             return None
@@ -419,13 +461,46 @@ class RedisClient:
             logger.error(f"Redis hgetall失败 ({key}): {e}")
             return {}
 
-    def hmset(self, key: str, mapping: Dict[str, Any]) -> bool:
+    def hgetall_many(self, keys: List[str]) -> List[Dict[str, Any]]:
+        """
+        批量获取多个Hash的所有字段和值（一次 pipeline 往返）
+
+        Args:
+            keys: Hash键名列表
+
+        Returns:
+            与 keys 一一对应的字典列表（值自动解析JSON，不存在的键为空字典）
+        """
+        if not keys:
+            return []
+        if not self.is_connected():
+            return [{} for _ in keys]
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipeline.hgetall(key)
+            results = []
+            for data in pipeline.execute():
+                item = {}
+                for field, value in (data or {}).items():
+                    try:
+                        item[field] = json.loads(value)
+                    except:
+                        item[field] = value
+                results.append(item)
+            return results
+        except Exception as e:
+            logger.error(f"Redis hgetall_many失败 ({len(keys)} keys): {e}")
+            return [{} for _ in keys]
+
+    def hmset(self, key: str, mapping: Dict[str, Any], expire: Optional[int] = None) -> bool:
         """
         批量设置Hash字段
 
         Args:
             key: Hash键名
             mapping: 字段-值字典
+            expire: 过期时间（秒），与 HSET 在同一个 MULTI/EXEC 中发送（一次往返）
 
         Returns:
             是否成功
@@ -437,7 +512,13 @@ class RedisClient:
                 field: json.dumps(value, ensure_ascii=False)
                 for field, value in mapping.items()
             }
-            self.client.hset(key, mapping=json_mapping)
+            if expire:
+                pipeline = self.client.pipeline(transaction=True)
+                pipeline.hset(key, mapping=json_mapping)
+                pipeline.expire(key, expire)
+                pipeline.execute()
+            else:
+                self.client.hset(key, mapping=json_mapping)
             return True
         except Exception as e:
             logger.error(f"Redis hmset失败 ({key}): {e}")
@@ -548,8 +629,8 @@ class RedisClient:
         if not self.is_connected():
             return 0
         try:
-            json_message = json.dumps(message, ensure_ascii=False)
-            return self.client.publish(channel, json_message)
+            # 进度等高频消息走 orjson 序列化，订阅方仍按 JSON 解析
+            return self.client.publish(channel, json_dumps(message))
         except Exception as e:
             logger.error(f"Redis publish失败 ({channel}): {e}")
             return 0
@@ -606,3 +687,49 @@ def close_redis_client():
     if _redis_client:
         _redis_client.close()
         _redis_client = None
+
+
+# 全局异步Redis客户端实例（redis.asyncio，供异步调用方使用，如 FastAPI 端点）
+_async_redis_client = None
+
+
+def get_async_redis_client():
+    """获取 redis.asyncio 客户端单例
+
+    多个命令可在同一连接池上通过 asyncio.gather / pipeline 并发执行，
+    异步调用方无需再把每个 Redis 操作丢进线程池。
+
+    Returns:
+        redis.asyncio.Redis 实例，创建失败返回 None
+    """
+    global _async_redis_client
+    if _async_redis_client is None:
+        try:
+            import redis.asyncio as aioredis
+            _async_redis_client = aioredis.Redis(
+                host=os.environ.get('REDIS_HOST', 'localhost'),
+                port=int(os.environ.get('REDIS_PORT', '6379')),
+                password=os.environ.get('REDIS_PASSWORD', '') or None,
+                db=int(os.environ.get('REDIS_DB', '0')),
+                decode_responses=True,
+                socket_connect_timeout=5,
+                socket_timeout=30,
+                max_connections=20
+            )
+        except Exception as e:
+            logger.error(f"创建异步Redis客户端失败: {e}")
+            return None
+    return _async_redis_client
+
+
+async def close_async_redis_client():
+    """关闭异步Redis客户端"""
+    global _async_redis_client
+    if _async_redis_client is not None:
+        try:
+            # redis>=5.0.1 提供 aclose()，更早版本只有 close()
+            close = getattr(_async_redis_client, 'aclose', None) or _async_redis_client.close
+            await close()
+        except Exception as e:
+            logger.warning(f"关闭异步Redis客户端失败: {e}")
+        _async_redis_client = None
@@ -321,8 +321,7 @@ def main():
             print(f">>> [DEBUG] 节点信息: {node_info}")
             sys.stdout.flush()
 
-            redis_client.hmset(key, node_info)
-            redis_client.expire(key, 180)  # 3分钟过期
+            redis_client.hmset(key, node_info, expire=180)  # 3分钟过期（HSET + EXPIRE 一次往返）
 
             print(f">>> [DEBUG] Redis 写入成功！键 {key} 已设置，过期时间 180 秒")
             sys.stdout.flush()
@@ -365,8 +364,9 @@ def main():
         active_providers = list(stats['providers'].keys())
 
     if active_providers:
+        from src.services.kg_task_queue_service import get_queue_key
         for provider in active_providers:
-            queue_key = f"kg:ai_queue:{provider}"
+            queue_key = get_queue_key(provider)
             print(f"  • Provider: {provider}")
             print(f"    队列键: {queue_key}")
     else: